@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# =============================================================================
+# alert_correlator.py - 告警風暴聚合 (Storm Correlation)
+# =============================================================================
+# 用途：分布層交換器中斷時，下游每台設備都會觸發 "Device Down"。此模組在
+#       alert_glpi_daemon.py 中緩衝短時間視窗內的新告警，並依下列順序分組：
+#         1. 上游設備 (NetBox Cable 連線：多台告警設備共同連接的鄰居)
+#         2. Site (NetBox 設備所屬 Site)
+#         3. 同一 LibreNMS Location 內的告警規則 (無 NetBox 資料時)
+#       達到門檻的群組只開立一張 Parent 工單並列出受影響設備，
+#       其餘告警照原流程逐筆處理。
+#
+#       緩衝區在 ALERT_STORM_QUIET 秒內沒有新告警即送出，單筆孤立告警
+#       不必等滿整個視窗；持續湧入的風暴最長緩衝 ALERT_STORM_WINDOW 秒。
+#
+# 設定：
+#   ALERT_STORM_WINDOW     最長緩衝秒數 (預設 30，0 = 停用聚合)
+#   ALERT_STORM_QUIET      無新告警多少秒即送出 (預設 5)
+#   ALERT_STORM_MIN_GROUP  開立 Parent 工單的最少告警數 (預設 3)
+#   NETBOX_URL / NETBOX_TOKEN  選填，用於查詢 Site 與上游設備
+# =============================================================================
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = float(os.getenv('ALERT_STORM_WINDOW', '30'))
+DEFAULT_QUIET = float(os.getenv('ALERT_STORM_QUIET', '5'))
+DEFAULT_MIN_GROUP = int(os.getenv('ALERT_STORM_MIN_GROUP', '3'))
+TOPOLOGY_TTL = 600
+
+
+class NetBoxTopology:
+    """以 NetBox REST API 查詢設備的 Site 與 Cable 鄰居 (結果快取)。"""
+
+    def __init__(self, url, token, http=None, ttl=TOPOLOGY_TTL):
+        self.url = url.rstrip('/')
+        self.http = http or requests.Session()
+        self.http.headers.update({'Authorization': f'Token {token}', 'Accept': 'application/json'})
+        self.http.verify = False
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        url, token = os.getenv('NETBOX_URL'), os.getenv('NETBOX_TOKEN')
+        return cls(url, token) if url and token else None
+
+    def _get(self, path, **params):
+        resp = self.http.get(f"{self.url}/api/{path}", params=params, timeout=10)
+        resp.raise_for_status()
+        return resp.json().get('results', [])
+
+    def lookup(self, device):
+        """回傳 (site_slug, {鄰居設備名稱})；查無資料回傳 (None, set())。"""
+        key = device.lower()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit and time.time() - hit[0] < self.ttl:
+                return hit[1]
+
+        site, neighbors = None, set()
+        try:
+            devices = self._get('dcim/devices/', name=device)
+            if devices:
+                site = (devices[0].get('site') or {}).get('slug')
+                for iface in self._get('dcim/interfaces/', device_id=devices[0]['id'], cabled='true', limit=0):
+                    for peer in iface.get('link_peers') or iface.get('connected_endpoints') or []:
+                        peer_dev = (peer or {}).get('device') or {}
+                        if peer_dev.get('name'):
+                            neighbors.add(peer_dev['name'].lower())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"⚠ NetBox 拓樸查詢失敗 ({device}): {e}")
+
+        result = (site, neighbors)
+        with self._lock:
+            self._cache[key] = (time.time(), result)
+        return result
+
+
+def group_alerts(alerts, topology=None):
+    """將告警分組，回傳 {group_key: [alert, ...]}。
+
+    group_key 為 ('upstream', 設備) / ('site', slug) / ('rule', '規則 @ Location')；
+    規則分組僅限同一 Location (alert['site'])，避免不相關設備併入同一張工單。
+    無法判斷位置的告警以 ('single', 序號) 各自成組。
+    """
+    info = {}
+    for i, alert in enumerate(alerts):
+        device = (alert.get('device') or '').lower()
+        info[i] = topology.lookup(device) if (topology and device) else (None, set())
+
+    # 被多台告警設備共同連接的鄰居視為上游設備
+    devices = {(a.get('device') or '').lower() for a in alerts if a.get('device')}
+    uplink_votes = Counter(n for _, neighbors in info.values() for n in neighbors)
+
+    groups = defaultdict(list)
+    for i, alert in enumerate(alerts):
+        device = (alert.get('device') or '').lower()
+        site, neighbors = info[i]
+        candidates = [n for n in neighbors if uplink_votes[n] >= 2 or n in devices]
+        if device and device in uplink_votes and uplink_votes[device] >= 2:
+            key = ('upstream', device)  # 上游設備本身也在告警中
+        elif candidates:
+            upstream = max(candidates, key=lambda n: (uplink_votes[n], n))
+            key = ('upstream', upstream)
+        elif site:
+            key = ('site', site)
+        elif device and alert.get('site'):
+            key = ('rule', f"{(alert.get('rule') or '').lower()} @ {alert['site'].lower()}")
+        else:
+            key = ('single', i)
+        groups[key].append(alert)
+    return dict(groups)
+
+
+class StormCorrelator:
+    """在時間視窗內緩衝新告警，批次分組後交給 Daemon 處理。"""
+
+    def __init__(self, handle_group, handle_single, window=DEFAULT_WINDOW,
+                 min_group=DEFAULT_MIN_GROUP, topology=None, quiet=DEFAULT_QUIET):
+        self.handle_group = handle_group
+        self.handle_single = handle_single
+        self.window = window
+        self.quiet = quiet
+        self.min_group = min_group
+        self.topology = topology
+        self._buffer = []
+        self._last_arrival = 0.0
+        self._stormed = {}      # group_key -> 最近一次以 Parent 工單處理的時間
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def add(self, alert):
+        """加入緩衝區 (不阻塞)。"""
+        with self._cond:
+            self._buffer.append(alert)
+            self._last_arrival = time.monotonic()
+            self._cond.notify()
+
+    def cancel(self, fingerprint):
+        """恢復通知抵達時，移除仍在緩衝中的同一告警 (Fingerprint 相同)；有移除則回傳 True。"""
+        with self._cond:
+            before = len(self._buffer)
+            self._buffer = [a for a in self._buffer if a.get('_fingerprint') != fingerprint]
+            return len(self._buffer) != before
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._buffer:
+                    return
+                # 收集同一波風暴：quiet 秒內無新告警即送出，最長等待一個視窗
+                deadline = time.monotonic() + self.window
+                while not self._stopped:
+                    now = time.monotonic()
+                    until = min(deadline, self._last_arrival + self.quiet)
+                    if now >= until:
+                        break
+                    self._cond.wait(until - now)
+                batch, self._buffer = self._buffer, []
+            if batch:
+                self.flush(batch)
+
+    def flush(self, batch):
+        now = time.monotonic()
+        self._stormed = {k: t for k, t in self._stormed.items() if now - t < self.window}
+        groups = group_alerts(batch, self.topology)
+        for key, alerts in groups.items():
+            # 風暴的零星後續告警 (一個視窗內) 仍附加至同一張 Parent 工單
+            recent = key in self._stormed
+            if key[0] != 'single' and (len(alerts) >= self.min_group or recent):
+                logger.info(f"🌪 告警風暴聚合: {key[0]}={key[1]} 共 {len(alerts)} 筆")
+                try:
+                    self.handle_group(key, alerts)
+                    self._stormed[key] = now
+                    continue
+                except Exception as e:
+                    logger.error(f"❌ 聚合工單處理失敗 ({key}): {e}，改為逐筆處理")
+            for alert in alerts:
+                self.handle_single(alert)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='storm-correlator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
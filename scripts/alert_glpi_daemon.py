@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# =============================================================================
+# alert_glpi_daemon.py - LibreNMS → GLPI 告警常駐處理程序
+# =============================================================================
+# 用途：取代「每筆告警啟動一個 Python 行程」的模式。Daemon 常駐並維持：
+#   - 溫熱的 GLPI Session (glpi_session.py) 與連線池 (requests.Session)
+#   - 有上限的告警佇列與固定數量的 Worker (有界併發)
+# librenms_alert_glpi.py 只需透過 Unix Socket 傳入一行 JSON 即可返回。
+#
+# 協定：Client 送出 {"title": "...", "message": "...", "rule": ..., "device": ..., "faults": ...}\n
+#       Daemon 回覆 {"status": "queued"} 或 {"status": "busy"} (佇列已滿)
+#
+# 同一告警 (及其 Recovery) 以 alert_key 序列化處理，避免開單與結案互相競爭。
+# 新告警會先經過 alert_correlator.py 的時間視窗聚合，風暴只開立 Parent 工單。
+#
+# 用法：
+#   python3 alert_glpi_daemon.py [--socket PATH] [--workers N] [--queue-size N]
+# =============================================================================
+
+import os
+import json
+import queue
+import signal
+import logging
+import argparse
+import threading
+import socketserver
+import requests
+from requests.adapters import HTTPAdapter
+
+import librenms_alert_glpi as transport
+from alert_correlator import StormCorrelator, NetBoxTopology
+from utils import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv('ALERT_DAEMON_WORKERS', '4'))
+DEFAULT_QUEUE_SIZE = int(os.getenv('ALERT_DAEMON_QUEUE_SIZE', '1000'))
+
+
+class KeyedLocks:
+    """依鍵值取得互斥鎖，讓同一告警的事件依序處理。"""
+
+    def __init__(self):
+        self._locks = {}
+        self._refs = {}
+        self._guard = threading.Lock()
+
+    def acquire(self, key):
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+            self._refs[key] = self._refs.get(key, 0) + 1
+        lock.acquire()
+
+    def release(self, key):
+        with self._guard:
+            self._locks[key].release()
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+                del self._locks[key]
+
+
+class AlertDaemon:
+    """告警佇列 + Worker Pool。"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.locks = KeyedLocks()
+        self.threads = []
+
+        # 連線池大小與 Worker 數一致，避免連線互搶
+        http = requests.Session()
+        http.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=workers))
+        http.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=workers))
+        self.glpi = transport.init_session(http=http)
+        self.index = transport.open_index()
+
+        # 告警風暴聚合 (需本機索引才能將子告警的恢復對應回 Parent 工單)
+        self.storm_parents = {}
+        self.storm_lock = threading.Lock()
+        self.correlator = StormCorrelator(self._process_group, self._process_single,
+                                          topology=NetBoxTopology.from_env())
+        if not self.index:
+            self.correlator.window = 0
+
+    def submit(self, alert):
+        """將告警放入佇列 (不阻塞)；佇列已滿回傳 False。"""
+        try:
+            self.queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            return False
+
+    def _process_single(self, alert):
+        """聚合後未成群的告警，回到佇列逐筆處理。"""
+        alert['_correlated'] = True
+        self.queue.put(alert)
+
+    def _process_group(self, group, alerts):
+        """同一群組只開立 (或沿用) 一張 Parent 工單。"""
+        with self.storm_lock:
+            parent_id = transport.process_storm(group, alerts, self.glpi, self.index,
+                                                parent_id=self.storm_parents.get(group))
+            if parent_id:
+                self.storm_parents[group] = parent_id
+
+    def _correlate(self, alert):
+        """新告警進入聚合緩衝區；恢復通知若對應仍在緩衝中的告警則一併抵銷。
+
+        回傳 True 表示已由聚合流程接手，不需立即處理。
+        """
+        if alert.get('_correlated') or not self.correlator.enabled:
+            return False
+        fingerprint, _ = transport.alert_identity(alert)
+        if transport.is_recovery_title(alert['title']):
+            if self.correlator.cancel(fingerprint):
+                logger.info(f"ℹ 告警在聚合視窗內已恢復，略過: {alert['title']}")
+                return True
+            return False
+        alert['_fingerprint'] = fingerprint
+        self.correlator.add(alert)
+        return True
+
+    def _worker(self):
+        while True:
+            alert = self.queue.get()
+            if alert is None:
+                self.queue.task_done()
+                return
+            if self._correlate(alert):
+                self.queue.task_done()
+                continue
+            key = transport.alert_key(alert['title'])
+            self.locks.acquire(key)
+            try:
+                transport.process_alert(alert, self.glpi, self.index)
+            except Exception as e:
+                logger.error(f"❌ 告警處理失敗 ({alert['title']}): {e}")
+            finally:
+                self.locks.release(key)
+                self.queue.task_done()
+
+    def start(self):
+        if self.correlator.enabled:
+            self.correlator.start()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"alert-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        """停止接收後處理完剩餘告警 (含聚合緩衝區)。"""
+        self.queue.join()
+        self.correlator.stop()
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+
+
+class AlertRequestHandler(socketserver.StreamRequestHandler):
+    """讀取一行 JSON 告警並立即回覆。"""
+
+    def handle(self):
+        try:
+            alert = json.loads(self.rfile.readline())
+            if not isinstance(alert, dict) or not alert.get('title'):
+                raise ValueError("missing title")
+        except ValueError as e:
+            self._reply({'status': 'error', 'message': str(e)})
+            return
+
+        if self.server.alert_daemon.submit(alert):
+            self._reply({'status': 'queued', 'depth': self.server.alert_daemon.queue.qsize()})
+        else:
+            logger.warning(f"⚠ 告警佇列已滿，拒絕: {alert['title']}")
+            self._reply({'status': 'busy'})
+
+    def _reply(self, data):
+        self.wfile.write(json.dumps(data).encode() + b"\n")
+
+
+class AlertServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, alert_daemon):
+        self.alert_daemon = alert_daemon
+        super().__init__(path, AlertRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LibreNMS → GLPI Alert Transport Daemon')
+    parser.add_argument('--socket', default=transport.ALERT_DAEMON_SOCKET, help="Unix Socket 路徑")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="同時處理的告警數上限")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="佇列上限")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    daemon = AlertDaemon(workers=args.workers, queue_size=args.queue_size)
+    daemon.start()
+    server = AlertServer(args.socket, daemon)
+    os.chmod(args.socket, 0o660)
+
+    def shutdown(signum, frame):
+        logger.info("收到停止訊號，處理剩餘告警後結束...")
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    logger.info(f"🚀 Alert Daemon 啟動: {args.socket} (workers={args.workers}, queue={args.queue_size})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        daemon.stop()
+        logger.info("<<< Alert Daemon 已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# =============================================================================
+# alert_index.py - 告警 → GLPI 工單的本機索引 (SQLite)
+# =============================================================================
+# 用途：取代每次告警/恢復都對 GLPI 執行 Title contains 搜尋。
+#   - 告警以 (rule, device, faults) 計算確定性的 Fingerprint。
+#   - 開單時寫入 Fingerprint → Ticket ID；結案時清除。
+#   - 去重與自動結案改為本機鍵值查詢，僅在索引未命中時才搜尋 GLPI。
+#
+# 恢復通知的 faults 可能與原告警不同，因此另存 base (rule, device) 雜湊，
+# 恢復時若完整 Fingerprint 未命中，會再以 base 查詢。
+#
+# 工單可能在 GLPI 被人工結案，索引本身不會得知；呼叫端命中索引後仍需確認
+# 工單狀態。超過 ALERT_INDEX_TTL (預設 7 天) 未更新的紀錄視為過期，
+# 作為最後防線，避免殘留紀錄永久吃掉後續告警。
+# =============================================================================
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_INDEX_DB = '/var/lib/it_nexus/alert_index.db'
+DEFAULT_INDEX_TTL = 7 * 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_tickets (
+    fingerprint TEXT PRIMARY KEY,
+    base        TEXT NOT NULL,
+    ticket_id   INTEGER NOT NULL,
+    state       TEXT NOT NULL DEFAULT 'open',
+    title       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alert_tickets_base ON alert_tickets(base);
+CREATE INDEX IF NOT EXISTS idx_alert_tickets_ticket ON alert_tickets(ticket_id);
+"""
+
+
+def _normalize_faults(faults):
+    """將 faults (JSON 字串 / 逗號分隔字串 / list) 正規化為排序後的 tuple。"""
+    if not faults:
+        return ()
+    if isinstance(faults, str):
+        try:
+            faults = json.loads(faults)
+        except ValueError:
+            faults = faults.split(',')
+    if not isinstance(faults, (list, tuple)):
+        faults = [faults]
+    items = set()
+    for f in faults:
+        if isinstance(f, dict):
+            f = json.dumps(f, sort_keys=True, ensure_ascii=False)
+        f = str(f).strip()
+        if f:
+            items.add(f)
+    return tuple(sorted(items))
+
+
+def _digest(*parts):
+    return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def alert_base(rule, device):
+    """(rule, device) 的雜湊，不含 faults。"""
+    return _digest((rule or '').strip().lower(), (device or '').strip().lower())
+
+
+def alert_fingerprint(rule, device, faults=None):
+    """計算確定性的告警 Fingerprint。"""
+    return _digest(alert_base(rule, device), *_normalize_faults(faults))
+
+
+class AlertIndex:
+    """Fingerprint → GLPI Ticket 的持久化索引 (執行緒安全)。"""
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or os.getenv('ALERT_INDEX_DB', DEFAULT_INDEX_DB)
+        self.ttl = float(ttl if ttl is not None else os.getenv('ALERT_INDEX_TTL', DEFAULT_INDEX_TTL))
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self.prune()
+
+    def _cutoff(self):
+        """早於此時間 (updated_at) 的紀錄視為過期；ttl <= 0 表示不過期。"""
+        return time.time() - self.ttl if self.ttl > 0 else 0
+
+    def lookup(self, fingerprint):
+        """以 Fingerprint 查詢未結工單，未命中回傳 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM alert_tickets WHERE fingerprint = ? AND state = 'open' AND updated_at >= ?",
+                (fingerprint, self._cutoff()),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def lookup_base(self, base):
+        """以 (rule, device) 查詢所有未結工單。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM alert_tickets WHERE base = ? AND state = 'open' AND updated_at >= ?",
+                (base, self._cutoff()),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def record(self, fingerprint, base, ticket_id, title=None):
+        """記錄 (或覆寫) 告警對應的工單。"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO alert_tickets (fingerprint, base, ticket_id, state, title, created_at, updated_at)
+                   VALUES (?, ?, ?, 'open', ?, ?, ?)
+                   ON CONFLICT(fingerprint) DO UPDATE SET
+                       ticket_id = excluded.ticket_id, state = 'open',
+                       title = excluded.title, updated_at = excluded.updated_at""",
+                (fingerprint, base, int(ticket_id), title, now, now),
+            )
+
+    def open_count(self, ticket_id):
+        """工單仍對應的未結告警數 (聚合工單需全部恢復才結案)。"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM alert_tickets WHERE ticket_id = ? AND state = 'open' AND updated_at >= ?",
+                (int(ticket_id), self._cutoff()),
+            ).fetchone()[0]
+
+    def clear(self, fingerprint):
+        """工單結案後移除索引。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM alert_tickets WHERE fingerprint = ?", (fingerprint,))
+
+    def clear_ticket(self, ticket_id):
+        """移除指向某工單的所有紀錄 (工單已在 GLPI 結案或刪除)。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM alert_tickets WHERE ticket_id = ?", (int(ticket_id),))
+
+    def prune(self):
+        """刪除過期紀錄，回傳刪除筆數。"""
+        if self.ttl <= 0:
+            return 0
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM alert_tickets WHERE updated_at < ?", (self._cutoff(),)
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# =============================================================================
+# change_feed.py - 設備變更事件流 (Append-only JSONL + Consumer Offset)
+# =============================================================================
+# 用途：sync_librenms_to_netbox.py 每次實際寫入 NetBox 的變更 (建立設備、
+#       Site/Status/Role/Type/Platform/Serial/Description 變動) 以結構化事件
+#       記錄，下游 (GLPI 同步、通知) 從自己保存的 Offset 接續讀取，
+#       不需重新掃描 NetBox。
+#
+#   事件：{"seq", "ts", "run_id", "source", "action", "device", "device_id",
+#          "field", "old", "new"}
+#   - seq 全域遞增；檔案依第一筆 seq 命名 (changes-000000000001.jsonl)，
+#     超過 CHANGE_FEED_SEGMENT_MB 換新檔，只保留最近 CHANGE_FEED_SEGMENTS 個。
+#   - 多個行程 (Timer、Webhook、管線) 以 fcntl 鎖序列化寫入。
+#   - Consumer Offset 存於 offsets/<name>，處理成功後才 commit (At-least-once)。
+#
+# 設定：
+#   CHANGE_FEED_DIR         預設 /var/lib/it_nexus/change_feed
+#   CHANGE_FEED_SEGMENT_MB  單檔上限 (預設 16)
+#   CHANGE_FEED_SEGMENTS    保留檔案數 (預設 20)
+#
+# 用法：
+#   python3 change_feed.py status
+#   python3 change_feed.py tail [--consumer NAME] [--limit N] [--follow] [--commit]
+# =============================================================================
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import socket
+import uuid
+import argparse
+import contextlib
+
+DEFAULT_FEED_DIR = '/var/lib/it_nexus/change_feed'
+SEGMENT_BYTES = int(float(os.getenv('CHANGE_FEED_SEGMENT_MB', '16')) * 1024 * 1024)
+KEEP_SEGMENTS = int(os.getenv('CHANGE_FEED_SEGMENTS', '20'))
+
+SEGMENT_RE = re.compile(r'^changes-(\d{12})\.jsonl$')
+TAIL_CHUNK = 64 * 1024
+
+
+def new_run_id():
+    """同步批次識別碼 (主機 + 時間 + 隨機碼)。"""
+    return f"{socket.gethostname()}-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def change_event(device, field, old, new, action='update', device_id=None):
+    """建立一筆變更事件 (seq/ts/run_id/source 於寫入時補上)。"""
+    return {'action': action, 'device': device, 'device_id': device_id,
+            'field': field, 'old': old, 'new': new}
+
+
+class ChangeFeed:
+    """變更事件流 (寫入端與讀取端共用)。"""
+
+    def __init__(self, directory=None, segment_bytes=SEGMENT_BYTES, keep_segments=KEEP_SEGMENTS):
+        self.directory = directory or os.getenv('CHANGE_FEED_DIR', DEFAULT_FEED_DIR)
+        self.segment_bytes = segment_bytes
+        self.keep_segments = max(1, keep_segments)
+        os.makedirs(os.path.join(self.directory, 'offsets'), exist_ok=True)
+
+    # --- 檔案 ---
+    def segments(self):
+        """[(第一筆 seq, 路徑)]，依 seq 排序。"""
+        found = []
+        for name in os.listdir(self.directory):
+            m = SEGMENT_RE.match(name)
+            if m:
+                found.append((int(m.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _segment_path(self, first_seq):
+        return os.path.join(self.directory, f"changes-{first_seq:012d}.jsonl")
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        fd = os.open(os.path.join(self.directory, 'feed.lock'), os.O_RDWR | os.O_CREAT, 0o664)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _last_seq(path):
+        """讀取檔案最後一筆完整事件的 seq (只讀檔尾)。"""
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            chunk = TAIL_CHUNK
+            while True:
+                f.seek(max(0, size - chunk))
+                lines = f.read().split(b'\n')
+                # 最後一個元素是換行後的空字串或寫到一半的資料
+                complete = [l for l in lines[:-1] if l.strip()]
+                if chunk >= size or len(complete) > 1:
+                    break
+                chunk *= 4
+        for line in reversed(complete):
+            try:
+                return json.loads(line)['seq']
+            except (ValueError, KeyError):
+                continue
+        return None
+
+    # --- 寫入 ---
+    def append(self, events, run_id=None, source=None):
+        """寫入多筆事件 (同一批次同一個檔案)，回傳最後一筆 seq。"""
+        if not events:
+            return None
+        with self._write_lock():
+            segments = self.segments()
+            last_seq = 0
+            path = None
+            if segments:
+                first, path = segments[-1]
+                last_seq = self._last_seq(path) or first - 1
+                if os.path.getsize(path) >= self.segment_bytes:
+                    path = None
+            if path is None:
+                path = self._segment_path(last_seq + 1)
+
+            ts = time.time()
+            lines = []
+            for ev in events:
+                last_seq += 1
+                record = {'seq': last_seq, 'ts': ts, 'run_id': run_id, 'source': source}
+                record.update(ev)
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            data = '\n'.join(lines) + '\n'
+            if os.path.exists(path) and not self._ends_with_newline(path):
+                data = '\n' + data  # 前次寫入中斷留下的半行，另起一行
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._prune()
+        return last_seq
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _prune(self):
+        segments = self.segments()
+        for _, path in segments[:-self.keep_segments]:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    # --- 讀取 ---
+    def read(self, after=0, limit=1000):
+        """讀取 seq > after 的事件 (最多 limit 筆)。"""
+        segments = self.segments()
+        start = 0
+        for i, (first, _) in enumerate(segments):
+            if first <= after + 1:
+                start = i
+        events = []
+        for _, path in segments[start:]:
+            try:
+                f = open(path, encoding='utf-8')
+            except FileNotFoundError:
+                continue  # 剛被輪替刪除
+            with f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break  # 寫入中的最後一行
+                    try:
+                        ev = json.loads(line)
+                    except ValueError:
+                        continue  # 中斷寫入留下的半行
+                    if ev['seq'] <= after:
+                        continue
+                    events.append(ev)
+                    if len(events) >= limit:
+                        return events
+        return events
+
+    def head(self):
+        """最新一筆事件的 seq (無事件回傳 0)。"""
+        segments = self.segments()
+        if not segments:
+            return 0
+        return self._last_seq(segments[-1][1]) or segments[-1][0] - 1
+
+    # --- Consumer Offset ---
+    def _offset_path(self, consumer):
+        return os.path.join(self.directory, 'offsets', consumer)
+
+    def offset(self, consumer):
+        try:
+            with open(self._offset_path(consumer)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, consumer, seq):
+        """保存 Consumer 已處理到的 seq (原子寫入)。"""
+        path = self._offset_path(consumer)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(f"{seq}\n")
+        os.replace(tmp, path)
+
+    def consume(self, consumer, limit=1000):
+        """從 Consumer 的 Offset 接續讀取；處理完成後呼叫 commit(consumer, events[-1]['seq'])。"""
+        after = self.offset(consumer)
+        events = self.read(after, limit)
+        _warn_gap(consumer, after, events)
+        return events
+
+
+def _warn_gap(consumer, after, events):
+    # Offset 之後的檔案已被輪替刪除 (Consumer 落後太多)
+    if events and events[0]['seq'] > after + 1:
+        print(f"⚠ {consumer}: seq {after + 1}~{events[0]['seq'] - 1} 已被輪替刪除", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Device Change Feed')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="顯示最新 seq、檔案數與各 Consumer Offset")
+    tail = sub.add_parser('tail', help="輸出事件 (JSONL)")
+    tail.add_argument('--consumer', help="從此 Consumer 的 Offset 接續 (未指定則由 --after 起)")
+    tail.add_argument('--after', type=int, default=0)
+    tail.add_argument('--limit', type=int, default=1000)
+    tail.add_argument('--follow', action='store_true', help="持續等待新事件")
+    tail.add_argument('--commit', action='store_true', help="輸出後更新 Consumer Offset")
+    args = parser.parse_args()
+
+    feed = ChangeFeed()
+    if args.command == 'status':
+        offsets = {name: feed.offset(name) for name in sorted(os.listdir(os.path.join(feed.directory, 'offsets')))
+                   if not name.endswith('.tmp')}
+        print(json.dumps({'head': feed.head(), 'segments': len(feed.segments()), 'offsets': offsets}, indent=2))
+        return
+
+    after = feed.offset(args.consumer) if args.consumer else args.after
+    while True:
+        events = feed.read(after, args.limit)
+        _warn_gap(args.consumer or 'tail', after, events)
+        for ev in events:
+            print(json.dumps(ev, ensure_ascii=False), flush=True)
+        if events:
+            after = events[-1]['seq']
+            if args.consumer and args.commit:
+                feed.commit(args.consumer, after)
+        if not args.follow:
+            break
+        if not events:
+            time.sleep(1)
+
+if __name__ == "__main__":
+    sys.exit(main())
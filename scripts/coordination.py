@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# =============================================================================
+# coordination.py - 同步行程間的協調 (全域執行鎖 + 設備租約)
+# =============================================================================
+# 用途：netbox-sync-librenms.timer、netbox-sync-interfaces.timer 與 Webhook
+#       觸發的單台同步可能同時處理同一台設備，造成重複工作與競爭
+#       (例如同一介面或 VLAN 被建立兩次)。
+#   - run_lock(name)：fcntl 檔案鎖，全量同步同時只允許一個。
+#   - DeviceLeases：以 SQLite 記錄設備租約 (LibreNMS device_id)，同一設備
+#     同時只會有一個行程在寫入；並記錄每台設備最近一次同步的開始時間，
+#     Webhook 可據此略過「告警之後已同步過」的設備。
+#     租約屬於取得它的執行緒 (Webhook Receiver 的多個 Worker 互斥)，持有期間
+#     由背景執行緒每 TTL/3 秒續約，長時間同步不會被他人接手。
+#
+# 設定：
+#   COORD_DIR        鎖檔與資料庫目錄 (預設 /var/lib/it_nexus)
+#   COORD_LEASE_TTL  租約逾時秒數 (預設 900；持有者當機時由他人接手)
+# =============================================================================
+
+import os
+import time
+import fcntl
+import errno
+import socket
+import sqlite3
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+COORD_DIR = os.getenv('COORD_DIR', '/var/lib/it_nexus')
+LEASE_TTL = int(os.getenv('COORD_LEASE_TTL', '900'))
+POLL_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    device      TEXT PRIMARY KEY,
+    owner       TEXT NOT NULL,
+    host        TEXT NOT NULL,
+    pid         INTEGER NOT NULL,
+    thread      INTEGER NOT NULL DEFAULT 0,
+    acquired_at REAL NOT NULL,
+    expires_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS completions (
+    device      TEXT PRIMARY KEY,
+    owner       TEXT NOT NULL,
+    started_at  REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+class RunLockBusy(Exception):
+    """全域執行鎖已被其他行程持有。"""
+
+
+@contextlib.contextmanager
+def run_lock(name, wait=0, directory=None):
+    """取得全域執行鎖 (fcntl)；wait 秒內無法取得則拋出 RunLockBusy。
+
+    行程結束時鎖自動釋放，不會因當機殘留。
+    """
+    directory = directory or COORD_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.lock")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o664)
+    deadline = time.monotonic() + wait
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                if time.monotonic() >= deadline:
+                    raise RunLockBusy(name)
+                time.sleep(POLL_INTERVAL)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        yield
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DeviceLeases:
+    """設備租約與最近同步紀錄 (多行程共用同一個 SQLite)。"""
+
+    def __init__(self, owner, path=None, ttl=LEASE_TTL):
+        self.owner = owner
+        self.path = path or os.getenv('COORD_DB', os.path.join(COORD_DIR, 'coordination.db'))
+        self.ttl = ttl
+        self.host = socket.gethostname()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        try:
+            # 舊版資料庫沒有 thread 欄位
+            self._conn.execute("ALTER TABLE leases ADD COLUMN thread INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        self._lock = threading.Lock()
+        self._held = set()          # 本實例持有的租約 (device, thread)
+        self._closed = threading.Event()
+        self._renewer = None
+
+    @staticmethod
+    def key(device):
+        return str(device).strip().lower()
+
+    def _stale(self, row, now):
+        if row['expires_at'] < now:
+            return True
+        # 同一主機上的持有行程已結束 (當機或被 kill)
+        return row['host'] == self.host and not _pid_alive(row['pid'])
+
+    def _try_acquire(self, device):
+        now = time.time()
+        thread = threading.get_ident()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute("SELECT * FROM leases WHERE device = ?", (device,)).fetchone()
+                # 同一行程的其他執行緒也視為他人 (Receiver 多個 Worker 不可同時寫入同一設備)
+                mine = row and row['owner'] == self.owner and row['pid'] == os.getpid() and \
+                    row['host'] == self.host and row['thread'] == thread
+                if row and not mine and not self._stale(row, now):
+                    self._conn.execute('COMMIT')
+                    return False, dict(row)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (device, owner, host, pid, thread, acquired_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (device, self.owner, self.host, os.getpid(), thread, now, now + self.ttl),
+                )
+                self._conn.execute('COMMIT')
+                self._held.add((device, thread))
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        self._start_renewer()
+        return True, None
+
+    def _start_renewer(self):
+        with self._lock:
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name='lease-renewer', daemon=True)
+                self._renewer.start()
+
+    def _renew_loop(self):
+        while not self._closed.wait(max(self.ttl / 3, POLL_INTERVAL)):
+            try:
+                self.renew()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠ 設備租約續約失敗: {e}")
+
+    def renew(self):
+        """延長本實例持有的所有租約，回傳續約筆數。"""
+        with self._lock:
+            if self._closed.is_set() or not self._held:
+                return 0
+            expires_at = time.time() + self.ttl
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                renewed = sum(self._conn.execute(
+                    "UPDATE leases SET expires_at = ? WHERE device = ? AND owner = ? AND pid = ? AND thread = ?",
+                    (expires_at, device, self.owner, os.getpid(), thread),
+                ).rowcount for device, thread in self._held)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return renewed
+
+    def acquire(self, device, wait=0):
+        """取得設備租約；wait 秒內無法取得回傳 False。"""
+        device = self.key(device)
+        deadline = time.monotonic() + wait
+        while True:
+            ok, holder = self._try_acquire(device)
+            if ok:
+                return True
+            if time.monotonic() >= deadline:
+                logger.info(f"  ⏭ 設備 {device} 由 {holder['owner']} (pid {holder['pid']}) 同步中")
+                return False
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, device, started_at=None, aliases=()):
+        """釋放租約；started_at 不為 None 時記錄一次成功的同步 (含別名，例如 hostname/sysName)。"""
+        device = self.key(device)
+        thread = threading.get_ident()
+        now = time.time()
+        with self._lock:
+            self._held.discard((device, thread))
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute("DELETE FROM leases WHERE device = ? AND owner = ? AND pid = ? AND thread = ?",
+                                   (device, self.owner, os.getpid(), thread))
+                if started_at is not None:
+                    keys = {device} | {self.key(a) for a in aliases if a}
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO completions (device, owner, started_at, finished_at) VALUES (?, ?, ?, ?)",
+                        [(k, self.owner, started_at, now) for k in keys],
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def synced_since(self, device, since):
+        """該設備 (或別名) 是否有在 since 之後才開始、且已完成的同步。"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM completions WHERE device = ?", (self.key(device),)).fetchone()
+        return dict(row) if row and row['started_at'] >= since else None
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# =============================================================================
+# event_store.py - Webhook 事件持久化佇列 (SQLite WAL)
+# =============================================================================
+# 用途：webhook_receiver.py 收到的事件在回應 202 之前先寫入本機 SQLite，
+#       Receiver 重啟或當機時不遺失。
+#   - At-least-once：同步成功才標記 done；啟動時重播所有未完成的事件。
+#   - 失敗重試超過 EVENT_MAX_ATTEMPTS 次移入 dead_events (Dead Letter)。
+#   - Group Commit：寫入由單一 Writer Thread 批次提交，前一次 commit 期間
+#     累積的事件合併為同一個 Transaction，告警風暴時不會成為瓶頸。
+#
+# 設定：
+#   EVENT_STORE_DB              預設 /var/lib/it_nexus/webhook_events.db
+#   EVENT_MAX_ATTEMPTS          預設 3
+#   EVENT_STORE_RETENTION_DAYS  已完成事件保留天數 (預設 7)
+#
+# 用法：
+#   python3 event_store.py status
+#   python3 event_store.py dead [--limit N]
+#   python3 event_store.py requeue (ID ... | --all)
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+DEFAULT_EVENT_DB = '/var/lib/it_nexus/webhook_events.db'
+MAX_ATTEMPTS = int(os.getenv('EVENT_MAX_ATTEMPTS', '3'))
+RETENTION_DAYS = float(os.getenv('EVENT_STORE_RETENTION_DAYS', '7'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    hostname    TEXT NOT NULL,
+    payload     TEXT,
+    state       TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    received_at REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_state ON events(state);
+CREATE TABLE IF NOT EXISTS dead_events (
+    id          INTEGER PRIMARY KEY,
+    hostname    TEXT NOT NULL,
+    payload     TEXT,
+    attempts    INTEGER NOT NULL,
+    last_error  TEXT,
+    received_at REAL NOT NULL,
+    dead_at     REAL NOT NULL
+);
+"""
+
+
+class _PendingWrite:
+    __slots__ = ('hostname', 'payload', 'received_at', 'id', 'error', 'done')
+
+    def __init__(self, hostname, payload):
+        self.hostname = hostname
+        self.payload = payload
+        self.received_at = time.time()
+        self.id = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class EventStore:
+    """Append-only 事件佇列 (執行緒安全)。"""
+
+    def __init__(self, path=None, max_attempts=MAX_ATTEMPTS):
+        self.path = path or os.getenv('EVENT_STORE_DB', DEFAULT_EVENT_DB)
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+        self._writes = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._writer = threading.Thread(target=self._write_loop, name='event-writer', daemon=True)
+        self._writer.start()
+
+    # --- 寫入 (Group Commit) ---
+    def append(self, hostname, payload, timeout=10):
+        """寫入事件並等待 commit 完成，回傳事件 ID。"""
+        write = _PendingWrite(hostname, json.dumps(payload, ensure_ascii=False))
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError('event store closed')
+            self._writes.append(write)
+            self._cond.notify()
+        if not write.done.wait(timeout):
+            raise TimeoutError('event store commit timeout')
+        if write.error:
+            raise write.error
+        return write.id
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._writes and not self._stopped:
+                    self._cond.wait()
+                if not self._writes:
+                    return
+                batch, self._writes = self._writes, []
+            try:
+                with self._lock, self._conn:
+                    for w in batch:
+                        w.id = self._conn.execute(
+                            "INSERT INTO events (hostname, payload, received_at, updated_at) VALUES (?, ?, ?, ?)",
+                            (w.hostname, w.payload, w.received_at, w.received_at),
+                        ).lastrowid
+            except sqlite3.Error as e:
+                for w in batch:
+                    w.error = e
+            for w in batch:
+                w.done.set()
+
+    # --- 處理結果 ---
+    def mark_done(self, ids):
+        if not ids:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE events SET state = 'done', updated_at = ? WHERE id = ?", [(now, i) for i in ids]
+            )
+
+    def mark_failed(self, ids, error):
+        """記錄失敗；回傳仍可重試的事件 ID，超過上限者移入 dead_events。"""
+        if not ids:
+            return []
+        now = time.time()
+        error = str(error)[:2000]
+        retry = []
+        with self._lock, self._conn:
+            for i in ids:
+                self._conn.execute(
+                    "UPDATE events SET attempts = attempts + 1, last_error = ?, updated_at = ? "
+                    "WHERE id = ? AND state = 'pending'", (error, now, i)
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM events WHERE id = ? AND state = 'pending'", (i,)
+                ).fetchone()
+                if not row:
+                    continue
+                if row['attempts'] < self.max_attempts:
+                    retry.append(i)
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_events (id, hostname, payload, attempts, last_error, received_at, dead_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (i, row['hostname'], row['payload'], row['attempts'], error, row['received_at'], now),
+                )
+                self._conn.execute("DELETE FROM events WHERE id = ?", (i,))
+        return retry
+
+    # --- 重播與維護 ---
+    def unfinished(self):
+        """所有尚未完成的事件 (依接收順序)。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, hostname, attempts, received_at FROM events WHERE state = 'pending' ORDER BY id"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def dead(self, limit=50):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM dead_events ORDER BY dead_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def requeue(self, ids=None):
+        """將 Dead Letter 事件移回佇列 (ids=None 表示全部)，回傳筆數。"""
+        now = time.time()
+        where, params = ('', ()) if ids is None else (
+            f"WHERE id IN ({','.join('?' * len(ids))})", tuple(ids))
+        with self._lock, self._conn:
+            rows = self._conn.execute(f"SELECT * FROM dead_events {where}", params).fetchall()
+            for r in rows:
+                self._conn.execute(
+                    "INSERT INTO events (hostname, payload, received_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (r['hostname'], r['payload'], r['received_at'], now),
+                )
+                self._conn.execute("DELETE FROM dead_events WHERE id = ?", (r['id'],))
+        return len(rows)
+
+    def purge(self, retention_days=RETENTION_DAYS):
+        """刪除超過保留期限的已完成事件。"""
+        cutoff = time.time() - retention_days * 86400
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM events WHERE state = 'done' AND updated_at < ?", (cutoff,)
+            ).rowcount
+
+    def counts(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM events GROUP BY state").fetchall())
+            counts['dead'] = self._conn.execute("SELECT COUNT(*) FROM dead_events").fetchone()[0]
+        return counts
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webhook Event Store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="顯示各狀態事件數")
+    dead = sub.add_parser('dead', help="列出 Dead Letter 事件")
+    dead.add_argument('--limit', type=int, default=50)
+    requeue = sub.add_parser('requeue', help="將 Dead Letter 事件移回佇列")
+    requeue.add_argument('ids', nargs='*', type=int)
+    requeue.add_argument('--all', action='store_true')
+    args = parser.parse_args()
+
+    store = EventStore()
+    try:
+        if args.command == 'status':
+            print(json.dumps(store.counts(), indent=2))
+        elif args.command == 'dead':
+            for ev in store.dead(args.limit):
+                dead_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ev['dead_at']))
+                print(f"#{ev['id']} {ev['hostname']} attempts={ev['attempts']} dead_at={dead_at} error={ev['last_error']}")
+        elif args.command == 'requeue':
+            if not args.ids and not args.all:
+                parser.error("請指定事件 ID 或 --all")
+            n = store.requeue(None if args.all else args.ids)
+            print(f"已移回佇列: {n} 筆 (重啟 webhook-receiver 或 POST /events/replay 後處理)")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
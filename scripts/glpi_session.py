@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# =============================================================================
+# glpi_session.py - GLPI Session 快取管理 (跨腳本 / 跨執行共用)
+# =============================================================================
+# 用途：GLPI initSession 需載入 Profile 與權限，成本高。此模組將有效的
+#       Session Token 快取於本機磁碟 (以檔案鎖保護)，讓 sync_netbox_to_glpi.py
+#       與 librenms_alert_glpi.py 共用同一個 Session，僅在過期時才重新建立。
+#
+# 設計：
+#   - 快取檔以 (API URL, User Token) 雜湊為鍵，避免不同帳號互相覆蓋。
+#   - 最近 GLPI_SESSION_VALIDATE_INTERVAL 秒內使用過的 Token 直接信任；
+#     超過則以 getActiveProfile 做輕量驗證，失效 (401) 才 initSession。
+#   - 不再呼叫 killSession，Session 由 GLPI 端的逾時機制回收。
+#   - 快取目錄不存在或無寫入權限時退回不快取 (每個行程各自 initSession)，
+#     不影響告警處理；多帳號共用時快取目錄設為同一群組 (見 MAINTENANCE.md 1.5)。
+#
+# 注意：此模組僅依賴 requests，可與 librenms_alert_glpi.py 一併部署於
+#       LibreNMS 主機 (參見 requirements.librenms.txt)。
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import fcntl
+import hashlib
+import requests
+
+DEFAULT_CACHE_FILE = '/var/lib/it_nexus/glpi_session.json'
+DEFAULT_VALIDATE_INTERVAL = 300  # 秒；GLPI 預設 Session 閒置逾時約 1440 秒
+CACHE_FILE_MODE = 0o660          # 群組可讀寫：netbox 與 librenms 帳號共用同一個快取
+
+
+class GlpiSessionError(Exception):
+    """GLPI Session 建立失敗。"""
+
+
+class GlpiSessionManager:
+    """管理可重用的 GLPI Session Token (磁碟快取 + 檔案鎖)。"""
+
+    def __init__(self, api_url, app_token, user_token, cache_file=None,
+                 validate_interval=None, verify=False, timeout=10, retry_count=1, logger=None, http=None):
+        self.api_url = api_url.rstrip('/')
+        self.app_token = app_token
+        self.user_token = user_token
+        self.cache_file = cache_file or os.getenv('GLPI_SESSION_CACHE', DEFAULT_CACHE_FILE)
+        if validate_interval is None:
+            validate_interval = int(os.getenv('GLPI_SESSION_VALIDATE_INTERVAL', DEFAULT_VALIDATE_INTERVAL))
+        self.validate_interval = validate_interval
+        self.verify = verify
+        self.timeout = timeout
+        self.retry_count = max(1, retry_count)
+        self.logger = logger
+        self.http = http or requests.Session()
+        self._token = None
+        self._cache_disabled = False
+        self._cache_key = hashlib.sha256(f"{self.api_url}|{user_token}".encode()).hexdigest()
+
+    # --- 內部工具 ---
+    def _log(self, level, msg):
+        if self.logger:
+            getattr(self.logger, level)(msg)
+        elif level in ('warning', 'error'):
+            print(msg, file=sys.stderr)
+
+    @staticmethod
+    def _open(path, flags):
+        fd = os.open(path, flags | os.O_CREAT, CACHE_FILE_MODE)
+        try:
+            # 不受 umask 影響，確保同群組的另一個帳號可寫入 (非擁有者時略過)
+            os.fchmod(fd, CACHE_FILE_MODE)
+        except OSError:
+            pass
+        return fd
+
+    def _lock(self):
+        """取得快取檔的排他鎖 (跨 Process)。"""
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        fd = self._open(f"{self.cache_file}.lock", os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    @staticmethod
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, cache):
+        tmp = f"{self.cache_file}.tmp"
+        fd = self._open(tmp, os.O_WRONLY | os.O_TRUNC)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, self.cache_file)
+
+    def _init_session(self):
+        headers = {'App-Token': self.app_token, 'Authorization': f'user_token {self.user_token}'}
+        for attempt in range(1, self.retry_count + 1):
+            try:
+                resp = self.http.get(f"{self.api_url}/initSession", headers=headers,
+                                     verify=self.verify, timeout=self.timeout)
+                resp.raise_for_status()
+                token = resp.json().get('session_token')
+                break
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if attempt == self.retry_count:
+                    raise GlpiSessionError(f"GLPI Session 初始化失敗 ({self.api_url}/initSession): {e}") from e
+                wait = 2 ** attempt
+                self._log('warning', f"⚠ GLPI initSession 失敗 [第 {attempt}/{self.retry_count} 次]: {e}，{wait} 秒後重試...")
+                time.sleep(wait)
+        if not token:
+            raise GlpiSessionError(f"GLPI 未回傳 session_token ({self.api_url})")
+        self._log('info', "🔑 已建立新的 GLPI Session")
+        return token
+
+    def _is_valid(self, token):
+        """以 getActiveProfile 做輕量驗證；僅在明確 401 時視為失效。"""
+        try:
+            resp = self.http.get(f"{self.api_url}/getActiveProfile",
+                                 headers={'Session-Token': token, 'App-Token': self.app_token},
+                                 verify=self.verify, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            # 網路錯誤交由後續實際請求處理，不在此處強制重建 Session
+            self._log('warning', f"⚠ GLPI Session 驗證失敗，沿用快取 Token: {e}")
+            return True
+        return resp.status_code != 401
+
+    def _disable_cache(self, err):
+        if not self._cache_disabled:
+            self._log('warning', f"⚠ 無法使用 GLPI Session 快取 ({self.cache_file}): {err}，改為不快取")
+        self._cache_disabled = True
+
+    # --- 公開介面 ---
+    def get_token(self):
+        """取得有效的 Session Token (必要時才驗證或重建)。
+
+        快取無法使用 (目錄不存在、權限不足) 時只保留於本行程。
+        """
+        fd = None
+        if not self._cache_disabled:
+            try:
+                fd = self._lock()
+            except OSError as e:
+                self._disable_cache(e)
+        if fd is None:
+            if not self._token:
+                self._token = self._init_session()
+            return self._token
+        try:
+            cache = self._read_cache()
+            entry = cache.get(self._cache_key) or {}
+            token = entry.get('session_token')
+            now = time.time()
+
+            if token and now - entry.get('last_used', 0) > self.validate_interval:
+                if not self._is_valid(token):
+                    self._log('info', "♻ 快取的 GLPI Session 已過期，重新建立")
+                    token = None
+            if not token:
+                token = self._init_session()
+
+            cache[self._cache_key] = {'session_token': token, 'last_used': now}
+            try:
+                self._write_cache(cache)
+            except OSError as e:
+                self._disable_cache(e)
+            self._token = token
+            return token
+        finally:
+            self._unlock(fd)
+
+    def invalidate(self, token=None):
+        """將 Token 自快取移除 (例如 API 回傳 401 時)。"""
+        token = token or self._token
+        if self._token == token:
+            self._token = None
+        if self._cache_disabled:
+            return
+        try:
+            fd = self._lock()
+        except OSError as e:
+            self._disable_cache(e)
+            return
+        try:
+            cache = self._read_cache()
+            entry = cache.get(self._cache_key)
+            if entry and entry.get('session_token') == token:
+                del cache[self._cache_key]
+                self._write_cache(cache)
+        except OSError as e:
+            self._disable_cache(e)
+        finally:
+            self._unlock(fd)
+
+    def headers(self, content_type=True):
+        """組出帶有 Session-Token 的 GLPI 請求 Header。"""
+        headers = {'Session-Token': self._token or self.get_token(), 'App-Token': self.app_token}
+        if content_type:
+            headers['Content-Type'] = 'application/json'
+        return headers
+
+    def request(self, method, path, **kwargs):
+        """送出 GLPI API 請求；若 Session 失效 (401) 則重建後重試一次。"""
+        url = path if path.startswith('http') else f"{self.api_url}/{path.lstrip('/')}"
+        kwargs.setdefault('verify', self.verify)
+        kwargs.setdefault('timeout', self.timeout)
+        resp = self.http.request(method, url, headers=self.headers(), **kwargs)
+        if resp.status_code == 401:
+            self.invalidate()
+            resp = self.http.request(method, url, headers=self.headers(), **kwargs)
+        return resp
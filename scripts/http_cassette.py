@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# =============================================================================
+# http_cassette.py - 上游 API 流量錄製 / 重播 (可重現的效能測試)
+# =============================================================================
+# 用途：在正式環境錄下一次同步的 LibreNMS / NetBox / GLPI API 回應 (gzip JSONL)，
+#       於開發機重播同一份資料進行 Profiling / Benchmark，保留真實資料的特性
+#       (Hyper-V 亂碼、ifTrunk 格式、大型 Port 表)。
+#
+#   - 掛在 requests 的 HTTPAdapter.send，pynetbox、requests.Session 與
+#     requests.get 皆經過此處，腳本不需逐一傳入 Session。
+#   - 錄製時不保存請求 Header (Token 皆在 Header)；URL Query、請求/回應 JSON
+#     中的敏感欄位與環境變數中的 Token 值一律替換為 ***。
+#   - 回應內容為 UTF-8 以外的位元組時以 base64 原樣保存 (不經解碼)。
+#   - 重播依 (Method, Path+Query, Body) 比對，找不到時放寬為 (Method, Path+Query)；
+#     同一請求多次出現時依錄製順序回應，用完後重複最後一筆。
+#     不比對主機名稱，NETBOX_URL 等可指向任意位址 (不會實際連線)。
+#
+# 設定：
+#   HTTP_CASSETTE        Cassette 路徑 (例如 /tmp/librenms_sync.jsonl.gz)，未設定則停用
+#   HTTP_CASSETTE_MODE   record / replay
+#   HTTP_CASSETTE_SPEED  重播延遲倍率：1 = 原始回應時間，0 = 不延遲 (預設 1)
+#
+# 用法：
+#   HTTP_CASSETTE=/tmp/run.jsonl.gz HTTP_CASSETTE_MODE=record python3 sync_librenms_to_netbox.py
+#   HTTP_CASSETTE=/tmp/run.jsonl.gz HTTP_CASSETTE_MODE=replay HTTP_CASSETTE_SPEED=0 \
+#       python3 sync_librenms_to_netbox.py
+#   python3 http_cassette.py info /tmp/run.jsonl.gz
+# =============================================================================
+
+import os
+import sys
+import gzip
+import json
+import time
+import base64
+import atexit
+import hashlib
+import argparse
+import datetime
+import threading
+from collections import Counter, defaultdict, deque
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+SCRUBBED = '***'
+SENSITIVE_KEYS = {'token', 'api_token', 'app_token', 'user_token', 'session_token', 'apikey', 'api_key',
+                  'password', 'passwd', 'secret', 'authorization'}
+SECRET_ENV_VARS = ('LIBRENMS_TOKEN', 'NETBOX_TOKEN', 'GLPI_APP_TOKEN', 'GLPI_USER_TOKEN')
+# 重播時沿用的回應 Header (其餘如 Set-Cookie、Date 不保存)
+KEEP_HEADERS = {'content-type', 'api-version', 'content-range', 'location'}
+
+_original_send = HTTPAdapter.send
+_active = None
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """重播時 Cassette 中沒有對應的請求。"""
+
+
+# =============================================================================
+# 遮蔽敏感資料
+# =============================================================================
+def _secret_values():
+    return [v for v in (os.getenv(name) for name in SECRET_ENV_VARS) if v and len(v) >= 6]
+
+
+def scrub_value(value):
+    """遞迴遮蔽 JSON 中的敏感欄位。"""
+    if isinstance(value, dict):
+        return {k: SCRUBBED if str(k).lower() in SENSITIVE_KEYS else scrub_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [scrub_value(v) for v in value]
+    return value
+
+
+def scrub_text(text, secrets=()):
+    """JSON 內容遮蔽敏感欄位，並移除任何出現的 Token 值。"""
+    if not text:
+        return text
+    try:
+        text = json.dumps(scrub_value(json.loads(text)), ensure_ascii=False)
+    except ValueError:
+        pass
+    for secret in secrets:
+        text = text.replace(secret, SCRUBBED)
+    return text
+
+
+def normalize_url(url, secrets=()):
+    """比對用 Key：Path + 排序後的 Query (不含主機，敏感參數遮蔽)。"""
+    parts = urlsplit(url)
+    query = sorted((k, SCRUBBED if k.lower() in SENSITIVE_KEYS else v)
+                   for k, v in parse_qsl(parts.query, keep_blank_values=True))
+    target = parts.path + (f"?{urlencode(query)}" if query else '')
+    for secret in secrets:
+        target = target.replace(secret, SCRUBBED)
+    return target
+
+
+def _body_text(body):
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    return body
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16] if text else None
+
+
+# =============================================================================
+# Cassette
+# =============================================================================
+class Cassette:
+    """錄製 (mode='record') 或重播 (mode='replay') 一份 Cassette 檔。"""
+
+    def __init__(self, path, mode, speed=1.0, logger=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"未知的 Cassette 模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = max(0.0, speed)
+        self.logger = logger
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._secrets = _secret_values()
+        self._started = time.monotonic()
+        self._file = None
+        self._exact = defaultdict(deque)
+        self._loose = defaultdict(deque)
+        self._last = {}
+
+        if mode == 'record':
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+            self._write({'cassette': 1, 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                         'argv': [os.path.basename(a) for a in sys.argv[:1]]})
+        else:
+            for entry in read_entries(path):
+                key = normalize_url(entry['url'])
+                self._exact[(entry['method'], key, _digest(entry.get('body')))].append(entry)
+                self._loose[(entry['method'], key)].append(entry)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    # --- 錄製 ---
+    def record(self, request, response, elapsed):
+        try:
+            text = response.content.decode('utf-8')
+            content = {'content': scrub_text(text, self._secrets)}
+        except UnicodeDecodeError:
+            content = {'content_b64': base64.b64encode(response.content).decode('ascii')}
+        entry = {
+            't': round(time.monotonic() - self._started, 4),
+            'method': request.method,
+            'url': normalize_url(request.url, self._secrets),
+            'body': scrub_text(_body_text(request.body), self._secrets),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in KEEP_HEADERS},
+            'elapsed': round(elapsed, 4),
+            **content,
+        }
+        with self._lock:
+            if self._file:
+                self._write(entry)
+                self.stats['recorded'] += 1
+
+    # --- 重播 ---
+    def _take(self, queues, key):
+        queue = queues.get(key)
+        if not queue:
+            return self._last.get(key)
+        entry = queue.popleft()
+        self._last[key] = entry
+        return entry
+
+    def lookup(self, request):
+        key = normalize_url(request.url)
+        body = scrub_text(_body_text(request.body), self._secrets)
+        with self._lock:
+            entry = self._take(self._exact, (request.method, key, _digest(body)))
+            if entry is not None:
+                self.stats['hit'] += 1
+                return entry
+            entry = self._take(self._loose, (request.method, key))
+            self.stats['loose' if entry is not None else 'miss'] += 1
+            return entry
+
+    def replay(self, adapter, request):
+        entry = self.lookup(request)
+        if entry is None:
+            if self.logger:
+                self.logger.warning(f"⚠ Cassette 無對應請求: {request.method} {normalize_url(request.url)}")
+            raise CassetteMiss(f"Cassette 無對應請求: {request.method} {request.url}", request=request)
+        if self.speed and entry.get('elapsed'):
+            time.sleep(entry['elapsed'] * self.speed)
+
+        resp = requests.Response()
+        resp.status_code = entry['status']
+        resp.reason = entry.get('reason')
+        resp.headers = CaseInsensitiveDict(entry.get('headers') or {})
+        if 'content_b64' in entry:
+            resp._content = base64.b64decode(entry['content_b64'])
+        else:
+            resp._content = (entry.get('content') or '').encode('utf-8')
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp.url = request.url
+        resp.request = request
+        resp.connection = adapter
+        resp.elapsed = datetime.timedelta(seconds=entry.get('elapsed') or 0)
+        return resp
+
+
+def read_entries(path):
+    """讀取 Cassette 的請求紀錄 (錄製中斷造成的檔尾損毀會略過)。"""
+    entries = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'method' in record:
+                    entries.append(record)
+    except (EOFError, gzip.BadGzipFile):
+        pass
+    return entries
+
+
+# =============================================================================
+# 掛載
+# =============================================================================
+def _send(adapter, request, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return _original_send(adapter, request, **kwargs)
+    if cassette.mode == 'replay':
+        return cassette.replay(adapter, request)
+    started = time.monotonic()
+    response = _original_send(adapter, request, **kwargs)
+    response.content  # 讀完內容才算完整回應時間
+    cassette.record(request, response, time.monotonic() - started)
+    return response
+
+
+def install(cassette):
+    """啟用 Cassette (本行程所有 requests 連線)。"""
+    global _active
+    _active = cassette
+    HTTPAdapter.send = _send
+    atexit.register(cassette.close)
+    return cassette
+
+
+def uninstall():
+    global _active
+    if _active:
+        _active.close()
+    _active = None
+    HTTPAdapter.send = _original_send
+
+
+def install_from_env(logger=None):
+    """依 HTTP_CASSETTE / HTTP_CASSETTE_MODE 啟用錄製或重播，未設定回傳 None。"""
+    path = os.getenv('HTTP_CASSETTE')
+    if not path:
+        return None
+    mode = os.getenv('HTTP_CASSETTE_MODE', 'replay').lower()
+    cassette = install(Cassette(path, mode, float(os.getenv('HTTP_CASSETTE_SPEED', '1')), logger=logger))
+    if logger:
+        logger.warning(f"🎞 HTTP Cassette {'錄製' if mode == 'record' else '重播'}: {path}")
+    return cassette
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+def main():
+    parser = argparse.ArgumentParser(description='HTTP Cassette')
+    sub = parser.add_subparsers(dest='command', required=True)
+    info = sub.add_parser('info', help="顯示 Cassette 的請求數、路由與回應時間")
+    info.add_argument('path')
+    info.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    entries = read_entries(args.path)
+    routes = Counter()
+    route_time = Counter()
+    size = 0
+    for e in entries:
+        path = urlsplit(e['url']).path
+        route = f"{e['method']} {'/'.join('{id}' if p.isdigit() else p for p in path.split('/'))}"
+        routes[route] += 1
+        route_time[route] += e.get('elapsed') or 0
+        size += len(e.get('content') or e.get('content_b64') or '')
+    duration = entries[-1]['t'] if entries else 0
+    print(f"requests={len(entries)} recorded_span={duration:.1f}s "
+          f"server_time={sum(route_time.values()):.1f}s body={size / 1024 / 1024:.1f}MiB")
+    for route, n in routes.most_common(args.top):
+        print(f"{n:>7d} {route_time[route]:>8.2f}s  {route}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# =============================================================================
+# instrumentation.py - 上游 API 呼叫與同步階段計時
+# =============================================================================
+# 用途：區分同步變慢的來源 (LibreNMS、NetBox 寫入或 GLPI 搜尋)。
+#   - API：掛在 requests.Session.send (pynetbox、共用 Session、requests.get 皆經過)，
+#          依 (host, endpoint 樣板, method) 記錄次數、總時間與延遲分佈；
+#          endpoint 將 ID / hostname 替換為 {id}，例如 GET /api/dcim/devices/{id}/。
+#   - 階段：fetch / refs / device / ip / vlan / interface / inventory 等，
+#          以 phase() 或 PhaseTimer 計時 (每台設備一筆)。
+#   - 啟用 tracing.py 時，階段與 HTTP 呼叫同時記錄為 Span。
+# 結果由 utils.save_metrics 併入 Metrics JSON (instrumentation 欄位)，
+# 並在設定 METRICS_TEXTFILE_DIR 時寫出 <sync_source>.prom 供 node_exporter
+# Textfile Collector 讀取。Webhook Receiver 的 /metrics 亦會包含這些指標。
+# =============================================================================
+
+import os
+import time
+import contextlib
+from urllib.parse import urlsplit
+
+import requests
+
+import tracing
+from metrics_registry import REGISTRY, _format_value
+
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# LibreNMS 以 hostname 作為路徑參數的集合
+NAME_KEYED = {'devices', 'inventory'}
+
+API_SECONDS = REGISTRY.histogram('it_nexus_api_request_seconds', '上游 API 請求時間 (含讀取回應)',
+                                 ['host', 'endpoint', 'method'], API_BUCKETS)
+API_ERRORS = REGISTRY.counter('it_nexus_api_request_errors_total', '上游 API 錯誤 (HTTP 4xx/5xx 或連線例外)',
+                              ['host', 'endpoint', 'method', 'status'])
+PHASE_SECONDS = REGISTRY.histogram('it_nexus_sync_phase_seconds', '同步階段耗時 (每台設備)', ['phase'], PHASE_BUCKETS)
+
+_original_send = requests.Session.send
+_installed = False
+
+
+def endpoint_template(url):
+    """URL -> (host, endpoint 樣板)；數字 ID 與 LibreNMS hostname 參數替換為 {id}，不含 Query。"""
+    parts = urlsplit(url)
+    segments = parts.path.split('/')
+    libre = '/api/v0/' in parts.path
+    for i, seg in enumerate(segments):
+        if seg.isdigit() or (libre and i > 0 and segments[i - 1] in NAME_KEYED and seg):
+            segments[i] = '{id}'
+    return parts.hostname or '', '/'.join(segments)
+
+
+def observe_request(method, url, seconds, status=None):
+    host, endpoint = endpoint_template(url)
+    API_SECONDS.observe(seconds, host=host, endpoint=endpoint, method=method)
+    if status is None or status >= 400:
+        API_ERRORS.inc(host=host, endpoint=endpoint, method=method, status=status or 'exception')
+    return host, endpoint
+
+
+def _send(session, request, **kwargs):
+    started = time.perf_counter()
+    status = None
+    try:
+        response = _original_send(session, request, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        ended = time.perf_counter()
+        host, endpoint = observe_request(request.method, request.url, ended - started, status)
+        tracing.complete(f"{request.method} {endpoint}", started, ended, cat='http', host=host, status=status)
+
+
+def install():
+    """啟用 API 計時 (本行程所有 requests.Session)。"""
+    global _installed
+    requests.Session.send = _send
+    _installed = True
+
+
+def uninstall():
+    global _installed
+    requests.Session.send = _original_send
+    _installed = False
+
+
+def installed():
+    return _installed
+
+
+# =============================================================================
+# 階段計時
+# =============================================================================
+@contextlib.contextmanager
+def phase(name, **args):
+    """階段計時；args 僅附加於 Trace Span (例如 device=...)。"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        PHASE_SECONDS.observe(ended - started, phase=name)
+        tracing.complete(name, started, ended, cat='phase', **args)
+
+
+class PhaseTimer:
+    """依序切換的階段計時 (適合不便以 with 包住的長區塊)。
+
+        timer = PhaseTimer('vlan')
+        ...
+        timer.next('interface')
+        ...
+        timer.stop()
+    """
+
+    def __init__(self, name=None):
+        self.name = None
+        self.started = 0.0
+        if name:
+            self.next(name)
+
+    def _record(self, ended):
+        PHASE_SECONDS.observe(ended - self.started, phase=self.name)
+        tracing.complete(self.name, self.started, ended, cat='phase')
+
+    def next(self, name):
+        now = time.perf_counter()
+        if self.name:
+            self._record(now)
+        self.name, self.started = name, now
+
+    def stop(self):
+        if self.name:
+            self._record(time.perf_counter())
+        self.name = None
+
+
+# =============================================================================
+# 輸出
+# =============================================================================
+def _histogram_summary(histogram):
+    rows = []
+    for key, (counts, total) in sorted(histogram.snapshot().items()):
+        row = dict(zip(histogram.labelnames, key))
+        cumulative, buckets = 0, {}
+        for bound, count in zip(histogram.buckets, counts):
+            cumulative += count
+            buckets[_format_value(bound)] = cumulative
+        row.update({'count': cumulative, 'seconds': round(total, 4),
+                    'avg_ms': round(total / cumulative * 1000, 2) if cumulative else 0, 'buckets': buckets})
+        rows.append(row)
+    return rows
+
+
+def summary():
+    """Metrics JSON 用：API 依總時間排序，另列錯誤數與各階段耗時。"""
+    api = sorted(_histogram_summary(API_SECONDS), key=lambda r: -r['seconds'])
+    errors = [dict(zip(API_ERRORS.labelnames, k), count=v) for k, v in sorted(API_ERRORS.snapshot().items())]
+    return {'api': api, 'api_errors': errors, 'phases': _histogram_summary(PHASE_SECONDS)}
+
+
+def write_textfile(directory, sync_source, stats=None):
+    """寫出 <directory>/<sync_source>.prom (原子替換)，數值型 stats 以 it_nexus_sync_stat 輸出。"""
+    os.makedirs(directory, exist_ok=True)
+    lines = [REGISTRY.render({'sync_source': sync_source}).rstrip('\n')]
+    numeric = {k: v for k, v in (stats or {}).items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    if numeric:
+        lines += ['# HELP it_nexus_sync_stat 同步統計 (created/updated/failed...)', '# TYPE it_nexus_sync_stat gauge']
+        lines += [f'it_nexus_sync_stat{{stat="{k}",sync_source="{sync_source}"}} {_format_value(v)}'
+                  for k, v in sorted(numeric.items())]
+    lines += ['# HELP it_nexus_sync_last_run_timestamp_seconds 最近一次同步完成時間',
+              '# TYPE it_nexus_sync_last_run_timestamp_seconds gauge',
+              f'it_nexus_sync_last_run_timestamp_seconds{{sync_source="{sync_source}"}} {int(time.time())}']
+    path = os.path.join(directory, f"{sync_source}.prom")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, path)
+    return path
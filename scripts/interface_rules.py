@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# =============================================================================
+# interface_rules.py - 介面名稱規則 (實體介面判斷、亂碼清理、Type 對應)
+# =============================================================================
+# 用途：sync_librenms_to_netbox.py 與 sync_librenms_interfaces.py 共用的介面規則，
+#       每個 Port 都會呼叫，因此：
+#   - 白名單前綴、排除清單、Hyper-V 亂碼特徵在載入時編譯為合併的 Regex，
+#     每個名稱只掃描一次 (取代逐一 startswith / in / re.search)。
+#   - 同一設備群的介面名稱大量重複 (GigabitEthernet1/0/1、eth0...)，
+#     sanitize_string / is_physical_interface 以 LRU Cache 保存結果。
+#   - classify() 一次完成清理、實體判斷與 Type 對應。
+#
+# 規則調整後請執行 tests/test_transforms.py 確認輸出 (Digest) 變化符合預期，
+# 並以 tests/bench/transform_bench.py --update-baselines 更新基準。
+# =============================================================================
+
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+CACHE_SIZE = 65536
+
+# ============================================================================
+# 實體介面白名單 (只有符合這些前綴的介面才會同步)
+# ============================================================================
+PHYSICAL_PREFIXES = (
+    # --- Cisco ---
+    'Fa', 'Gi', 'Te', 'Fo', 'Tw', 'Hu',
+    'FastEthernet', 'GigabitEthernet', 'TenGigabitEthernet',
+    'Ethernet', 'Eth',
+    'mgmt', 'Management',
+    # --- Linux / Generic ---
+    'eth', 'ens', 'enp', 'eno', 'em',
+    'wlan', 'wl',
+    # --- LAG ---
+    'Po', 'Port-channel', 'Bond', 'bond', 'ae',
+    # --- Fortinet ---
+    'port', 'wan', 'dmz', 'internal',
+    # --- Aruba / HP ---
+    'ge-', 'xe-', 'et-',
+)
+
+LAG_PREFIXES = ('Po', 'Port-channel', 'Bond', 'bond', 'ae')
+
+# 排除清單 (名稱中任一位置出現即排除)
+SKIP_PATTERNS = [
+    'WFP', 'LightWeight Filter', 'WAN Miniport',
+    'Microsoft Kernel Debug', 'Pseudo-Interface',
+    'isatap', 'Teredo', 'Microsoft ISATAP',
+    'Miniport', 'Microsoft Wi-Fi Direct',
+    'Hyper-V', 'vSwitch', 'NDIS',
+    'Null', 'Nu0',
+]
+
+
+def _alternation(words):
+    # 長的在前：Regex 交替依序嘗試，結果與 any(startswith) 相同，僅減少回溯
+    return '|'.join(re.escape(w) for w in sorted(set(words), key=len, reverse=True))
+
+
+_PHYSICAL_RE = re.compile(f"(?:{_alternation(PHYSICAL_PREFIXES)})")
+_SKIP_RE = re.compile(_alternation(SKIP_PATTERNS))
+
+# --- Hyper-V 亂碼 (SNMP 以錯誤編碼回傳) ---
+# 範例: Hyper-V ?????A?Ӻ????????d #2
+_MOJIBAKE_RE = re.compile('[?\u04fa\u6d33\ufffd]')
+_SERIAL_RE = re.compile(r'#(\d+)')
+_FILTER_SUFFIX_RE = re.compile(r'-(WFP|Microsoft|NDIS|Load|Failover).*$')
+# 特徵字元於小寫後比對 (Ӻ 小寫為 ӻ)
+_ADAPTER_RE = re.compile('adapter|ethernet|\u04fb')
+_SWITCH_RE = re.compile('switch|\u6d3b|\u6d33')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def sanitize_string(text):
+    """清理亂碼 (Mojibake) 並替換為可讀名稱，特別針對 Hyper-V 模式。"""
+    if not text:
+        return text
+
+    # 移除不可見字元 (如 Null, Bell 等)
+    if not text.isprintable():
+        text = "".join(char for char in text if char.isprintable())
+
+    if 'Hyper-V' in text:
+        num_match = _SERIAL_RE.search(text)
+        suffix = f" #{num_match.group(1)}" if num_match else ""
+
+        # 1. Hyper-V 虛擬網卡 / vSwitch：帶有亂碼特徵時依特徵字元辨識類型，
+        #    保留過濾器後綴 (如 -WFP ..., -Microsoft ...) 以防止重複名稱
+        if _MOJIBAKE_RE.search(text):
+            lowered = text.lower()
+            filter_match = _FILTER_SUFFIX_RE.search(text)
+            filter_suffix = filter_match.group(0) if filter_match else ""
+            if _ADAPTER_RE.search(lowered):
+                return f"Hyper-V Virtual Ethernet Adapter{suffix}{filter_suffix}"
+            if _SWITCH_RE.search(lowered):
+                return f"Hyper-V Virtual Switch{suffix}{filter_suffix}"
+
+        # 2. 包含過多問號，歸類為 Network Adapter
+        if text.count('?') > 2:
+            return f"Hyper-V Network Adapter{suffix}"
+
+    return text.strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def is_physical_interface(if_name):
+    """判斷是否為實體介面 (白名單機制)。"""
+    name = (if_name or '').strip()
+    if not name:
+        return False
+    if _SKIP_RE.search(name):
+        return False
+    return _PHYSICAL_RE.match(name) is not None
+
+
+# 速率門檻 (bps, 由高至低) → Interface Type；未達最低門檻為 other。
+# port_table.py 以此表向量化對應，須與 map_interface_type 的分支一致 (tests/test_port_table.py 檢查)
+SPEED_TIERS = (
+    (100000000000, '100gbase-x-qsfp28'),
+    (40000000000, '40gbase-x-qsfpp'),
+    (25000000000, '25gbase-x-sfp28'),
+    (10000000000, '10gbase-t'),
+    (1000000000, '1000base-t'),
+    (10000000, '100base-tx'),
+)
+
+
+def map_interface_type(if_name, speed_bps):
+    """根據介面名稱與速率判斷 NetBox Interface Type。"""
+    # 少量固定分支：直接比較比 Regex / 查表迴圈快 (此函式無 Cache，速率每個 Port 不同)
+    if (if_name or '').strip().startswith(LAG_PREFIXES):
+        return 'lag'
+    speed = int(speed_bps or 0)
+    if speed >= 100000000000: return '100gbase-x-qsfp28'
+    if speed >= 40000000000:  return '40gbase-x-qsfpp'
+    if speed >= 25000000000:  return '25gbase-x-sfp28'
+    if speed >= 10000000000:  return '10gbase-t'
+    if speed >= 1000000000:   return '1000base-t'
+    if speed >= 10000000:     return '100base-tx'
+    return 'other'
+
+
+InterfaceInfo = namedtuple('InterfaceInfo', 'name physical type')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _classify_name(if_name):
+    physical = is_physical_interface(if_name)
+    virtual = not physical and 'vlan' in (if_name or '').lower()
+    return sanitize_string(if_name), physical, virtual
+
+
+def classify(if_name, speed_bps=0):
+    """一次取得清理後名稱、是否為實體介面與 Interface Type。
+
+    非實體的 VLAN 介面 (SVI) 為 virtual，其餘同 map_interface_type (LAG / 依速率)。
+    """
+    name, physical, virtual = _classify_name(if_name)
+    return InterfaceInfo(name, physical, 'virtual' if virtual else map_interface_type(if_name, speed_bps))
+
+
+def cache_info():
+    """各 Cache 命中率 (除錯 / Benchmark 用)。"""
+    return {f.__name__: f.cache_info()._asdict() for f in (sanitize_string, is_physical_interface, _classify_name)}
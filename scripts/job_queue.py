@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# =============================================================================
+# job_queue.py - 依主機合併 (Coalescing) 的同步工作佇列
+# =============================================================================
+# 用途：webhook_receiver.py 收到告警後不再於 Request Thread 內執行同步，
+#       改為排入此佇列並立即回應 202。
+#   - 同一主機尚未開始的工作會合併為一個 (多次告警只同步一次)。
+#   - 同一主機同時只會有一個工作在執行；執行中再收到的告警會排入新的工作。
+#   - 以固定數量的 Worker 執行 (併發上限)，並保留最近的工作結果供查詢。
+#   - 設定 batch_runner 時，Worker 取得工作後等待 batch_window 秒 (Debounce)，
+#     將期間排入的主機合併為一個批次同步。
+#   - 啟用 tracing.py 時，每個工作 (批次) 為一個以 Job ID 為 trace_id 的根 Span，
+#     並以 Flow 連結到接收該告警的 Webhook Span。
+# =============================================================================
+
+import time
+import uuid
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+
+class Job:
+    """單一主機的同步工作。"""
+
+    def __init__(self, hostname):
+        self.id = uuid.uuid4().hex[:12]
+        self.hostname = hostname
+        self.state = QUEUED
+        self.coalesced = 0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.detail = None
+        self.events = []             # 合併進此工作的事件 ID (event_store.py)
+        self.alert_at = None         # 合併事件中最早的告警時間 (端對端延遲起點)
+
+    @property
+    def key(self):
+        return self.hostname.lower()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'hostname': self.hostname,
+            'state': self.state,
+            'coalesced': self.coalesced,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': (self.finished_at - self.started_at) if self.finished_at and self.started_at else None,
+            'detail': self.detail,
+            'events': list(self.events),
+        }
+
+
+class CoalescingJobQueue:
+    """依主機合併的工作佇列 + Worker Pool。
+
+    runner(hostname) 需回傳 (success, detail)；on_finish(job) 於工作結束後呼叫。
+    batch_runner([hostname, ...], since) 需回傳 {hostname: (success, detail)}；
+    since 為 {hostname: 最早的告警/排入時間}，供略過已由其他行程同步過的主機。
+    """
+
+    def __init__(self, runner, workers=2, history=1000, on_finish=None,
+                 batch_runner=None, batch_window=0, batch_max=50):
+        self.runner = runner
+        self.on_finish = on_finish
+        self.batch_runner = batch_runner
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.workers = workers
+        self.history = history
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._jobs = OrderedDict()   # job_id -> Job (含已完成，保留最近 history 筆)
+        self._pending = {}           # host key -> 尚未開始的 Job
+        self._running = set()        # 執行中的 host key
+        self._deferred = {}          # host key -> 等待同主機工作完成的 Job
+        self._threads = []
+        self._collect_lock = threading.Lock()
+
+    def submit(self, hostname, event_ids=(), alert_at=None):
+        """提交主機同步；回傳 (job, coalesced)。"""
+        key = hostname.lower()
+        with self._lock:
+            job = self._pending.get(key)
+            if job:
+                job.coalesced += 1
+                job.events.extend(event_ids)
+                if alert_at and (job.alert_at is None or alert_at < job.alert_at):
+                    job.alert_at = alert_at
+                return job, True
+            job = Job(hostname)
+            job.events.extend(event_ids)
+            job.alert_at = alert_at
+            self._pending[key] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        self._queue.put(job)
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        """尚未開始的工作數。"""
+        with self._lock:
+            return len(self._pending)
+
+    def _take(self, job):
+        """標記工作開始；若同主機已有工作在執行則延後，回傳 False。"""
+        with self._lock:
+            if job.key in self._running:
+                self._deferred[job.key] = job
+                return False
+            self._pending.pop(job.key, None)
+            self._running.add(job.key)
+            job.state = RUNNING
+            job.started_at = time.time()
+            return True
+
+    def _finish(self, job, success, detail):
+        with self._lock:
+            job.state = SUCCEEDED if success else FAILED
+            job.detail = detail
+            job.finished_at = time.time()
+            self._running.discard(job.key)
+            deferred = self._deferred.pop(job.key, None)
+            self._idle.notify_all()
+        if deferred:
+            self._queue.put(deferred)
+
+    def _collect(self, first):
+        """Debounce：自第一個工作起 batch_window 秒內收集更多工作。
+
+        收集期間工作仍維持 pending，同主機的新告警會繼續合併進來。
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # 留給停止流程
+                break
+            batch.append(job)
+        return [job for job in batch if self._take(job)]
+
+    def _complete(self, job, success, detail):
+        self._finish(job, success, detail)
+        if self.on_finish:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                logger.error(f"❌ Job {job.id} 完成回呼失敗: {e}")
+
+    def _run_batch(self, batch):
+        hostnames = [job.hostname for job in batch]
+        since = {job.hostname: job.alert_at or job.submitted_at for job in batch}
+        logger.info(f"📦 批次同步 {len(batch)} 台: {', '.join(hostnames)}")
+        with tracing.trace('sync_batch', batch[0].id, cat='webhook', jobs=[job.id for job in batch],
+                           hostnames=hostnames):
+            for job in batch:
+                tracing.flow(job.id, False)
+            try:
+                results = self.batch_runner(hostnames, since)
+            except Exception as e:
+                logger.error(f"❌ 批次同步執行錯誤: {e}")
+                results = {}
+                error = str(e)
+            else:
+                error = 'no result'
+        for job in batch:
+            success, detail = results.get(job.hostname, (False, error))
+            self._complete(job, success, detail)
+
+    def _batch_worker(self):
+        while True:
+            # 同時只有一個 Worker 在收集，一個 Debounce 視窗只產生一個批次
+            with self._collect_lock:
+                job = self._queue.get()
+                if job is None:
+                    return
+                batch = self._collect(job)
+            if batch:
+                self._run_batch(batch)
+
+    def _worker(self):
+        if self.batch_runner and self.batch_window > 0:
+            return self._batch_worker()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not self._take(job):
+                continue
+            with tracing.trace('sync_job', job.id, cat='webhook', hostname=job.hostname):
+                tracing.flow(job.id, False)
+                try:
+                    success, detail = self.runner(job.hostname)
+                except Exception as e:
+                    logger.error(f"❌ Job {job.id} ({job.hostname}) 執行錯誤: {e}")
+                    success, detail = False, str(e)
+            self._complete(job, success, detail)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"sync-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """等待所有已排入的工作完成後停止 Worker。"""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending and not self._running)
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
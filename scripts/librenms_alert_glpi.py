@@ -14,19 +14,19 @@
 #    - Script Path: /opt/librenms/scripts/librenms_alert_glpi.py
 # 4. 在 Alert Rule 中關聯此 Transport
 #
+# 常駐模式：
+#   若 alert_glpi_daemon.py 正在執行，本腳本只會透過 Unix Socket 將告警交給
+#   Daemon 排隊處理 (毫秒級返回)；Daemon 未啟動或佇列已滿時，才在本行程內
+#   直接呼叫 GLPI API (原始行為)。
+#
 # =============================================================================
 
 import os
 import sys
 import json
-import requests
-import urllib3
-import argparse
+import socket
 from dotenv import load_dotenv
 
-# 禁用 SSL 警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # 嘗試載入 .env
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(BASE_DIR, '.env')
@@ -40,43 +40,31 @@ elif os.path.exists('/opt/netbox/scripts/.env'):
 GLPI_API_URL = os.getenv('GLPI_API_URL', 'http://198.51.100.2/apirest.php')
 GLPI_APP_TOKEN = os.getenv('GLPI_APP_TOKEN')
 GLPI_USER_TOKEN = os.getenv('GLPI_USER_TOKEN')
+ALERT_DAEMON_SOCKET = os.getenv('ALERT_DAEMON_SOCKET', '/run/it_nexus/alert_glpi.sock')
 
-def init_session():
+def init_session(http=None):
+    """取得 (可重用的) GLPI Session 管理器。"""
     if not GLPI_APP_TOKEN or not GLPI_USER_TOKEN:
         print("❌ 設定錯誤: 缺少 GLPI_APP_TOKEN 或 GLPI_USER_TOKEN")
         sys.exit(1)
 
-    url = f"{GLPI_API_URL.rstrip('/')}/initSession"
-    headers = {
-        'App-Token': GLPI_APP_TOKEN,
-        'Authorization': f'user_token {GLPI_USER_TOKEN}'
-    }
-    try:
-        resp = requests.get(url, headers=headers, verify=False, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get('session_token')
-    except Exception as e:
-        print(f"❌ GLPI Session 初始化失敗: {e}")
-        sys.exit(1)
+    # 延遲載入 requests 相關模組，讓 Daemon 轉交路徑保持輕量
+    import urllib3
+    from glpi_session import GlpiSessionManager, GlpiSessionError
 
-    except Exception as e:
-        print(f"❌ GLPI Session 初始化失敗: {e}")
-        sys.exit(1)
+    # 禁用 SSL 警告
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def kill_session(session_token, headers):
+    glpi = GlpiSessionManager(GLPI_API_URL, GLPI_APP_TOKEN, GLPI_USER_TOKEN, http=http)
     try:
-        requests.get(f"{GLPI_API_URL.rstrip('/')}/killSession", headers=headers, verify=False, timeout=5)
-    except: pass
+        glpi.get_token()
+    except GlpiSessionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    return glpi
 
-def search_ticket(title, session_token):
+def search_ticket(title, glpi):
     """搜尋未結案的工單 (Status: New(1), Processing(2), Pending(3))"""
-    headers = {
-        'Session-Token': session_token,
-        'App-Token': GLPI_APP_TOKEN,
-        'Content-Type': 'application/json'
-    }
-    
     # 搜尋條件: Title contains <title> AND Status IN (1, 2, 3)
     # 注意: GLPI 搜尋 API 較複雜，這裡簡化為搜尋 Title 包含字串，且 Status != Solved(5)/Closed(6)
     # Field 1 = Name (Title), Field 12 = Status
@@ -93,7 +81,7 @@ def search_ticket(title, session_token):
     }
     
     try:
-        resp = requests.get(f"{GLPI_API_URL.rstrip('/')}/Ticket", headers=headers, params=params, verify=False)
+        resp = glpi.request('GET', 'Ticket', params=params)
         resp.raise_for_status()
         data = resp.json()
         
@@ -107,22 +95,20 @@ def search_ticket(title, session_token):
         print(f"⚠️ 搜尋工單失敗: {e}")
         return None
 
-def resolve_ticket(ticket_id, content, session_token):
-    """將工單狀態改為 Solved (5) 並加入解決方案"""
-    headers = {
-        'Session-Token': session_token,
-        'App-Token': GLPI_APP_TOKEN,
-        'Content-Type': 'application/json'
-    }
-    
+def resolve_ticket(ticket_id, content, glpi):
+    """將工單狀態改為 Solved (5) 並加入解決方案；工單已結案或不存在時回傳 True。"""
     # 1. Update Status to Solved (5)
     try:
         payload = {"input": {"id": ticket_id, "status": 5}}
-        requests.put(f"{GLPI_API_URL.rstrip('/')}/Ticket/{ticket_id}", headers=headers, json=payload, verify=False)
+        resp = glpi.request('PUT', f"Ticket/{ticket_id}", json=payload)
+        if resp.status_code == 404:
+            print(f"ℹ️ 工單 #{ticket_id} 已不存在，略過結案")
+            return True
+        resp.raise_for_status()
         print(f"✅ 工單 #{ticket_id} 狀態已更新為 Solved")
     except Exception as e:
         print(f"❌ 更新工單狀態失敗: {e}")
-        return
+        return False
 
     # 2. Add Solution
     try:
@@ -134,18 +120,14 @@ def resolve_ticket(ticket_id, content, session_token):
                 "solutiontypes_id": 1 # Default Solution Type
             }
         }
-        requests.post(f"{GLPI_API_URL.rstrip('/')}/ITILSolution", headers=headers, json=solution_payload, verify=False)
+        glpi.request('POST', 'ITILSolution', json=solution_payload)
         print(f"✅ 已加入解決方案至工單 #{ticket_id}")
     except Exception as e:
         print(f"⚠️ 加入解決方案失敗: {e}")
+    return True
 
-def create_ticket(title, content, urgency, session_token):
-    headers = {
-        'Session-Token': session_token,
-        'App-Token': GLPI_APP_TOKEN,
-        'Content-Type': 'application/json'
-    }
-    
+def create_ticket(title, content, urgency, glpi):
+    """建立 Incident 工單，成功回傳 Ticket ID。"""
     payload = {
         "input": {
             "name": title,
@@ -157,48 +139,213 @@ def create_ticket(title, content, urgency, session_token):
     }
     
     try:
-        resp = requests.post(f"{GLPI_API_URL.rstrip('/')}/Ticket", headers=headers, json=payload, verify=False)
+        resp = glpi.request('POST', 'Ticket', json=payload)
         resp.raise_for_status()
-        print(f"✅ 工單建立成功! Ticket ID: {resp.json().get('id')}")
+        ticket_id = resp.json().get('id')
+        print(f"✅ 工單建立成功! Ticket ID: {ticket_id}")
+        return ticket_id
     except Exception as e:
         print(f"❌ 工單建立失敗: {e}")
+        return None
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 librenms_alert_glpi.py '<Title>' '<Message>'")
-        sys.exit(1)
-        
-    title = sys.argv[1]
-    msg = sys.argv[2] if len(sys.argv) > 2 else "No details provided."
-    
-    # 判斷是否為恢復通知
-    is_recovery = "Recovery" in title or "Recovered" in title or "OK" in title
-    
-    # 初始化 Session
-    session_token = init_session()
-    headers = {'Session-Token': session_token, 'App-Token': GLPI_APP_TOKEN}
-
-    if is_recovery:
-        # 嘗試搜尋對應的未結工單 (移除 'Recovery' 字樣以匹配原始告警)
-        search_title = title.replace("Recovery: ", "").replace("Recovered: ", "").strip()
-        ticket_id = search_ticket(search_title, session_token)
-        
-        if ticket_id:
-            print(f"🔍 發現未結工單 #{ticket_id}，執行自動結案...")
-            resolve_ticket(ticket_id, msg, session_token)
-        else:
+def add_followup(ticket_id, content, glpi):
+    """在工單加入追蹤紀錄 (Followup)。"""
+    try:
+        payload = {"input": {"items_id": ticket_id, "itemtype": "Ticket", "content": content}}
+        glpi.request('POST', 'ITILFollowup', json=payload).raise_for_status()
+        print(f"📝 已加入追蹤紀錄至工單 #{ticket_id}")
+    except Exception as e:
+        print(f"⚠️ 加入追蹤紀錄失敗: {e}")
+
+def urgency_for(title):
+    """依告警標題決定工單緊急程度。"""
+    if "Device Down" in title or "Critical" in title: return 5
+    return 3
+
+def is_recovery_title(title):
+    """判斷是否為恢復通知。"""
+    return "Recovery" in title or "Recovered" in title or "OK" in title
+
+def alert_key(title):
+    """同一告警 (含其恢復通知) 的識別鍵，移除 'Recovery' 等前綴。"""
+    return title.replace("Recovery: ", "").replace("Recovered: ", "").strip()
+
+def open_index():
+    """開啟本機告警索引；無法使用 (含未部署 alert_index.py) 時回傳 None (退回 GLPI 搜尋)。"""
+    try:
+        from alert_index import AlertIndex
+        return AlertIndex()
+    except Exception as e:
+        print(f"⚠️ 無法開啟告警索引，改用 GLPI 搜尋: {e}")
+        return None
+
+def alert_identity(alert):
+    """回傳告警的 (fingerprint, base)；未提供 rule/device 時以標題代替。"""
+    from alert_index import alert_fingerprint, alert_base
+    rule = alert.get('rule') or alert_key(alert['title'])
+    device = alert.get('device') or ''
+    return alert_fingerprint(rule, device, alert.get('faults')), alert_base(rule, device)
+
+def ticket_is_open(ticket_id, glpi):
+    """以 GET Ticket/{id} 確認工單仍未解決 (status < 5)；無法確認時視為未結 (沿用索引)。"""
+    try:
+        resp = glpi.request('GET', f"Ticket/{ticket_id}")
+        if resp.status_code == 404:
+            return False
+        resp.raise_for_status()
+        data = resp.json()
+        return int(data.get('status') or 1) < 5 and not data.get('is_deleted')
+    except Exception as e:
+        print(f"⚠️ 無法確認工單 #{ticket_id} 狀態，沿用索引: {e}")
+        return True
+
+def verify_entries(entries, glpi, index, checked=None):
+    """回傳 GLPI 上仍未結案的索引紀錄；已人工結案/刪除的工單自索引清除。
+
+    checked 為 {ticket_id: bool} 快取，同一批次內每張工單只查詢一次。
+    """
+    checked = {} if checked is None else checked
+    alive = []
+    for entry in entries:
+        ticket_id = entry['ticket_id']
+        if ticket_id not in checked:
+            checked[ticket_id] = ticket_is_open(ticket_id, glpi)
+            if not checked[ticket_id]:
+                print(f"ℹ️ 工單 #{ticket_id} 已在 GLPI 結案，清除索引紀錄")
+                index.clear_ticket(ticket_id)
+        if checked[ticket_id]:
+            alive.append(entry)
+    return alive
+
+def process_alert(alert, glpi, index=None):
+    """處理單筆告警：恢復通知自動結案，否則去重後開立工單。
+
+    alert 為 dict：title, message 以及可選的 rule, device, faults。
+    有索引時先查本機索引 (並確認工單仍未結案)，未命中才搜尋 GLPI。
+    """
+    title = alert['title']
+    msg = alert.get('message') or "No details provided."
+    fingerprint, base = alert_identity(alert) if index else (None, None)
+
+    if is_recovery_title(title):
+        search_title = alert_key(title)
+        entries = []
+        if index:
+            entry = index.lookup(fingerprint)
+            entries = verify_entries([entry] if entry else index.lookup_base(base), glpi, index)
+
+        if not entries:
+            # 索引未命中：搜尋對應的未結工單 (移除 'Recovery' 字樣以匹配原始告警)
+            ticket_id = search_ticket(search_title, glpi)
+            entries = [{'fingerprint': fingerprint, 'ticket_id': ticket_id}] if ticket_id else []
+
+        if not entries:
             print(f"ℹ️ 未發現相關未結工單 ('{search_title}')，忽略此恢復通知。")
+        for entry in entries:
+            if index and entry['fingerprint'] and index.open_count(entry['ticket_id']) > 1:
+                # 聚合工單：尚有其他設備未恢復，只記錄恢復不結案
+                index.clear(entry['fingerprint'])
+                add_followup(entry['ticket_id'], f"{alert.get('device') or search_title} 已恢復: {msg}", glpi)
+                continue
+            print(f"🔍 發現未結工單 #{entry['ticket_id']}，執行自動結案...")
+            if resolve_ticket(entry['ticket_id'], msg, glpi) and index and entry['fingerprint']:
+                index.clear(entry['fingerprint'])
     else:
         # 下載/開立新工單
-        urgency = 3
-        if "Device Down" in title or "Critical" in title: urgency = 5
-        elif "Warning" in title: urgency = 3
-        
-        # 檢查是否已有重複工單 (避免重複開單)
-        if search_ticket(title, session_token):
+        urgency = urgency_for(title)
+
+        # 檢查是否已有重複工單 (避免重複開單)：本機索引 -> GLPI 搜尋
+        entry = index.lookup(fingerprint) if index else None
+        if entry and verify_entries([entry], glpi, index):
+            print(f"ℹ️ 工單 #{entry['ticket_id']} 已存在 ('{title}')，跳過開單。")
+            return
+
+        ticket_id = search_ticket(title, glpi)
+        if ticket_id:
             print(f"ℹ️ 工單已存在 ('{title}')，跳過開單。")
         else:
-            create_ticket(title, msg, urgency, session_token)
+            ticket_id = create_ticket(title, msg, urgency, glpi)
+        if ticket_id and index:
+            index.record(fingerprint, base, ticket_id, title)
+
+def process_storm(group, alerts, glpi, index, parent_id=None):
+    """以單一 Parent 工單處理同一群組的告警風暴，回傳 Parent Ticket ID。
+
+    group 為 (類型, 名稱)，例如 ('upstream', 'dist-sw1') 或 ('site', 'hq')。
+    parent_id 仍有未結告警時，新告警以 Followup 附加至該工單。
+    """
+    checked = {}
+    pending = []
+    for alert in alerts:
+        fingerprint, base = alert_identity(alert)
+        entry = index.lookup(fingerprint)
+        if entry and verify_entries([entry], glpi, index, checked):
+            continue  # 已有工單，不重複處理
+        pending.append((alert, fingerprint, base))
+    if not pending:
+        return parent_id
+
+    kind, name = group
+    label = {'upstream': '上游設備', 'site': 'Site', 'rule': '規則'}.get(kind, kind)
+    lines = "\n".join(f"- {a.get('device') or '?'}: {a['title']}" for a, _, _ in pending)
+
+    if parent_id and index.open_count(parent_id) > 0 and \
+            verify_entries([{'ticket_id': parent_id}], glpi, index, checked):
+        add_followup(parent_id, f"新增 {len(pending)} 台受影響設備:\n{lines}", glpi)
+    else:
+        title = f"[Alert Storm] {label} {name}: {len(pending)} 台設備告警"
+        content = f"告警風暴聚合 ({label}: {name})，受影響設備:\n{lines}"
+        urgency = max(urgency_for(a['title']) for a, _, _ in pending)
+        parent_id = create_ticket(title, content, urgency, glpi)
+        if not parent_id:
+            raise RuntimeError(f"Parent 工單建立失敗 ({kind}={name})")
+
+    # 每筆子告警都指向 Parent，全部恢復後才結案
+    for alert, fingerprint, base in pending:
+        index.record(fingerprint, base, parent_id, alert['title'])
+    return parent_id
+
+def send_to_daemon(alert, timeout=2):
+    """將告警交給常駐 Daemon；成功排入佇列回傳 True，否則回傳 False。"""
+    if not ALERT_DAEMON_SOCKET or not os.path.exists(ALERT_DAEMON_SOCKET):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(ALERT_DAEMON_SOCKET)
+            sock.sendall(json.dumps(alert, ensure_ascii=False).encode() + b"\n")
+            reply = json.loads(sock.makefile('rb').readline() or b'{}')
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Daemon 無法連線，改為直接處理: {e}")
+        return False
+    if reply.get('status') != 'queued':
+        print(f"⚠️ Daemon 拒絕告警 ({reply.get('status')})，改為直接處理")
+        return False
+    return True
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='LibreNMS Alert -> GLPI Ticket')
+    parser.add_argument('title', help="告警標題")
+    parser.add_argument('message', nargs='?', default="No details provided.", help="告警內容")
+    parser.add_argument('--rule', help="告警規則名稱 (Fingerprint 用)")
+    parser.add_argument('--device', help="設備 Hostname (Fingerprint 用)")
+    parser.add_argument('--faults', help="Faults (JSON 或逗號分隔，Fingerprint 用)")
+    parser.add_argument('--site', help="設備 Location (無 NetBox 時，告警風暴依此分組)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 librenms_alert_glpi.py '<Title>' '<Message>' [--rule R] [--device D] [--faults F] [--site S]")
+        sys.exit(1)
+
+    args = parse_args()
+    alert = {'title': args.title, 'message': args.message,
+             'rule': args.rule, 'device': args.device, 'faults': args.faults, 'site': args.site}
 
-    kill_session(session_token, headers)
+    if send_to_daemon(alert):
+        print(f"📨 告警已交由 Daemon 處理: {args.title}")
+        sys.exit(0)
 
+    # 取得 (快取的) Session，不再每次 initSession / killSession
+    process_alert(alert, init_session(), open_index())
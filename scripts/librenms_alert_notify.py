@@ -3,15 +3,16 @@
 # librenms_alert_notify.py - LibreNMS 通用 IM 通知腳本
 # =============================================================================
 # 用途：將告警內容發送到指定的 Webhook URL (支援 LINE/Teams/Slack)
-# 配置：在 .env 中設定 IM_WEBHOOK_URL
+# 配置：在 .env 中設定 IM_WEBHOOK_URL (多個目的地以逗號分隔)
+# 派送：經由 notify_dispatcher.py (Outbox + 摘要合併 + 限速 + 重試)
 # =============================================================================
 
 import os
 import sys
-import json
-import requests
 from dotenv import load_dotenv
 
+from notify_dispatcher import enqueue, classify, parse_channels, DRAIN_TIMEOUT, SEND_TIMEOUT
+
 # 載入設定
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(BASE_DIR, '.env')
@@ -25,44 +26,16 @@ def send_notification(title, message):
         print("⚠️ 未設定 IM_WEBHOOK_URL，跳過通知。")
         return
 
-    # 根據標題判斷顏色/圖示 (簡易適配 Teams/Slack)
-    status = "info"
-    color = "00FF00" # Green
-    if "Device Down" in title or "Critical" in title:
-        status = "error"
-        color = "FF0000" # Red
-    elif "Warning" in title:
-        status = "warning"
-        color = "FFA500" # Orange
-    elif "Recovery" in title or "OK" in title:
-        status = "success"
-        color = "00FF00"
-
+    # 通知先寫入本機 Outbox，由 notify_dispatcher 依 Channel 合併摘要、限速並重試；
+    # 常駐派送未啟動時會在此立即送出 (受限速保護，未送出者保留於 Outbox)。
+    # LibreNMS 依序執行各 Transport，等待上限不超過舊版單次 POST 的 Timeout，避免拖慢後續 Transport
     try:
-        # 通用 Payload 設計 (同時兼容部分 Microsoft Teams connector 與 Slack incoming webhook)
-        # 對於 LINE Notify，需要 application/x-www-form-urlencoded，這裡暫以 JSON 為主
-        # 若需要 LINE Notify，需修改 header 與 payload 格式
-        
-        headers = {'Content-Type': 'application/json'}
-        payload = {
-            "title": title,
-            "text": message,
-            "themeColor": color,
-            "summary": f"{title} - {message}"
-        }
-        
-        # 針對 LINE Notify 的特別處理 (如果 URL 包含 line.me)
-        if "line.me" in IM_WEBHOOK_URL:
-            headers = {'Authorization': f'Bearer {IM_WEBHOOK_URL.split("/")[-1]}'} # 假設 URL 只有 Token 或者是標準 API
-            # LINE Notify API: https://notify-api.line.me/api/notify
-            # 這裡簡單處理：若 URL 是 API Endpoint
-            requests.post(IM_WEBHOOK_URL, headers=headers, data={'message': f"\n[{status.upper()}] {title}\n{message}"})
+        sent = enqueue(title, message, classify(title), channels=parse_channels(IM_WEBHOOK_URL),
+                       timeout=min(DRAIN_TIMEOUT, SEND_TIMEOUT))
+        if sent:
+            print(f"✅ 通知已發送: {title}")
         else:
-            # Default JSON Webhook
-            requests.post(IM_WEBHOOK_URL, headers=headers, json=payload, timeout=10)
-
-        print(f"✅ 通知已發送: {title}")
-        
+            print(f"📥 通知已排入佇列: {title}")
     except Exception as e:
         print(f"❌ 通知發送失敗: {e}")
 
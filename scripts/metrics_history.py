@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# =============================================================================
+# metrics_history.py - 同步執行紀錄 (SQLite WAL，保留歷史供趨勢分析)
+# =============================================================================
+# 用途：metrics_*.json 每次執行都會覆寫，只看得到最後一次。utils.save_metrics
+#       另外將每次執行 (耗時、統計、API 請求數) 寫入此資料庫：
+#   - runs     每次執行一筆 (保留 METRICS_HISTORY_RETENTION_DAYS 天)
+#   - rollups  每小時 / 每日彙總 (寫入時以 UPSERT 累加，不需另外排程)；
+#              每小時彙總保留 METRICS_HISTORY_HOURLY_DAYS 天，每日彙總永久保留。
+#   每 15 分鐘一次的寫入只是一個 Transaction (1 筆 INSERT + 2 筆 UPSERT)。
+#
+# 設定：
+#   METRICS_HISTORY_DB              預設 /var/lib/it_nexus/metrics_history.db (設為 off 停用)
+#   METRICS_HISTORY_RETENTION_DAYS  預設 90
+#   METRICS_HISTORY_HOURLY_DAYS     預設 400
+#
+# 用法：
+#   python3 metrics_history.py summary [--source S] [--days 7]      # 執行次數、p50/p95 耗時
+#   python3 metrics_history.py rollup [--period hour|day] [--source S] [--days 14]
+#   python3 metrics_history.py runs [--source S] [--limit 20]
+#   python3 metrics_history.py regressions [--hours 24] [--baseline-days 7] [--threshold 1.5]
+#       (有退化時 Exit Code 1，可供監控使用)
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+
+DEFAULT_HISTORY_DB = '/var/lib/it_nexus/metrics_history.db'
+RETENTION_DAYS = float(os.getenv('METRICS_HISTORY_RETENTION_DAYS', '90'))
+HOURLY_DAYS = float(os.getenv('METRICS_HISTORY_HOURLY_DAYS', '400'))
+PERIOD_FORMATS = {'hour': '%Y-%m-%dT%H:00', 'day': '%Y-%m-%d'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts          REAL NOT NULL,
+    source      TEXT NOT NULL,
+    duration    REAL,
+    failed      INTEGER NOT NULL DEFAULT 0,
+    requests    INTEGER NOT NULL DEFAULT 0,
+    api_errors  INTEGER NOT NULL DEFAULT 0,
+    api_seconds REAL NOT NULL DEFAULT 0,
+    stats       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_source_ts ON runs(source, ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    period       TEXT NOT NULL,
+    bucket       TEXT NOT NULL,
+    source       TEXT NOT NULL,
+    runs         INTEGER NOT NULL,
+    failed_runs  INTEGER NOT NULL,
+    duration_sum REAL NOT NULL,
+    duration_min REAL,
+    duration_max REAL,
+    requests     INTEGER NOT NULL,
+    api_errors   INTEGER NOT NULL,
+    api_seconds  REAL NOT NULL,
+    PRIMARY KEY (period, bucket, source)
+);
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (period, bucket, source, runs, failed_runs, duration_sum, duration_min, duration_max,
+                     requests, api_errors, api_seconds)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (period, bucket, source) DO UPDATE SET
+    runs = runs + 1,
+    failed_runs = failed_runs + excluded.failed_runs,
+    duration_sum = duration_sum + excluded.duration_sum,
+    duration_min = min(coalesce(duration_min, excluded.duration_min), excluded.duration_min),
+    duration_max = max(coalesce(duration_max, excluded.duration_max), excluded.duration_max),
+    requests = requests + excluded.requests,
+    api_errors = api_errors + excluded.api_errors,
+    api_seconds = api_seconds + excluded.api_seconds
+"""
+
+
+def history_path():
+    """未設定時使用預設路徑；設為 off/none/空字串時回傳 None (停用)。"""
+    path = os.getenv('METRICS_HISTORY_DB', DEFAULT_HISTORY_DB).strip()
+    return None if path.lower() in ('', 'off', 'none', '0') else path
+
+
+def run_failed(stats):
+    """同步統計是否代表失敗 (failed/errors > 0；管線任一階段非 ok)。"""
+    if 'stages' in stats:
+        return any(r.get('status') != 'ok' or run_failed(r.get('stats') or {}) for r in stats['stages'].values())
+    return bool(stats.get('failed') or stats.get('errors'))
+
+
+def percentile(values, q):
+    """Nearest-rank 百分位數 (q 為 0~100)；無資料回傳 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+class MetricsHistory:
+
+    def __init__(self, path=None):
+        self.path = path or history_path() or DEFAULT_HISTORY_DB
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    # --- 寫入 ---
+    def record(self, source, stats, duration=None, requests=0, api_errors=0, api_seconds=0.0, ts=None):
+        ts = time.time() if ts is None else ts
+        failed = int(run_failed(stats))
+        local = time.localtime(ts)
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (ts, source, duration, failed, requests, api_errors, api_seconds, stats) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts, source, duration, failed, requests, api_errors, api_seconds,
+                 json.dumps(stats, ensure_ascii=False, default=str)),
+            )
+            for period, fmt in PERIOD_FORMATS.items():
+                self._conn.execute(UPSERT_ROLLUP, (period, time.strftime(fmt, local), source, failed,
+                                                   duration or 0.0, duration, duration,
+                                                   requests, api_errors, api_seconds))
+            self._prune(ts)
+
+    def _prune(self, now):
+        self._conn.execute("DELETE FROM runs WHERE ts < ?", (now - RETENTION_DAYS * 86400,))
+        cutoff = time.strftime(PERIOD_FORMATS['hour'], time.localtime(now - HOURLY_DAYS * 86400))
+        self._conn.execute("DELETE FROM rollups WHERE period = 'hour' AND bucket < ?", (cutoff,))
+
+    # --- 查詢 ---
+    def sources(self):
+        return [r[0] for r in self._conn.execute("SELECT DISTINCT source FROM runs ORDER BY source")]
+
+    def runs(self, source=None, since=None, until=None, limit=None):
+        sql, params = "SELECT * FROM runs WHERE 1=1", []
+        if source:
+            sql += " AND source = ?"
+            params.append(source)
+        if since is not None:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND ts < ?"
+            params.append(until)
+        sql += " ORDER BY ts DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def rollups(self, period='hour', source=None, since=None):
+        sql, params = "SELECT * FROM rollups WHERE period = ?", [period]
+        if source:
+            sql += " AND source = ?"
+            params.append(source)
+        if since is not None:
+            sql += " AND bucket >= ?"
+            params.append(time.strftime(PERIOD_FORMATS[period], time.localtime(since)))
+        sql += " ORDER BY bucket, source"
+        return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def summary(self, source=None, since=None, until=None):
+        """依來源彙總：執行次數、失敗次數、耗時 p50/p95/max、平均 API 請求數。"""
+        result = {}
+        for src in ([source] if source else self.sources()):
+            rows = self.runs(src, since, until)
+            if not rows:
+                continue
+            durations = [r['duration'] for r in rows if r['duration'] is not None]
+            result[src] = {
+                'runs': len(rows),
+                'failed': sum(r['failed'] for r in rows),
+                'p50': percentile(durations, 50),
+                'p95': percentile(durations, 95),
+                'max': max(durations) if durations else None,
+                'requests_p50': percentile([r['requests'] for r in rows], 50),
+            }
+        return result
+
+    def regressions(self, hours=24, baseline_days=7, threshold=1.5, min_runs=3, now=None):
+        """最近 hours 小時的 p50/p95 耗時或 API 請求數相較前 baseline_days 天超過 threshold 倍者。"""
+        now = time.time() if now is None else now
+        split = now - hours * 3600
+        recent = self.summary(since=split)
+        baseline = self.summary(since=split - baseline_days * 86400, until=split)
+        found = []
+        for src, cur in recent.items():
+            base = baseline.get(src)
+            if not base or cur['runs'] < min_runs or base['runs'] < min_runs:
+                continue
+            for key in ('p50', 'p95', 'requests_p50'):
+                if cur[key] is None or not base[key]:
+                    continue
+                ratio = cur[key] / base[key]
+                if ratio >= threshold:
+                    found.append({'source': src, 'metric': key, 'baseline': base[key],
+                                  'recent': cur[key], 'ratio': round(ratio, 2)})
+        return found
+
+
+def record_run(source, stats, duration=None, timing=None):
+    """utils.save_metrics 用：寫入一筆執行紀錄 (timing 為 instrumentation.summary())。"""
+    path = history_path()
+    if not path:
+        return
+    api = (timing or {}).get('api', [])
+    errors = (timing or {}).get('api_errors', [])
+    history = MetricsHistory(path)
+    try:
+        history.record(source, stats, duration,
+                       requests=sum(r['count'] for r in api),
+                       api_errors=sum(r['count'] for r in errors),
+                       api_seconds=round(sum(r['seconds'] for r in api), 4))
+    finally:
+        history.close()
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+def _fmt(seconds):
+    return '-' if seconds is None else f"{seconds:.1f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IT Nexus Metrics History')
+    parser.add_argument('--db', help=f"資料庫路徑 (預設 METRICS_HISTORY_DB 或 {DEFAULT_HISTORY_DB})")
+    sub = parser.add_subparsers(dest='command', required=True)
+    summary = sub.add_parser('summary', help="各來源執行次數與 p50/p95 耗時")
+    summary.add_argument('--source')
+    summary.add_argument('--days', type=float, default=7)
+    rollup = sub.add_parser('rollup', help="每小時 / 每日彙總")
+    rollup.add_argument('--period', choices=list(PERIOD_FORMATS), default='day')
+    rollup.add_argument('--source')
+    rollup.add_argument('--days', type=float, default=14)
+    runs = sub.add_parser('runs', help="最近的執行紀錄")
+    runs.add_argument('--source')
+    runs.add_argument('--limit', type=int, default=20)
+    regress = sub.add_parser('regressions', help="與基準期間比較，列出耗時或請求數退化的來源")
+    regress.add_argument('--hours', type=float, default=24, help="最近期間 (小時)")
+    regress.add_argument('--baseline-days', type=float, default=7, help="基準期間 (最近期間之前的天數)")
+    regress.add_argument('--threshold', type=float, default=1.5, help="退化倍數門檻")
+    args = parser.parse_args()
+
+    history = MetricsHistory(args.db)
+    try:
+        if args.command == 'summary':
+            result = history.summary(args.source, since=time.time() - args.days * 86400)
+            print(f"{'source':<22}{'runs':>6}{'failed':>8}{'p50':>9}{'p95':>9}{'max':>9}{'req p50':>9}")
+            for src, s in result.items():
+                print(f"{src:<22}{s['runs']:>6}{s['failed']:>8}{_fmt(s['p50']):>9}{_fmt(s['p95']):>9}"
+                      f"{_fmt(s['max']):>9}{s['requests_p50']:>9}")
+        elif args.command == 'rollup':
+            rows = history.rollups(args.period, args.source, since=time.time() - args.days * 86400)
+            print(f"{args.period:<17}{'source':<22}{'runs':>6}{'failed':>8}{'avg':>9}{'max':>9}{'requests':>10}{'errors':>8}")
+            for r in rows:
+                avg = r['duration_sum'] / r['runs'] if r['runs'] else None
+                print(f"{r['bucket']:<17}{r['source']:<22}{r['runs']:>6}{r['failed_runs']:>8}{_fmt(avg):>9}"
+                      f"{_fmt(r['duration_max']):>9}{r['requests']:>10}{r['api_errors']:>8}")
+        elif args.command == 'runs':
+            for r in history.runs(args.source, limit=args.limit):
+                ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r['ts']))
+                state = 'FAILED' if r['failed'] else 'ok'
+                print(f"{ts} {r['source']:<22} {_fmt(r['duration']):>8} requests={r['requests']} "
+                      f"errors={r['api_errors']} {state}")
+        elif args.command == 'regressions':
+            found = history.regressions(args.hours, args.baseline_days, args.threshold)
+            for f in found:
+                print(f"⚠ {f['source']} {f['metric']}: {f['baseline']:.1f} -> {f['recent']:.1f} (x{f['ratio']})")
+            if not found:
+                print("✅ 無退化")
+            return 1 if found else 0
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# =============================================================================
+# notify_dispatcher.py - 批次化、限速的 IM 通知派送器
+# =============================================================================
+# 用途：告警風暴時逐筆同步 POST 會觸發 Teams/LINE 的速率限制而遺失訊息。
+#   - 通知先寫入本機 SQLite Outbox (重啟不遺失)，每個目的地 (Channel) 一個佇列。
+#   - 每個 Channel 由獨立執行緒派送 (多目的地並行)，並依 NOTIFY_RATE_PER_MIN
+#     限制發送頻率 (跨行程共用，記錄於 Outbox)。
+#   - NOTIFY_DIGEST_WINDOW 秒內累積的多筆通知合併為一則摘要訊息。
+#   - 發送失敗以 Exponential Backoff 重試，超過 NOTIFY_MAX_ATTEMPTS 次移入 dead 狀態。
+#
+# 用法：
+#   python3 notify_dispatcher.py serve    # 常駐派送 (建議，見 systemd/notify-dispatcher.service)
+#   python3 notify_dispatcher.py drain    # 立即送出所有到期通知 (--timeout N 等待限速中的通知)
+#   python3 notify_dispatcher.py status   # 顯示各 Channel 佇列狀態
+#
+# 未啟動常駐派送時，enqueue 的呼叫端會自行 drain，並等待因限速而暫緩的通知送出
+# (最多 NOTIFY_DRAIN_TIMEOUT 秒，預設 10，與舊版單次 POST 的 Timeout 相同)，避免風暴
+# 最後幾則 (含恢復通知) 滯留於 Outbox；發送失敗待重試者不等待，留給下次呼叫或常駐派送。
+# Outbox 無法開啟 (目錄不存在或無寫入權限) 時改為直接發送。
+# =============================================================================
+
+import os
+import time
+import signal
+import sqlite3
+import logging
+import argparse
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX_DB = '/var/lib/it_nexus/notify_outbox.db'
+RATE_PER_MIN = float(os.getenv('NOTIFY_RATE_PER_MIN', '20'))
+DIGEST_WINDOW = float(os.getenv('NOTIFY_DIGEST_WINDOW', '30'))
+DIGEST_MAX = int(os.getenv('NOTIFY_DIGEST_MAX', '50'))
+MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '8'))
+DRAIN_TIMEOUT = float(os.getenv('NOTIFY_DRAIN_TIMEOUT', '10'))
+SEND_TIMEOUT = 10
+HEARTBEAT_TTL = 15
+POLL_INTERVAL = 1.0
+
+STATUS_COLORS = {'error': 'FF0000', 'warning': 'FFA500', 'success': '00FF00', 'info': '00FF00'}
+STATUS_RANK = {'info': 0, 'success': 0, 'warning': 1, 'error': 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel         TEXT NOT NULL,
+    title           TEXT NOT NULL,
+    message         TEXT,
+    status          TEXT NOT NULL DEFAULT 'info',
+    state           TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    created_at      REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(channel, state, next_attempt_at);
+CREATE TABLE IF NOT EXISTS channel_state (
+    channel      TEXT PRIMARY KEY,
+    last_sent_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+def classify(title):
+    """依標題判斷通知等級。"""
+    if "Device Down" in title or "Critical" in title:
+        return 'error'
+    if "Warning" in title:
+        return 'warning'
+    if "Recovery" in title or "OK" in title:
+        return 'success'
+    return 'info'
+
+
+def parse_channels(value):
+    """將逗號分隔的 Webhook URL 轉為 Channel 清單。"""
+    return [c.strip() for c in (value or '').split(',') if c.strip()]
+
+
+class Outbox:
+    """SQLite Outbox (WAL)；每次操作使用獨立連線，可跨執行緒與行程共用。"""
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('NOTIFY_OUTBOX_DB', DEFAULT_OUTBOX_DB)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _run(self, sql, params=()):
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def add(self, channels, title, message, status):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO outbox (channel, title, message, status, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(c, title, message, status, now, now) for c in channels],
+                )
+        finally:
+            conn.close()
+
+    def channels(self):
+        return [r['channel'] for r in self._run("SELECT DISTINCT channel FROM outbox WHERE state = 'pending'")]
+
+    def due(self, channel, limit=DIGEST_MAX):
+        return self._run(
+            "SELECT * FROM outbox WHERE channel = ? AND state = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (channel, time.time(), limit),
+        )
+
+    def next_attempt(self, channel, retries=True):
+        """Channel 中最早可發送的 pending 時間；無 pending 回傳 None。retries=False 時不含失敗待重試者。"""
+        sql = "SELECT MIN(next_attempt_at) AS t FROM outbox WHERE channel = ? AND state = 'pending'"
+        rows = self._run(sql if retries else sql + " AND attempts = 0", (channel,))
+        return rows[0]['t']
+
+    def delete(self, ids):
+        self._run(f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+    def fail(self, rows, error):
+        """記錄失敗並安排 Backoff 重試；超過上限者標記為 dead。"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                for r in rows:
+                    attempts = r['attempts'] + 1
+                    state = 'dead' if attempts >= MAX_ATTEMPTS else 'pending'
+                    delay = min(5 * 2 ** attempts, 600)
+                    conn.execute(
+                        "UPDATE outbox SET attempts = ?, state = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, state, now + delay, str(error)[:500], r['id']),
+                    )
+        finally:
+            conn.close()
+
+    def reserve_send(self, channel, min_interval):
+        """限速檢查：距上次發送已超過 min_interval 則登記本次發送並回傳 0，否則回傳需等待秒數。"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute("SELECT last_sent_at FROM channel_state WHERE channel = ?", (channel,)).fetchone()
+                now = time.time()
+                wait = (row['last_sent_at'] + min_interval - now) if row else 0
+                if wait > 0:
+                    return wait
+                conn.execute("INSERT OR REPLACE INTO channel_state (channel, last_sent_at) VALUES (?, ?)", (channel, now))
+                return 0
+        finally:
+            conn.close()
+
+    def heartbeat(self):
+        self._run("INSERT OR REPLACE INTO meta (key, value) VALUES ('heartbeat', ?)", (time.time(),))
+
+    def dispatcher_alive(self):
+        rows = self._run("SELECT value FROM meta WHERE key = 'heartbeat'")
+        return bool(rows) and time.time() - rows[0]['value'] < HEARTBEAT_TTL
+
+    def summary(self):
+        return self._run("SELECT channel, state, COUNT(*) AS n, MIN(created_at) AS oldest FROM outbox GROUP BY channel, state")
+
+
+def build_digest(rows):
+    """將多筆通知合併為 (title, message, status)。"""
+    if len(rows) == 1:
+        return rows[0]['title'], rows[0]['message'] or '', rows[0]['status']
+    status = max((r['status'] for r in rows), key=lambda s: STATUS_RANK.get(s, 0))
+    counts = {}
+    for r in rows:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    title = f"[IT Nexus] {len(rows)} 則通知 (" + ", ".join(f"{k} x{v}" for k, v in sorted(counts.items())) + ")"
+    lines = [f"- [{r['status'].upper()}] {r['title']}" + (f": {r['message']}" if r['message'] else '') for r in rows]
+    return title, "\n".join(lines)[:4000], status
+
+
+def send(http, channel, title, message, status, timeout=SEND_TIMEOUT):
+    """依目的地格式送出一則訊息 (LINE Notify 或通用 JSON Webhook)。"""
+    if "line.me" in channel:
+        # LINE Notify API: 需 application/x-www-form-urlencoded
+        headers = {'Authorization': f'Bearer {channel.split("/")[-1]}'}
+        resp = http.post(channel, headers=headers, data={'message': f"\n[{status.upper()}] {title}\n{message}"}, timeout=timeout)
+    else:
+        # 通用 Payload (同時兼容 Microsoft Teams connector 與 Slack incoming webhook)
+        payload = {
+            'text': f"[{status.upper()}] {title}\n{message}",
+            'title': title,
+            'summary': f"{title} - {message}",
+            'themeColor': STATUS_COLORS.get(status, '00FF00'),
+        }
+        resp = http.post(channel, json=payload, timeout=timeout)
+    resp.raise_for_status()
+
+
+def send_direct(channels, title, message, status):
+    """Outbox 無法使用時逐一直接發送 (無合併/限速/重試)，回傳成功數；全部失敗時拋出最後的錯誤。"""
+    http = requests.Session()
+    sent, error = 0, None
+    for channel in channels:
+        try:
+            send(http, channel, title, message, status)
+            sent += 1
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠ 通知直接發送失敗 ({channel[:48]}): {e}")
+            error = e
+    if error and not sent:
+        raise error
+    return sent
+
+
+def dispatch_due(outbox, channel, http, min_interval, timeout=SEND_TIMEOUT):
+    """送出某 Channel 的到期通知 (合併為一則)；回傳 (送出筆數, 需等待秒數)。"""
+    rows = outbox.due(channel)
+    if not rows:
+        return 0, 0
+    wait = outbox.reserve_send(channel, min_interval)
+    if wait > 0:
+        return 0, wait
+    title, message, status = build_digest(rows)
+    try:
+        send(http, channel, title, message, status, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"⚠ 通知發送失敗 ({len(rows)} 筆)，稍後重試: {e}")
+        outbox.fail(rows, e)
+        return 0, 0
+    outbox.delete([r['id'] for r in rows])
+    return len(rows), 0
+
+
+def enqueue(title, message, status=None, channels=None, outbox=None, timeout=None):
+    """將通知寫入 Outbox；若常駐派送未執行，由呼叫端 drain (最多等待 timeout 秒，預設 NOTIFY_DRAIN_TIMEOUT)。
+
+    Outbox 無法開啟或寫入時記錄警告並直接發送 (與未使用 Outbox 的舊版行為相同)。
+    """
+    channels = channels if channels is not None else parse_channels(os.getenv('IM_WEBHOOK_URL'))
+    if not channels:
+        return 0
+    status = status or classify(title)
+    try:
+        outbox = outbox or Outbox()
+        outbox.add(channels, title, message or '', status)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"⚠ 無法使用通知 Outbox ({e})，改為直接發送")
+        return send_direct(channels, title, message or '', status)
+    if not outbox.dispatcher_alive():
+        return drain(outbox, channels, timeout=DRAIN_TIMEOUT if timeout is None else timeout)
+    return 0
+
+
+def drain(outbox=None, channels=None, timeout=0, retries=False):
+    """送出到期通知 (受限速保護)。
+
+    timeout 為 0 時只送一輪，未到時間者留待下次；大於 0 時持續等待限速，
+    直到這些 Channel 沒有 pending 通知 (或已由其他行程送出) 或逾時。
+    retries=True 時也等待發送失敗、排定重試的通知 (CLI drain --timeout)。
+    """
+    outbox = outbox or Outbox()
+    http = requests.Session()
+    channels = channels or outbox.channels()
+    deadline = time.time() + timeout
+    sent = 0
+    while True:
+        ready = []
+        for channel in channels:
+            # 單次請求不超過剩餘的等待時間
+            send_timeout = SEND_TIMEOUT if timeout <= 0 else max(1, min(SEND_TIMEOUT, deadline - time.time()))
+            n, wait = dispatch_due(outbox, channel, http, 60.0 / RATE_PER_MIN, timeout=send_timeout)
+            sent += n
+            nxt = outbox.next_attempt(channel, retries=retries)
+            if nxt is not None:
+                ready.append(max(nxt, time.time() + wait))
+        now = time.time()
+        if not ready or now >= deadline or min(ready) >= deadline:
+            break
+        time.sleep(max(min(ready) - now, 0.05))
+    if ready and timeout > 0:
+        logger.warning("⚠ 仍有通知未送出，保留於 Outbox 待下次派送 (建議啟用 notify-dispatcher.service)")
+    return sent
+
+
+class ChannelWorker(threading.Thread):
+    """單一 Channel 的派送執行緒：等待摘要視窗、限速、重試。"""
+
+    def __init__(self, outbox, channel, stop_event):
+        super().__init__(name=f"notify-{channel[:32]}", daemon=True)
+        self.outbox = outbox
+        self.channel = channel
+        self.stop_event = stop_event
+        self.http = requests.Session()
+
+    def run(self):
+        min_interval = 60.0 / RATE_PER_MIN
+        while not self.stop_event.is_set():
+            rows = self.outbox.due(self.channel, limit=1)
+            if not rows:
+                self.stop_event.wait(POLL_INTERVAL)
+                continue
+            # 自最早一筆起等待摘要視窗，收集同一波通知
+            remaining = rows[0]['created_at'] + DIGEST_WINDOW - time.time()
+            if remaining > 0 and self.stop_event.wait(remaining):
+                break
+            sent, wait = dispatch_due(self.outbox, self.channel, self.http, min_interval)
+            if sent:
+                logger.info(f"📤 已送出 {sent} 則通知 -> {self.channel[:48]}")
+            if wait > 0:
+                self.stop_event.wait(wait)
+
+
+def serve(outbox):
+    stop_event = threading.Event()
+    workers = {}
+
+    def shutdown(signum, frame):
+        logger.info("收到停止訊號，結束派送 (未送出通知保留於 Outbox)")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    logger.info(f"🚀 Notify Dispatcher 啟動: {outbox.path} (rate={RATE_PER_MIN}/min, window={DIGEST_WINDOW}s)")
+    while not stop_event.is_set():
+        outbox.heartbeat()
+        for channel in outbox.channels():
+            if channel not in workers or not workers[channel].is_alive():
+                workers[channel] = ChannelWorker(outbox, channel, stop_event)
+                workers[channel].start()
+        stop_event.wait(POLL_INTERVAL)
+    for w in workers.values():
+        w.join()
+
+
+def main():
+    from utils import setup_logging
+    setup_logging()
+    parser = argparse.ArgumentParser(description='IT Nexus Notification Dispatcher')
+    parser.add_argument('command', choices=['serve', 'drain', 'status'])
+    parser.add_argument('--db', help="Outbox 路徑 (預設 NOTIFY_OUTBOX_DB)")
+    parser.add_argument('--timeout', type=float, default=0, help="drain: 等待限速/重試的最長秒數")
+    args = parser.parse_args()
+
+    outbox = Outbox(args.db)
+    if args.command == 'serve':
+        serve(outbox)
+    elif args.command == 'drain':
+        print(f"已送出 {drain(outbox, timeout=args.timeout, retries=True)} 則通知")
+    else:
+        for r in outbox.summary():
+            age = time.time() - r['oldest']
+            print(f"{r['channel'][:60]:60s} {r['state']:8s} {r['n']:6d} (最舊 {age:.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# =============================================================================
+# port_table.py - 全設備群 Port / Interface 欄位式資料表與差異比對
+# =============================================================================
+# 用途：將所有 LibreNMS Port 與 NetBox Interface 轉為欄位 (column) 陣列，以整批運算
+#       完成過濾、Type 對應、MAC 正規化與兩邊的 Join，輸出精簡的變更集 (change set)：
+#   create  LibreNMS 有、NetBox 沒有的介面 (完整欄位)
+#   update  兩邊都有但欄位不同的介面 ({欄位: [NetBox 值, LibreNMS 值]})
+#   delete  NetBox 有、LibreNMS 已不存在的介面 (僅限有 Port 資料的設備)
+#
+# 欄位語意與 sync_librenms_interfaces.py 的 Clean Sync 相同 (實體介面白名單、名稱 strip 後
+# 截斷 64 字元、描述截斷 200 字元、MTU 為 0 視為未設定)，變更集即 Clean Sync 實際會改動的內容。
+#
+# 安裝 NumPy 時以向量運算處理 (Speed 對應用 searchsorted、Join 用整數 Key 的 intersect1d)；
+# 未安裝時以相同邏輯的純 Python 執行，結果相同。名稱 / MAC / 狀態等重複度高的欄位
+# 只對「不重複值」呼叫 interface_rules 的判斷，再展開回每一列。
+#
+# 用法 (sync_librenms_interfaces.py --plan 即以此產生變更集)：
+#   lib = PortTable.from_librenms(ports, {librenms_device_id: netbox_device_id})
+#   changes = diff(lib, PortTable.from_netbox(interfaces))
+# =============================================================================
+
+from interface_rules import LAG_PREFIXES, SPEED_TIERS, is_physical_interface
+
+try:
+    import numpy as np
+except ImportError:  # 選用相依套件，未安裝時使用純 Python
+    np = None
+
+HAVE_NUMPY = np is not None
+
+FIELDS = ('type', 'enabled', 'mtu', 'description', 'mac')   # 比對的欄位
+COLUMNS = ('id', 'device', 'name') + FIELDS
+NAME_MAX = 64           # NetBox Interface 名稱長度限制
+DESCRIPTION_MAX = 200
+
+HEX_DIGITS = set('0123456789abcdefABCDEF')
+
+# Speed 門檻 (由低至高) 與對應 Type；索引 0 為未達最低門檻的 other
+_THRESHOLDS = [speed for speed, _ in reversed(SPEED_TIERS)]
+_TIER_TYPES = ['other'] + [t for _, t in reversed(SPEED_TIERS)]
+
+
+def normalize_mac(raw_mac):
+    """MAC 正規化為大寫冒號格式 (LibreNMS 原始值與 NetBox 值皆適用)，無效時為 None。"""
+    if not raw_mac:
+        return None
+    mac = str(raw_mac).strip().replace(':', '').replace('-', '').replace('.', '')
+    if len(mac) != 12 or mac.replace('0', '') == '' or not set(mac) <= HEX_DIGITS:
+        return None
+    mac = mac.upper()
+    return ':'.join(mac[i:i+2] for i in range(0, 12, 2))
+
+
+def _speed_type(speed):
+    for threshold, type_slug in SPEED_TIERS:
+        if speed >= threshold:
+            return type_slug
+    return 'other'
+
+
+def _clean_name(name):
+    return name.strip()[:NAME_MAX]
+
+
+def _is_lag(name):
+    return name.strip().startswith(LAG_PREFIXES)
+
+
+def _factorize(values, codes):
+    """每個值編為整數代碼 (codes 為共用的 {值: 代碼})。
+
+    以 dict 雜湊編碼，比 np.unique 對 object 陣列排序 (逐一 Python 比較) 快。
+    """
+    return np.fromiter((codes.setdefault(v, len(codes)) for v in values), np.int64, len(values))
+
+
+def _map_unique(values, func, vectorized, dtype=object):
+    """對不重複值呼叫 func 後展開回每一列 (名稱、MAC 等欄位在設備群中高度重複)。"""
+    if vectorized:
+        codes = {}
+        inverse = _factorize(values, codes)
+        return np.array([func(v) for v in codes], dtype=dtype)[inverse]
+    cache = {}
+    return [cache[v] if v in cache else cache.setdefault(v, func(v)) for v in values]
+
+
+def _field(obj, key):
+    # pynetbox Record 或 API 回傳的 dict 皆可
+    return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+
+def _choice_value(value):
+    # 選項欄位 (type) 為 {'value': ..., 'label': ...}
+    return _field(value, 'value') if value is not None and not isinstance(value, str) else value
+
+
+def _netbox_mac(iface):
+    # NetBox 4.2+ 為 primary_mac_address 物件，舊版為 mac_address 字串
+    primary = _field(iface, 'primary_mac_address')
+    if primary is not None:
+        return _field(primary, 'mac_address') if not isinstance(primary, str) else primary
+    return _field(iface, 'mac_address')
+
+
+def _int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class PortTable:
+    """欄位式介面資料表：每個欄位一個等長陣列 (NumPy 或 list)，第 i 列為第 i 個介面。
+
+    id 為 NetBox Interface ID (LibreNMS 端為 0)，device 為 NetBox Device ID，mtu 0 表示未設定。
+    """
+
+    def __init__(self, columns, vectorized=HAVE_NUMPY):
+        self.vectorized = bool(vectorized and HAVE_NUMPY)
+        if self.vectorized:
+            dtypes = {'id': np.int64, 'device': np.int64, 'mtu': np.int64, 'enabled': bool}
+            self.columns = {k: np.asarray(columns[k], dtype=dtypes.get(k, object)) for k in COLUMNS}
+        else:
+            self.columns = {k: list(columns[k]) for k in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def rows(self, index, keys=COLUMNS):
+        """指定列轉為 dict 清單 (Python 原生型別，可直接輸出 JSON)；逐欄取出後再組合。"""
+        if self.vectorized:
+            index = np.asarray(index, dtype=np.int64)
+            columns = [self.columns[k][index].tolist() for k in keys]
+        else:
+            columns = [[self.columns[k][i] for i in index] for k in keys]
+        result = [dict(zip(keys, values)) for values in zip(*columns)]
+        if 'mtu' in keys:
+            for row in result:
+                row['mtu'] = row['mtu'] or None
+        return result
+
+    @classmethod
+    def from_librenms(cls, ports, device_ids, vectorized=HAVE_NUMPY):
+        """由 LibreNMS Port 清單 (需含 device_id) 建立；device_ids 為 {LibreNMS ID: NetBox Device ID}。
+
+        不在 device_ids 中的設備與非實體介面會被略過。
+        """
+        vectorized = bool(vectorized and HAVE_NUMPY)
+        devices, names, speeds, admin, mtus, descriptions, macs = [], [], [], [], [], [], []
+        for p in ports:
+            device = device_ids.get(p.get('device_id'))
+            if device is None:
+                continue
+            devices.append(device)
+            names.append(p.get('ifName') or '')
+            speeds.append(_int(p.get('ifSpeed')))
+            admin.append(str(p.get('ifAdminStatus', '')).lower())
+            mtus.append(_int(p.get('ifMtu')))
+            descriptions.append((p.get('ifAlias') or p.get('ifDescr') or '')[:DESCRIPTION_MAX])
+            macs.append(p.get('ifPhysAddress') or '')
+
+        raw = {'device': devices, 'name': names, 'speed': speeds, 'admin': admin,
+               'mtu': mtus, 'description': descriptions, 'mac': macs}
+        if vectorized:
+            raw = {k: np.asarray(v, dtype=np.int64 if k in ('device', 'speed', 'mtu') else object)
+                   for k, v in raw.items()}
+
+        # 1. 過濾：僅保留實體介面
+        physical = _map_unique(raw['name'], is_physical_interface, vectorized, bool)
+        if vectorized:
+            raw = {k: v[physical] for k, v in raw.items()}
+        else:
+            raw = {k: [x for x, keep in zip(v, physical) if keep] for k, v in raw.items()}
+        names = raw['name']
+
+        # 2. Type：LAG 前綴優先，其餘依 Speed 門檻
+        lag = _map_unique(names, _is_lag, vectorized, bool)
+        if vectorized:
+            tiers = np.searchsorted(np.asarray(_THRESHOLDS, dtype=np.int64), raw['speed'], side='right')
+            types = np.where(lag, 'lag', np.asarray(_TIER_TYPES, dtype=object)[tiers])
+            enabled = raw['admin'] == 'up'
+        else:
+            types = ['lag' if is_lag else _speed_type(speed) for is_lag, speed in zip(lag, raw['speed'])]
+            enabled = [status == 'up' for status in raw['admin']]
+
+        return cls({
+            'id': [0] * len(names),
+            'device': raw['device'],
+            'name': _map_unique(names, _clean_name, vectorized),
+            'type': types,
+            'enabled': enabled,
+            'mtu': raw['mtu'],
+            'description': raw['description'],
+            'mac': _map_unique(raw['mac'], normalize_mac, vectorized),
+        }, vectorized)
+
+    @classmethod
+    def from_netbox(cls, interfaces, vectorized=HAVE_NUMPY):
+        """由 NetBox Interface (pynetbox Record 或 API dict) 建立。"""
+        vectorized = bool(vectorized and HAVE_NUMPY)
+        columns = {k: [] for k in COLUMNS}
+        for iface in interfaces:
+            device = _field(iface, 'device')
+            columns['id'].append(_field(iface, 'id'))
+            columns['device'].append(_field(device, 'id') if device is not None else 0)
+            columns['name'].append(_field(iface, 'name') or '')
+            columns['type'].append(_choice_value(_field(iface, 'type')))
+            columns['enabled'].append(bool(_field(iface, 'enabled')))
+            columns['mtu'].append(_int(_field(iface, 'mtu')))
+            columns['description'].append(_field(iface, 'description') or '')
+            columns['mac'].append(str(_netbox_mac(iface) or ''))
+        columns['mac'] = _map_unique(columns['mac'], normalize_mac, vectorized)
+        return cls(columns, vectorized)
+
+
+def diff(librenms, netbox, devices=None):
+    """比對兩份 PortTable (以 device + name 為 Key)，回傳變更集 dict。
+
+    devices 為納入比對的 NetBox Device ID (預設為 LibreNMS 表中出現的設備)，
+    僅這些設備上多出的 NetBox Interface 會列入 delete。
+    LibreNMS 同設備同名的 Port 只取第一筆 (與 Clean Sync 重複建立時 NetBox 拒絕第二筆相同)。
+    """
+    if librenms.vectorized and netbox.vectorized:
+        create, pairs, delete, matched = _join_numpy(librenms, netbox, devices)
+    else:
+        librenms, netbox = _as_python(librenms), _as_python(netbox)
+        create, pairs, delete, matched = _join_python(librenms, netbox, devices)
+
+    lib_rows, nb_rows, flags = pairs
+    updates = []
+    for new, old, changed in zip(librenms.rows(lib_rows, FIELDS), netbox.rows(nb_rows), flags):
+        updates.append({'id': old['id'], 'device': old['device'], 'name': old['name'],
+                        'changes': {f: [old[f], new[f]] for f, d in zip(FIELDS, changed) if d}})
+
+    rows = librenms.rows(create, COLUMNS[1:])
+    return {
+        'create': rows,
+        'update': updates,
+        'delete': netbox.rows(delete, ('id', 'device', 'name')),
+        'stats': {
+            'librenms_ports': len(librenms),
+            'netbox_interfaces': len(netbox),
+            'create': len(rows),
+            'update': len(updates),
+            'delete': len(delete),
+            'unchanged': matched - len(updates),
+        },
+    }
+
+
+def _as_python(table):
+    if not table.vectorized:
+        return table
+    return PortTable({k: table[k].tolist() for k in COLUMNS}, False)
+
+
+def _keys(devices, name_codes):
+    # (device, name) 合併為單一 int64 Key：名稱先編碼為整數
+    return (devices.astype(np.int64) << 32) | name_codes.astype(np.int64)
+
+
+def _join_numpy(librenms, netbox, devices):
+    codes = {}
+    lib_keys = _keys(librenms['device'], _factorize(librenms['name'], codes))
+    nb_keys = _keys(netbox['device'], _factorize(netbox['name'], codes))
+
+    # LibreNMS 重複 Key 保留第一筆 (維持原順序)
+    first = np.sort(np.unique(lib_keys, return_index=True)[1])
+    lib_unique = lib_keys[first]
+
+    matched = np.isin(lib_unique, nb_keys)
+    create = first[~matched]
+
+    _, li, ni = np.intersect1d(lib_unique, nb_keys, return_indices=True)
+    order = np.argsort(li)
+    lib_rows, nb_rows = first[li[order]], ni[order]
+    diffs = np.array([librenms[f][lib_rows] != netbox[f][nb_rows] for f in FIELDS],
+                     dtype=bool).reshape(len(FIELDS), -1)
+    changed = diffs.any(axis=0)
+    pairs = (lib_rows[changed], nb_rows[changed], diffs[:, changed].T.tolist())
+
+    scope = np.unique(librenms['device']) if devices is None else np.asarray(sorted(devices), dtype=np.int64)
+    delete = np.flatnonzero(~np.isin(nb_keys, lib_keys) & np.isin(netbox['device'], scope))
+    return create.tolist(), pairs, delete.tolist(), len(lib_rows)
+
+
+def _join_python(librenms, netbox, devices):
+    nb_index = {}
+    for i, key in enumerate(zip(netbox['device'], netbox['name'])):
+        nb_index.setdefault(key, i)
+
+    create, lib_rows, nb_rows, flags, lib_keys = [], [], [], [], set()
+    for i, key in enumerate(zip(librenms['device'], librenms['name'])):
+        if key in lib_keys:
+            continue
+        lib_keys.add(key)
+        j = nb_index.get(key)
+        if j is None:
+            create.append(i)
+            continue
+        changed = [librenms[f][i] != netbox[f][j] for f in FIELDS]
+        if any(changed):
+            lib_rows.append(i)
+            nb_rows.append(j)
+            flags.append(changed)
+
+    scope = set(librenms['device']) if devices is None else set(devices)
+    delete = [j for j, key in enumerate(zip(netbox['device'], netbox['name']))
+              if key not in lib_keys and key[0] in scope]
+    return create, (lib_rows, nb_rows, flags), delete, len(lib_keys) - len(create)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# =============================================================================
+# profiling.py - 同步腳本內建 Profiling (--profile / IT_NEXUS_PROFILE)
+# =============================================================================
+# 用途：不修改 Systemd Unit 即可在正式負載下分析 CPU 與記憶體
+#       (sanitize_string、pynetbox Record 建構、JSON 解析等)。
+#
+#   cpu     cProfile (僅主執行緒；同步腳本的設備處理皆在主執行緒)
+#   sample  每 IT_NEXUS_PROFILE_INTERVAL 秒取樣所有執行緒的 Call Stack (額外負擔低)
+#   兩種模式皆以 tracemalloc 記錄記憶體配置 (IT_NEXUS_PROFILE_FRAMES：保留的 Stack 層數，
+#   預設 1；層數越多負擔越大，0 = 不記錄記憶體)。tracemalloc 在配置頻繁的同步中
+#   可能使執行時間倍增，只看 CPU 時建議 sample + FRAMES=0。
+#
+# 輸出 (IT_NEXUS_PROFILE_DIR，預設 /var/log/it_nexus/profiles/)，<name>-<run_id> 為檔名前綴：
+#   .prof        cProfile 原始資料 (python3 -m pstats / snakeviz)
+#   .folded      取樣模式的 Collapsed Stack (flamegraph.pl / speedscope)
+#   .tracemalloc tracemalloc Snapshot (tracemalloc.Snapshot.load)
+#   .txt         Top-N 摘要 (CPU、重點函式、記憶體配置位置)
+#
+# 用法：
+#   python3 sync_librenms_to_netbox.py --profile            # cpu
+#   python3 sync_librenms_to_netbox.py --profile sample
+#   IT_NEXUS_PROFILE=cpu systemctl start netbox-sync-librenms.service  (Drop-in Environment=)
+# =============================================================================
+
+import io
+import os
+import sys
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+
+from change_feed import new_run_id
+
+PROFILE_DIR = os.getenv('IT_NEXUS_PROFILE_DIR', '/var/log/it_nexus/profiles')
+TOP_N = int(os.getenv('IT_NEXUS_PROFILE_TOP', '30'))
+SAMPLE_INTERVAL = float(os.getenv('IT_NEXUS_PROFILE_INTERVAL', '0.005'))
+TRACEMALLOC_FRAMES = int(os.getenv('IT_NEXUS_PROFILE_FRAMES', '1'))
+MODES = ('cpu', 'sample')
+
+# 摘要中單獨列出的熱點 (pstats 篩選 Regex)
+FOCUS = r'sanitize_string|format_mac|pynetbox|json[/\\]decoder|json[/\\]__init__'
+
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', nargs='?', const='cpu', choices=MODES,
+                        help="啟用 Profiling (cpu 或 sample，預設 cpu)；亦可設定 IT_NEXUS_PROFILE")
+
+
+def resolve_mode(cli_value=None):
+    """CLI 優先，其次 IT_NEXUS_PROFILE (1/true 視為 cpu)；未啟用回傳 None。"""
+    value = (cli_value or os.getenv('IT_NEXUS_PROFILE', '')).strip().lower()
+    if value in ('', '0', 'false', 'off', 'no'):
+        return None
+    if value in ('1', 'true', 'on', 'yes'):
+        return 'cpu'
+    if value not in MODES:
+        raise ValueError(f"IT_NEXUS_PROFILE 不支援: {value} (可用: {', '.join(MODES)})")
+    return value
+
+
+class StackSampler:
+    """背景執行緒定期讀取 sys._current_frames()，累計 Collapsed Stack。"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._raw = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # 取樣時只累計 Code 物件 tuple，結束後才格式化 (降低取樣本身的負擔)
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                self._raw[(ident, tuple(stack))] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def collapse(self):
+        """Collapsed Stack: {"執行緒;外層;...;內層": 樣本數}。"""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        for (ident, codes), n in self._raw.items():
+            frames = [names.get(ident, str(ident))] + [self._label(c) for c in reversed(codes)]
+            stacks[';'.join(frames)] += n
+        return stacks
+
+    def top(self, limit):
+        """(自身, 含子呼叫) 樣本數最多的函式。"""
+        own, inclusive = Counter(), Counter()
+        for (_, codes), n in self._raw.items():
+            if not codes:
+                continue
+            own[self._label(codes[0])] += n
+            for code in set(codes):
+                inclusive[self._label(code)] += n
+        return own.most_common(limit), inclusive.most_common(limit)
+
+
+class Profiler:
+    def __init__(self, name, mode, directory=None, logger=None):
+        self.name = name
+        self.mode = mode
+        self.directory = directory or PROFILE_DIR
+        self.logger = logger
+        self.run_id = new_run_id()
+        self.prefix = os.path.join(self.directory, f"{name}-{self.run_id}")
+        self._profile = None
+        self._sampler = None
+        self._started = 0.0
+        self._stopped = False
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if self.mode == 'sample':
+            self._sampler = StackSampler()
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._started = time.monotonic()
+        self._log(f"🔬 Profiling ({self.mode}) 啟用，輸出: {self.prefix}.*")
+        return self
+
+    def stop(self):
+        if self._stopped:
+            return None
+        self._stopped = True
+        wall = time.monotonic() - self._started
+        if self._profile:
+            self._profile.disable()
+        if self._sampler:
+            self._sampler.stop()
+        snapshot = None
+        current = peak = 0
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        lines = [f"# {self.name} run_id={self.run_id} mode={self.mode} wall={wall:.2f}s "
+                 f"traced_current={current / 1048576:.1f}MiB traced_peak={peak / 1048576:.1f}MiB", '']
+        if self._profile:
+            self._profile.dump_stats(f"{self.prefix}.prof")
+            lines += self._cpu_summary()
+        if self._sampler:
+            with open(f"{self.prefix}.folded", 'w') as f:
+                for stack, n in self._sampler.collapse().most_common():
+                    f.write(f"{stack} {n}\n")
+            lines += self._sample_summary()
+        if snapshot:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                               tracemalloc.Filter(False, __file__)])
+            snapshot.dump(f"{self.prefix}.tracemalloc")
+            lines += [f"## 記憶體配置 Top {TOP_N} (結束時仍存活的配置，依大小)"]
+            for stat in snapshot.statistics('lineno')[:TOP_N]:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 1024:>10.1f} KiB {stat.count:>8d} blocks  {frame.filename}:{frame.lineno}")
+
+        summary = f"{self.prefix}.txt"
+        with open(summary, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        self._log(f"🔬 Profiling 摘要: {summary}")
+        return summary
+
+    def _cpu_summary(self):
+        out = []
+        for title, sort, restrict in ((f"CPU 累計時間 Top {TOP_N}", 'cumulative', ()),
+                                      (f"CPU 自身時間 Top {TOP_N}", 'tottime', ()),
+                                      ("重點函式 (sanitize / pynetbox / json)", 'cumulative', (FOCUS,))):
+            buf = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=buf)
+            stats.sort_stats(sort).print_stats(*restrict, TOP_N)
+            body = buf.getvalue()
+            out += [f"## {title}", body[body.find('   ncalls'):] if '   ncalls' in body else body, '']
+        return out
+
+    def _sample_summary(self):
+        samples = max(1, self._sampler.samples)
+        own, inclusive = self._sampler.top(TOP_N)
+        out = [f"## 取樣 {self._sampler.samples} 次 (間隔 {self._sampler.interval * 1000:.0f}ms)，自身樣本 Top {TOP_N}"]
+        out += [f"{n:>8d} {n * 100 / samples:>6.1f}%  {fn}" for fn, n in own]
+        out += ['', f"## 含子呼叫樣本 Top {TOP_N}"]
+        out += [f"{n:>8d} {n * 100 / samples:>6.1f}%  {fn}" for fn, n in inclusive]
+        return out + ['']
+
+    def _log(self, msg):
+        if self.logger:
+            self.logger.info(msg)
+        else:
+            print(msg, file=sys.stderr)
+
+
+def start_profile(cli_value, name, logger=None):
+    """依 --profile / IT_NEXUS_PROFILE 啟動 Profiling，行程結束時寫出結果；未啟用回傳 None。"""
+    try:
+        mode = resolve_mode(cli_value)
+    except ValueError as e:
+        if logger:
+            logger.warning(f"⚠ {e}")
+        return None
+    if not mode:
+        return None
+    profiler = Profiler(name, mode, logger=logger).start()
+    atexit.register(profiler.stop)
+    return profiler
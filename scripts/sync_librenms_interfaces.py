@@ -8,6 +8,10 @@
 #
 # 用法：
 #   python3 sync_librenms_interfaces.py [--dry-run] [--limit N] [--device NAME]
+#   python3 sync_librenms_interfaces.py --plan changes.json   # 全設備群比對，只輸出變更集 (不寫入)
+#
+# 協調：全量同步持有 full-sync 執行鎖 (與 sync_librenms_to_netbox.py 共用)，
+#       每台設備寫入前取得設備租約，避免與 Webhook 觸發的同步同時改寫。
 # =============================================================================
 
 import os
@@ -21,50 +25,39 @@ import urllib3
 import re
 from dotenv import load_dotenv
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from utils import filter_devices_by_name, save_metrics, setup_logging
+from coordination import DeviceLeases, run_lock, RunLockBusy
+from http_cassette import install_from_env
+import instrumentation
+from profiling import add_profile_argument, start_profile
+from tracing import add_trace_argument, start_tracing, span, traced
+from instrumentation import PhaseTimer, phase
+from interface_rules import is_physical_interface, map_interface_type
+import port_table
 
-# --- Logging ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # --- Load Env ---
 load_dotenv('/opt/netbox/scripts/.env')
+
+# --- Logging (stdout，由 Systemd Journal 收集) ---
+setup_logging()
+logger = logging.getLogger(__name__)
+
 LIBRENMS_URL = os.getenv('LIBRENMS_URL', '').rstrip('/')
 LIBRENMS_TOKEN = os.getenv('LIBRENMS_TOKEN', '')
 NETBOX_URL = os.getenv('NETBOX_URL', '')
 NETBOX_TOKEN = os.getenv('NETBOX_TOKEN', '')
 
 HEADERS_LNM = {'X-Auth-Token': LIBRENMS_TOKEN}
+METRICS_FILE = os.getenv('METRICS_FILE_INTERFACES', '/var/log/it_nexus/metrics_interfaces.json')
 
-# ============================================================================
-# 實體介面白名單 (只有符合這些前綴的介面才會同步)
-# ============================================================================
-PHYSICAL_PREFIXES = (
-    # --- Cisco ---
-    'Fa', 'Gi', 'Te', 'Fo', 'Tw', 'Hu',
-    'FastEthernet', 'GigabitEthernet', 'TenGigabitEthernet',
-    'Ethernet', 'Eth',
-    'mgmt', 'Management',
-    # --- Linux / Generic ---
-    'eth', 'ens', 'enp', 'eno', 'em',
-    'wlan', 'wl',
-    # --- LAG ---
-    'Po', 'Port-channel', 'Bond', 'bond', 'ae',
-    # --- Fortinet ---
-    'port', 'wan', 'dmz', 'internal',
-    # --- Aruba / HP ---
-    'ge-', 'xe-', 'et-',
-)
-
-# 排除清單
-SKIP_PATTERNS = [
-    'WFP', 'LightWeight Filter', 'WAN Miniport',
-    'Microsoft Kernel Debug', 'Pseudo-Interface',
-    'isatap', 'Teredo', 'Microsoft ISATAP',
-    'Miniport', 'Microsoft Wi-Fi Direct',
-    'Hyper-V', 'vSwitch', 'NDIS',
-    'Null', 'Nu0',
-]
+# --- 協調 (見 coordination.py) ---
+LEASE_WAIT = int(os.getenv('COORD_LEASE_WAIT', '120'))
+RUN_LOCK_WAIT = int(os.getenv('COORD_RUN_WAIT', '600'))
+
+# 實體介面白名單、排除清單與 Type 對應見 interface_rules.py (與 sync_librenms_to_netbox.py 共用)
+HEX_DIGITS = set('0123456789abcdefABCDEF')
 
 
 def format_mac(raw_mac):
@@ -74,7 +67,7 @@ def format_mac(raw_mac):
     if not raw_mac:
         return None
     mac = raw_mac.strip().replace(':', '').replace('-', '').replace('.', '')
-    if len(mac) != 12 or mac.replace('0', '') == '':
+    if len(mac) != 12 or mac.replace('0', '') == '' or not set(mac) <= HEX_DIGITS:
         return None
     return ':'.join(mac[i:i+2] for i in range(0, 12, 2))
 
@@ -83,8 +76,13 @@ def get_librenms_device_map():
     """取得 LibreNMS 所有設備，建立 {sysName: {id, ip}} 對照表。"""
     resp = requests.get(f"{LIBRENMS_URL}/devices", headers=HEADERS_LNM, verify=False, timeout=30)
     resp.raise_for_status()
+    return build_device_map(resp.json().get('devices', []))
+
+
+def build_device_map(devices):
+    """由 LibreNMS 設備清單建立 {sysName: {id, ip}} 對照表 (sync_pipeline 沿用已取得的清單)。"""
     dev_map = {}
-    for d in resp.json().get('devices', []):
+    for d in devices:
         name = d.get('sysName') or d.get('hostname')
         if name:
             dev_map[name] = {
@@ -94,11 +92,11 @@ def get_librenms_device_map():
     return dev_map
 
 
-def get_device_ports(device_id):
+def get_device_ports(device_id, http=None):
     """使用 /devices/:id/ports 端點取得 Port (與 LibreNMS Web UI 一致)。"""
     url = f"{LIBRENMS_URL}/devices/{device_id}/ports?columns=ifName,ifAlias,ifPhysAddress,ifType,ifSpeed,ifMtu,ifOperStatus,ifAdminStatus,ifDescr"
     try:
-        resp = requests.get(url, headers=HEADERS_LNM, verify=False, timeout=30)
+        resp = (http or requests).get(url, headers=HEADERS_LNM, verify=False, timeout=30)
         data = resp.json()
         if data.get('status') == 'error':
             logger.warning(f"  LibreNMS API Error (ID: {device_id}): {data.get('message')}")
@@ -109,36 +107,7 @@ def get_device_ports(device_id):
         return []
 
 
-def is_physical_interface(if_name):
-    """判斷是否為實體介面 (白名單機制)。"""
-    name = (if_name or '').strip()
-    if not name:
-        return False
-    if any(pat in name for pat in SKIP_PATTERNS):
-        return False
-    return name.startswith(PHYSICAL_PREFIXES)
-
-
-def map_interface_type(if_name, speed_bps):
-    """根據介面名稱與速率判斷 NetBox Interface Type。"""
-    name = (if_name or '').strip()
-
-    # LAG
-    if name.startswith(('Po', 'Port-channel', 'Bond', 'bond', 'ae')):
-        return 'lag'
-
-    # 根據速率判斷
-    speed = int(speed_bps or 0)
-    if speed >= 100000000000: return '100gbase-x-qsfp28'
-    if speed >= 40000000000:  return '40gbase-x-qsfpp'
-    if speed >= 25000000000:  return '25gbase-x-sfp28'
-    if speed >= 10000000000:  return '10gbase-t'
-    if speed >= 1000000000:   return '1000base-t'
-    if speed >= 10000000:     return '100base-tx'
-    if speed == 0:            return 'other'
-    return 'other'
-
-
+@traced()
 def clean_device_interfaces(nb, device_id, device_name):
     """清除設備上所有現有的 Interfaces。"""
     existing = list(nb.dcim.interfaces.filter(device_id=device_id))
@@ -155,187 +124,243 @@ def clean_device_interfaces(nb, device_id, device_name):
     return count
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Sync LibreNMS Interfaces to NetBox (v3 Clean Sync)')
-    parser.add_argument('--dry-run', action='store_true', help="只顯示預計同步的內容，不寫入")
-    parser.add_argument('--limit', type=int, default=0, help="限制處理的設備數量 (0=全部)")
-    parser.add_argument('--device', type=str, default='', help="只處理指定設備 (hostname)")
-    args = parser.parse_args()
+def sync_device_interfaces(nb, nb_dev, dev_info, stats, dry_run=False, http=None):
+    """同步單一設備的 Interface 與管理 IP (Clean Sync)。"""
+    with span('sync_device_interfaces', cat='device', hostname=nb_dev.name, device_id=dev_info['id']):
+        timer = PhaseTimer('ports_fetch')
+        try:
+            _sync_device_interfaces(nb, nb_dev, dev_info, stats, dry_run, http, timer)
+        finally:
+            timer.stop()
 
-    if not all([LIBRENMS_URL, LIBRENMS_TOKEN, NETBOX_URL, NETBOX_TOKEN]):
-        logger.error("缺少必要環境變數 (LIBRENMS_URL/TOKEN, NETBOX_URL/TOKEN)")
-        sys.exit(1)
 
-    nb = pynetbox.api(NETBOX_URL, token=NETBOX_TOKEN)
-    nb.http_session.verify = False
+def _sync_device_interfaces(nb, nb_dev, dev_info, stats, dry_run, http, timer):
+    lid = dev_info['id']
+    dev_ip = dev_info.get('ip')
 
-    logger.info("=== 開始同步 Interfaces (v3 Clean Sync) ===")
-    logger.info("策略: 清除舊 Interface → 從 LibreNMS 重建 (僅實體 Port)")
+    logger.info(f"📡 {nb_dev.name} (LibreNMS ID: {lid}, IP: {dev_ip}, NetBox ID: {nb_dev.id})")
 
-    # 1. Build LibreNMS Map
-    librenms_map = get_librenms_device_map()
-    logger.info(f"LibreNMS: {len(librenms_map)} 台設備")
+    # 取得 LibreNMS Ports
+    ports = get_device_ports(lid, http)
+    if not ports:
+        logger.info(f"  ⏭ 無 Port 資料")
+        return
 
-    # 2. Get NetBox Devices
-    nb_devices = list(nb.dcim.devices.filter(status='active'))
-    logger.info(f"NetBox: {len(nb_devices)} 台 Active 設備")
+    # 過濾：僅保留實體介面
+    valid_ports = [p for p in ports if p.get('ifName') and is_physical_interface(p['ifName'])]
+    skipped = len(ports) - len(valid_ports)
+    stats['interfaces_skipped'] += skipped
 
-    stats = {
-        'devices_processed': 0,
-        'interfaces_created': 0,
-        'interfaces_cleaned': 0,
-        'interfaces_skipped': 0,
-        'errors': 0,
-    }
+    logger.info(f"  LibreNMS 回傳 {len(ports)} 個 Port, 過濾後 {len(valid_ports)} 個實體介面 (跳過 {skipped})")
 
-    for nb_dev in nb_devices:
-        if args.limit > 0 and stats['devices_processed'] >= args.limit:
-            break
+    stats['devices_processed'] += 1
 
-        # 指定設備模式
-        if args.device and nb_dev.name != args.device:
+    if dry_run:
+        for p in valid_ports:
+            name = p.get('ifName', '?')
+            speed = p.get('ifSpeed', 0)
+            mac = p.get('ifPhysAddress') or 'N/A'
+            t = map_interface_type(name, speed)
+            enabled = str(p.get('ifAdminStatus', '')).lower() == 'up'
+            logger.info("    %-35s | Type: %-15s | MAC: %-20s | Enabled: %s", name, t, mac, enabled)
+        return
+
+    # === Clean Sync: 先刪除, 再建立 ===
+    timer.next('clean_sync')
+    cleaned = clean_device_interfaces(nb, nb_dev.id, nb_dev.name)
+    stats['interfaces_cleaned'] += cleaned
+
+    # 建立新的 Interfaces
+    for p in valid_ports:
+        if_name = (p.get('ifName') or '').strip()
+        if not if_name:
             continue
 
-        dev_info = librenms_map.get(nb_dev.name)
-        if not dev_info:
-            continue
+        # 截斷 (NetBox 限制 64 字元)
+        if len(if_name) > 64:
+            if_name = if_name[:64]
 
-        lid = dev_info['id']
-        dev_ip = dev_info.get('ip')
+        mac = format_mac(p.get('ifPhysAddress'))
 
-        logger.info(f"📡 {nb_dev.name} (LibreNMS ID: {lid}, IP: {dev_ip}, NetBox ID: {nb_dev.id})")
+        mtu = p.get('ifMtu')
+        speed = p.get('ifSpeed', 0)
+        enabled = str(p.get('ifAdminStatus', '')).lower() == 'up'
+        description = p.get('ifAlias') or p.get('ifDescr') or ''
+        type_slug = map_interface_type(if_name, speed)
 
-        # 取得 LibreNMS Ports
-        ports = get_device_ports(lid)
-        if not ports:
-            logger.info(f"  ⏭ 無 Port 資料")
-            continue
+        try:
+            payload = {
+                'device': nb_dev.id,
+                'name': if_name,
+                'type': type_slug,
+                'enabled': enabled,
+            }
+            if mtu: payload['mtu'] = int(mtu)
+            if description: payload['description'] = description[:200]
 
-        # 過濾：僅保留實體介面
-        valid_ports = [p for p in ports if p.get('ifName') and is_physical_interface(p['ifName'])]
-        skipped = len(ports) - len(valid_ports)
-        stats['interfaces_skipped'] += skipped
+            new_if = nb.dcim.interfaces.create(payload)
+            stats['interfaces_created'] += 1
 
-        logger.info(f"  LibreNMS 回傳 {len(ports)} 個 Port, 過濾後 {len(valid_ports)} 個實體介面 (跳過 {skipped})")
+            # NetBox v4.2+: MAC Address 為獨立物件
+            if mac:
+                try:
+                    mac_obj = nb.dcim.mac_addresses.create(
+                        mac_address=mac,
+                        assigned_object_type='dcim.interface',
+                        assigned_object_id=new_if.id,
+                    )
+                    # 設定為 Primary MAC
+                    new_if.update({'primary_mac_address': mac_obj.id})
+                except Exception as mac_err:
+                    logger.warning(f"    ⚠ {if_name} MAC 寫入失敗: {mac_err}")
 
-        stats['devices_processed'] += 1
+        except Exception as e:
+            logger.error(f"    ❌ {if_name}: {e}")
+            stats['errors'] += 1
+
+    # === 設備 IP 同步 ===
+    if dev_ip and not dry_run:
+        # 驗證 IP 格式 (排除 hostname)
+        if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', str(dev_ip)):
+            logger.warning(f"  ⚠ IP '{dev_ip}' 不是有效 IPv4 格式，跳過")
+        else:
+            try:
+                # 找介面 (優先用已存在的介面)
+                mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Management')
+                if not mgmt_if:
+                    mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Gi0/1')
+                if not mgmt_if:
+                    mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Fa0/1')
+                if not mgmt_if:
+                    all_ifs = list(nb.dcim.interfaces.filter(device_id=nb_dev.id))
+                    mgmt_if = all_ifs[0] if all_ifs else None
+
+                # 若設備無任何 Interface，建立一個 Management 介面
+                if not mgmt_if:
+                    mgmt_if = nb.dcim.interfaces.create(
+                        device=nb_dev.id,
+                        name='Management',
+                        type='virtual',
+                        description='Auto-created for IP assignment',
+                    )
+                    logger.info(f"  📎 已建立 Management 虛擬介面")
+
+                # 檢查 IP 是否已存在
+                ip_addr = f"{dev_ip}/32"
+                existing_ip = nb.ipam.ip_addresses.get(address=dev_ip)
+
+                if existing_ip:
+                    # 更新綁定
+                    existing_ip.assigned_object_type = 'dcim.interface'
+                    existing_ip.assigned_object_id = mgmt_if.id
+                    existing_ip.save()
+                    ip_id = existing_ip.id
+                else:
+                    # 建立新 IP
+                    new_ip = nb.ipam.ip_addresses.create(
+                        address=ip_addr,
+                        assigned_object_type='dcim.interface',
+                        assigned_object_id=mgmt_if.id,
+                        description=f'Management IP ({nb_dev.name})',
+                    )
+                    ip_id = new_ip.id
+
+                # 設定 Primary IPv4
+                if not nb_dev.primary_ip4 or str(nb_dev.primary_ip4) != dev_ip:
+                    nb_dev.update({'primary_ip4': ip_id})
+                    logger.info(f"  🌐 已設定 Primary IPv4: {dev_ip}")
+                stats['ips_synced'] = stats.get('ips_synced', 0) + 1
+            except Exception as e:
+                logger.error(f"  ❌ IP 同步失敗 ({dev_ip}): {e}")
 
-        if args.dry_run:
-            for p in valid_ports:
-                name = p.get('ifName', '?')
-                speed = p.get('ifSpeed', 0)
-                mac = p.get('ifPhysAddress') or 'N/A'
-                t = map_interface_type(name, speed)
-                enabled = str(p.get('ifAdminStatus', '')).lower() == 'up'
-                print(f"    {name:35s} | Type: {t:15s} | MAC: {mac:20s} | Enabled: {enabled}")
-            continue
 
-        # === Clean Sync: 先刪除, 再建立 ===
-        cleaned = clean_device_interfaces(nb, nb_dev.id, nb_dev.name)
-        stats['interfaces_cleaned'] += cleaned
+def get_all_ports(http=None):
+    """以 /ports 端點一次取得全設備群的 Port (含 device_id，供 --plan 使用)。"""
+    url = f"{LIBRENMS_URL}/ports?columns=device_id,ifName,ifAlias,ifPhysAddress,ifSpeed,ifMtu,ifAdminStatus,ifDescr"
+    resp = (http or requests).get(url, headers=HEADERS_LNM, verify=False, timeout=300)
+    resp.raise_for_status()
+    return resp.json().get('ports', [])
 
-        # 建立新的 Interfaces
-        for p in valid_ports:
-            if_name = (p.get('ifName') or '').strip()
-            if not if_name:
-                continue
 
-            # 截斷 (NetBox 限制 64 字元)
-            if len(if_name) > 64:
-                if_name = if_name[:64]
+def plan_all(nb, names=None, librenms_map=None, http=None):
+    """全設備群比對 LibreNMS Port 與 NetBox Interface，回傳變更集 (port_table.py)，不寫入。
 
-            mac = format_mac(p.get('ifPhysAddress'))
+    與逐台 Clean Sync 相同，只比對 NetBox Active 且 LibreNMS 有 Port 資料的設備。
+    """
+    if librenms_map is None:
+        librenms_map = get_librenms_device_map()
+    if names is None:
+        nb_devices = list(nb.dcim.devices.filter(status='active'))
+    else:
+        nb_devices = filter_devices_by_name(nb, names, status='active')
+    device_ids = {librenms_map[d.name]['id']: d.id for d in nb_devices if d.name in librenms_map}
+    logger.info(f"比對範圍: {len(device_ids)} 台設備 (NetBox Active 且存在於 LibreNMS)")
+
+    with phase('plan_fetch'):
+        ports = get_all_ports(http)
+        covered = {device_ids[p['device_id']] for p in ports if p.get('device_id') in device_ids}
+        if names is None:
+            interfaces = list(nb.dcim.interfaces.all())
+        else:
+            interfaces = list(nb.dcim.interfaces.filter(device_id=sorted(covered))) if covered else []
+    logger.info(f"LibreNMS: {len(ports)} 個 Port, NetBox: {len(interfaces)} 個 Interface")
+
+    with phase('plan_diff'):
+        changes = port_table.diff(port_table.PortTable.from_librenms(ports, device_ids),
+                                  port_table.PortTable.from_netbox(interfaces), devices=covered)
+    changes['backend'] = 'numpy' if port_table.HAVE_NUMPY else 'python'
+    s = changes['stats']
+    logger.info(f"📋 變更集: 新建={s['create']}, 更新={s['update']}, 刪除={s['delete']}, "
+                f"未變={s['unchanged']} ({changes['backend']})")
+    return changes
+
+
+def new_stats():
+    return {
+        'devices_processed': 0,
+        'interfaces_created': 0,
+        'interfaces_cleaned': 0,
+        'interfaces_skipped': 0,
+        'errors': 0,
+    }
 
-            mtu = p.get('ifMtu')
-            speed = p.get('ifSpeed', 0)
-            enabled = str(p.get('ifAdminStatus', '')).lower() == 'up'
-            description = p.get('ifAlias') or p.get('ifDescr') or ''
-            type_slug = map_interface_type(if_name, speed)
 
-            try:
-                payload = {
-                    'device': nb_dev.id,
-                    'name': if_name,
-                    'type': type_slug,
-                    'enabled': enabled,
-                }
-                if mtu: payload['mtu'] = int(mtu)
-                if description: payload['description'] = description[:200]
-
-                new_if = nb.dcim.interfaces.create(payload)
-                stats['interfaces_created'] += 1
-
-                # NetBox v4.2+: MAC Address 為獨立物件
-                if mac:
-                    try:
-                        mac_obj = nb.dcim.mac_addresses.create(
-                            mac_address=mac,
-                            assigned_object_type='dcim.interface',
-                            assigned_object_id=new_if.id,
-                        )
-                        # 設定為 Primary MAC
-                        new_if.update({'primary_mac_address': mac_obj.id})
-                    except Exception as mac_err:
-                        logger.warning(f"    ⚠ {if_name} MAC 寫入失敗: {mac_err}")
+def sync_all(nb, dry_run=False, limit=0, names=None, leases=None, lease_wait=0, librenms_map=None, http=None):
+    """逐台同步 NetBox Active 設備的 Interface；持有租約的設備才寫入。
 
-            except Exception as e:
-                logger.error(f"    ❌ {if_name}: {e}")
-                stats['errors'] += 1
-
-        # === 設備 IP 同步 ===
-        if dev_ip and not args.dry_run:
-            # 驗證 IP 格式 (排除 hostname)
-            if not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', str(dev_ip)):
-                logger.warning(f"  ⚠ IP '{dev_ip}' 不是有效 IPv4 格式，跳過")
-            else:
-                try:
-                    # 找介面 (優先用已存在的介面)
-                    mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Management')
-                    if not mgmt_if:
-                        mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Gi0/1')
-                    if not mgmt_if:
-                        mgmt_if = nb.dcim.interfaces.get(device_id=nb_dev.id, name='Fa0/1')
-                    if not mgmt_if:
-                        all_ifs = list(nb.dcim.interfaces.filter(device_id=nb_dev.id))
-                        mgmt_if = all_ifs[0] if all_ifs else None
-
-                    # 若設備無任何 Interface，建立一個 Management 介面
-                    if not mgmt_if:
-                        mgmt_if = nb.dcim.interfaces.create(
-                            device=nb_dev.id,
-                            name='Management',
-                            type='virtual',
-                            description='Auto-created for IP assignment',
-                        )
-                        logger.info(f"  📎 已建立 Management 虛擬介面")
-
-                    # 檢查 IP 是否已存在
-                    ip_addr = f"{dev_ip}/32"
-                    existing_ip = nb.ipam.ip_addresses.get(address=dev_ip)
-
-                    if existing_ip:
-                        # 更新綁定
-                        existing_ip.assigned_object_type = 'dcim.interface'
-                        existing_ip.assigned_object_id = mgmt_if.id
-                        existing_ip.save()
-                        ip_id = existing_ip.id
-                    else:
-                        # 建立新 IP
-                        new_ip = nb.ipam.ip_addresses.create(
-                            address=ip_addr,
-                            assigned_object_type='dcim.interface',
-                            assigned_object_id=mgmt_if.id,
-                            description=f'Management IP ({nb_dev.name})',
-                        )
-                        ip_id = new_ip.id
-
-                    # 設定 Primary IPv4
-                    if not nb_dev.primary_ip4 or str(nb_dev.primary_ip4) != dev_ip:
-                        nb_dev.update({'primary_ip4': ip_id})
-                        logger.info(f"  🌐 已設定 Primary IPv4: {dev_ip}")
-                    stats['ips_synced'] = stats.get('ips_synced', 0) + 1
-                except Exception as e:
-                    logger.error(f"  ❌ IP 同步失敗 ({dev_ip}): {e}")
+    names 不為 None 時只處理這些設備 (依名稱直接查詢 NetBox)；
+    librenms_map / http 可傳入已取得的對照表與共用 Session (sync_pipeline)。
+    """
+    # 1. Build LibreNMS Map
+    if librenms_map is None:
+        librenms_map = get_librenms_device_map()
+    logger.info(f"LibreNMS: {len(librenms_map)} 台設備")
+
+    # 2. Get NetBox Devices
+    if names is None:
+        nb_devices = list(nb.dcim.devices.filter(status='active'))
+    else:
+        nb_devices = filter_devices_by_name(nb, names, status='active')
+    logger.info(f"NetBox: {len(nb_devices)} 台 Active 設備")
+
+    stats = new_stats()
+
+    for nb_dev in nb_devices:
+        if limit > 0 and stats['devices_processed'] >= limit:
+            break
+
+        dev_info = librenms_map.get(nb_dev.name)
+        if not dev_info:
+            continue
+
+        if leases and not leases.acquire(dev_info['id'], wait=lease_wait):
+            continue
+        try:
+            sync_device_interfaces(nb, nb_dev, dev_info, stats, dry_run, http)
+        finally:
+            if leases:
+                # 介面同步不記錄完成時間：Webhook 的「已同步」判斷僅針對設備同步
+                leases.release(dev_info['id'])
 
     logger.info("=== 同步完成 ===")
     logger.info(f"統計: 設備={stats['devices_processed']}, "
@@ -344,6 +369,65 @@ def main():
                 f"跳過={stats['interfaces_skipped']}, "
                 f"IP={stats.get('ips_synced', 0)}, "
                 f"錯誤={stats['errors']}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync LibreNMS Interfaces to NetBox (v3 Clean Sync)')
+    parser.add_argument('--dry-run', action='store_true', help="只顯示預計同步的內容，不寫入")
+    parser.add_argument('--limit', type=int, default=0, help="限制處理的設備數量 (0=全部)")
+    parser.add_argument('--device', type=str, default='', help="只處理指定設備 (hostname)")
+    parser.add_argument('--plan', metavar='FILE', help="全設備群比對並將變更集寫入 JSON 檔 (不寫入 NetBox)")
+    add_profile_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+    install_from_env(logger)
+    instrumentation.install()
+    start_profile(args.profile, 'sync_interfaces', logger)
+    start_tracing(args.trace, 'sync_interfaces', logger)
+
+    if not all([LIBRENMS_URL, LIBRENMS_TOKEN, NETBOX_URL, NETBOX_TOKEN]):
+        logger.error("缺少必要環境變數 (LIBRENMS_URL/TOKEN, NETBOX_URL/TOKEN)")
+        sys.exit(1)
+
+    nb = pynetbox.api(NETBOX_URL, token=NETBOX_TOKEN)
+    nb.http_session.verify = False
+
+    logger.info("=== 開始同步 Interfaces (v3 Clean Sync) ===")
+    logger.info("策略: 清除舊 Interface → 從 LibreNMS 重建 (僅實體 Port)")
+
+    names = {args.device} if args.device else None
+    if args.plan:
+        changes = plan_all(nb, names)
+        with open(args.plan, 'w') as f:
+            json.dump(changes, f, ensure_ascii=False, indent=1)
+        logger.info(f"✅ 變更集已寫入 {args.plan}")
+        return
+    if args.dry_run:
+        sync_all(nb, True, args.limit, names)
+        return
+
+    stats = None
+
+    leases = None
+    try:
+        leases = DeviceLeases('sync_interfaces')
+    except Exception as e:
+        logger.warning(f"⚠ 無法開啟協調資料庫，略過設備租約: {e}")
+
+    try:
+        if args.device:
+            stats = sync_all(nb, False, args.limit, names, leases, lease_wait=LEASE_WAIT)
+        else:
+            with run_lock('full-sync', wait=RUN_LOCK_WAIT):
+                stats = sync_all(nb, False, args.limit, names, leases)
+    except RunLockBusy:
+        logger.warning("⏭ 另一個全量同步執行中，本次略過")
+    finally:
+        if leases:
+            leases.close()
+    if stats is not None:
+        save_metrics(METRICS_FILE, 'librenms_interfaces', stats)
 
 
 if __name__ == "__main__":
@@ -12,12 +12,25 @@
 
 import os
 import sys
+import time
+import sqlite3
+import threading
 import pynetbox
 import re
+import requests
+from urllib.parse import quote
 from slugify import slugify
 from dotenv import load_dotenv
 
 from utils import setup_logging, save_metrics, request_with_retry, get_env_var
+from coordination import DeviceLeases, run_lock, RunLockBusy
+from change_feed import ChangeFeed, change_event, new_run_id
+from http_cassette import install_from_env
+import instrumentation
+from profiling import add_profile_argument, start_profile
+from tracing import add_trace_argument, start_tracing, span, traced
+from instrumentation import phase, PhaseTimer
+from interface_rules import sanitize_string, classify
 
 ENV_PATH = '/opt/netbox/scripts/.env'
 load_dotenv(ENV_PATH)
@@ -26,6 +39,14 @@ logger = setup_logging('/var/log/it_nexus/sync_librenms.log')
 
 RETRY_COUNT = int(get_env_var('RETRY_COUNT', '3'))
 METRICS_FILE = get_env_var('METRICS_FILE_LIBRENMS', '/var/log/it_nexus/metrics_librenms.json')
+# 常駐模式 (LibreNMSSyncer) 的快取秒數
+REF_CACHE_TTL = int(get_env_var('SYNC_REF_CACHE_TTL', '600'))
+DEVICE_LIST_TTL = int(get_env_var('SYNC_DEVICE_LIST_TTL', '300'))
+# 查無設備時，對照表至少已建立這麼久才重新下載 (避免打錯字或未知主機反覆下載整份清單)
+DEVICE_INDEX_MIN_AGE = int(get_env_var('SYNC_DEVICE_INDEX_MIN_AGE', '60'))
+# 跨行程協調：指定設備時等待租約的秒數 / 全量同步等待其他全量同步的秒數
+LEASE_WAIT = int(get_env_var('COORD_LEASE_WAIT', '120'))
+RUN_LOCK_WAIT = int(get_env_var('COORD_RUN_WAIT', '600'))
 
 MANUFACTURER_MAP = {
     'ios': 'Cisco', 'iosxe': 'Cisco', 'nxos': 'Cisco',
@@ -37,39 +58,6 @@ MANUFACTURER_MAP = {
     'vmware-esxi': 'VMware', 'powerwalker': 'BlueWalker',
 }
 
-def sanitize_string(text):
-    """清理亂碼 (Mojibake) 並替換為可讀名稱，特別針對 Hyper-V 模式。"""
-    if not text: return text
-    
-    # 移除不可見字元 (如 Null, Bell 等)
-    text = "".join(char for char in text if char.isprintable())
-    
-    # 模式匹配與替換
-    # 1. Hyper-V 虛擬網卡: 包含 'Hyper-V' 且帶有特定亂碼特徵 (如 Ӻ)
-    # 範例: Hyper-V ?????A?Ӻ????????d #2
-    if 'Hyper-V' in text and ('?' in text or '\u04fa' in text or '\u6d33' in text or '\ufffd' in text):
-        # 提取結尾的 #N 序號
-        num_match = re.search(r'#(\d+)', text)
-        suffix = f" #{num_match.group(1)}" if num_match else ""
-        
-        # 提取過濾器後綴 (如 -WFP ..., -Microsoft ...) 以防止重複名稱
-        filter_match = re.search(r'-(WFP|Microsoft|NDIS|Load|Failover).*$', text)
-        filter_suffix = filter_match.group(0) if filter_match else ""
-        
-        # 根據特徵字元辨識類型
-        if any(c.lower() in text.lower() for c in ['adapter', 'ethernet', '\u04fa', '\u04fb']): 
-            return f"Hyper-V Virtual Ethernet Adapter{suffix}{filter_suffix}"
-        if any(c.lower() in text.lower() for c in ['switch', 'vswitch', '\u6d3b', '\u6d33']): 
-            return f"Hyper-V Virtual Switch{suffix}{filter_suffix}"
-            
-    # 如果包含過多問號且有 Hyper-V 字樣，嘗試歸類為 Network Adapter
-    if 'Hyper-V' in text and text.count('?') > 2:
-        num_match = re.search(r'#(\d+)', text)
-        suffix = f" #{num_match.group(1)}" if num_match else ""
-        return f"Hyper-V Network Adapter{suffix}"
-
-    return text.strip()
-
 def format_mac(mac):
     """將任何格式的 MAC 位址轉換為 NetBox 要求的 XX:XX:XX:XX:XX:XX 格式。"""
     if not mac: return None
@@ -107,6 +95,7 @@ def get_manufacturer_name(device: dict) -> str:
         
     return 'Generic'
 
+@traced()
 def get_or_create_platform(nb, manufacturer_name, os_name, version, dry_run=False):
     """取得或建立 Platform (OS Version)"""
     if not os_name: return None
@@ -117,7 +106,7 @@ def get_or_create_platform(nb, manufacturer_name, os_name, version, dry_run=Fals
     keywords = ['windows', 'linux', 'unix', 'freebsd', 'ubuntu', 'centos', 'debian', 'vmware', 'generic', 'unknown', 'powerwalker', 'ping']
     is_generic_os = any(k in os_lower for k in keywords)
 
-    logger.debug(f"  [Platform Check] OS='{os_name}', IsGeneric={is_generic_os}")
+    logger.debug("  [Platform Check] OS='%s', IsGeneric=%s", os_name, is_generic_os)
 
     if is_generic_os:
         # 對於通用 OS，手動指定完整的 Pretty Name
@@ -169,6 +158,7 @@ def get_or_create_platform(nb, manufacturer_name, os_name, version, dry_run=Fals
         logger.warning(f"  ⚠ 無法處理 Platform {full_name}: {e}")
         return None
 
+@traced()
 def get_or_create_site(nb, location_name, dry_run=False):
     """取得或建立 Site"""
     if not location_name: return None
@@ -184,18 +174,18 @@ def get_or_create_site(nb, location_name, dry_run=False):
         logger.warning(f"  ⚠ 無法處理 Site {location_name}: {e}")
         return None
 
-def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id, dry_run=False):
+def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id, dry_run=False, http=None):
     """v6.0 全面同步：Interface, IP, Inventory"""
     # if dry_run: return  <-- allow dry run to proceed
 
     headers = {'X-Auth-Token': librenms_token}
-    
-    
+    timer = PhaseTimer('vlan')
+
     # 1. Sync VLANs (Priority: High, needed for Interface binding)
     vlan_map = {} # VID -> VLAN Object
     try:
         try:
-            resp = request_with_retry('GET', f"{librenms_url}/devices/{libre_dev_id}/vlans", headers=headers, retry_count=1, logger=logger)
+            resp = request_with_retry('GET', f"{librenms_url}/devices/{libre_dev_id}/vlans", headers=headers, retry_count=1, logger=logger, http=http)
         except Exception: resp = None
 
         vlans = resp.json().get('vlans', []) if resp and resp.status_code == 200 else []
@@ -226,18 +216,18 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
                          if not dry_run:
                              nb_vlan.name = name
                              nb_vlan.save()
-                             logger.info(f"  [VLAN] 更新 VLAN {vid} 名稱: {nb_vlan.name} -> {name}")
+                             logger.info("  [VLAN] 更新 VLAN %s 名稱: %s -> %s", vid, nb_vlan.name, name)
                          else:
-                             logger.info(f"  [Dry-Run] Would Update VLAN {vid} Name: {nb_vlan.name} -> {name}")
+                             logger.info("  [Dry-Run] Would Update VLAN %s Name: %s -> %s", vid, nb_vlan.name, name)
                 else:
                     # Create
                     try:
                         if not dry_run:
                             new_vlan = nb.ipam.vlans.create(site=nb_device.site.id, vid=vid, name=name, status=status)
-                            logger.info(f"  [VLAN] 新增 VLAN: {vid} ({name})")
+                            logger.info("  [VLAN] 新增 VLAN: %s (%s)", vid, name)
                             vlan_map[vid] = new_vlan
                         else:
-                            logger.info(f"  [Dry-Run] Would Create VLAN: {vid} ({name})")
+                            logger.info("  [Dry-Run] Would Create VLAN: %s (%s)", vid, name)
                     except Exception as e:
                         logger.warning(f"  ⚠ 建立 VLAN {vid} 失敗: {e}")
             
@@ -246,22 +236,23 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
              logger.warning(f"  ⚠ 設備 {nb_device.name} 未指定 Site，無法同步 VLAN (需 Site Scope)")
         
     except Exception as e:
-        logger.debug(f"  ℹ 同步 VLAN 失敗: {e}")
+        logger.debug("  ℹ 同步 VLAN 失敗: %s", e)
 
     # 2. Sync Interfaces
+    timer.next('interface')
     # 建立 LibreNMS Port ID -> NetBox Interface ID 對照表
     port_id_map = {} 
     
     try:
-        logger.debug(f"  [Detail] Fetching ports for Device ID {libre_dev_id}...")
+        logger.debug("  [Detail] Fetching ports for Device ID %s...", libre_dev_id)
         try:
             # Request specific columns to Ensure we get VLAN data
             cols = "port_id,ifName,ifPhysAddress,ifAlias,ifAdminStatus,ifSpeed,ifVlan,ifTrunk,ifType"
-            resp = request_with_retry('GET', f"{librenms_url}/devices/{libre_dev_id}/ports", headers=headers, params={'columns': cols}, retry_count=1, logger=logger)
+            resp = request_with_retry('GET', f"{librenms_url}/devices/{libre_dev_id}/ports", headers=headers, params={'columns': cols}, retry_count=1, logger=logger, http=http)
         except Exception: resp = None
         
         ports = resp.json().get('ports', []) if resp and resp.status_code == 200 else []
-        logger.debug(f"  [Detail] Found {len(ports)} ports.")
+        logger.debug("  [Detail] Found %d ports.", len(ports))
         
         # 取得現有介面以避免重複呼叫
         nb_interfaces = {i.name: i for i in nb.dcim.interfaces.filter(device_id=nb_device.id)}
@@ -271,8 +262,9 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
             port_id = port.get('port_id')
             if not if_name or not port_id: continue
             
-            # 應用亂碼過濾與 MAC 格式化
-            clean_if_name = sanitize_string(if_name)
+            # 應用亂碼過濾、Type 對應 (interface_rules.py，與 Interface 同步共用) 與 MAC 格式化
+            info = classify(if_name, port.get('ifSpeed'))
+            clean_if_name = info.name
             clean_alias = sanitize_string(port.get('ifAlias') or '')
             formatted_mac = format_mac(port.get('ifPhysAddress'))
 
@@ -280,7 +272,7 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
             data = {
                 'device': nb_device.id,
                 'name': clean_if_name,
-                'type': '1000base-t', # 預設
+                'type': info.type,
                 'description': clean_alias,
                 'enabled': port.get('ifAdminStatus') == 'up'
             }
@@ -330,13 +322,6 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
             if tagged_vlans:
                 data['tagged_vlans'] = tagged_vlans
 
-            # 簡單的 Type 對應邏輯
-            speed = port.get('ifSpeed') or 0
-            if speed >= 10000000000: data['type'] = '10gbase-t'
-            elif speed >= 1000000000: data['type'] = '1000base-t'
-            elif speed >= 100000000:  data['type'] = '100base-tx'
-            elif 'vlan' in if_name.lower(): data['type'] = 'virtual'
-            
             # 檢查是否存在 (優先檢查原始名稱，再檢查清洗後的名稱以支援更名更新)
             nb_int = nb_interfaces.get(if_name) or nb_interfaces.get(clean_if_name)
 
@@ -394,11 +379,11 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
                                         assigned_object_type='dcim.interface',
                                         assigned_object_id=nb_int.id
                                     )
-                                    logger.info(f"  [MAC] 已連結 {formatted_mac} 到介面")
+                                    logger.info("  [MAC] 已連結 %s 到介面", formatted_mac)
                             except Exception as e:
                                 logger.warning(f"  ⚠ 無法建立 MAC 關聯 ({formatted_mac}): {e}")
 
-                        logger.info(f"  [Interface] 更新完成: {clean_if_name}")
+                        logger.info("  [Interface] 更新完成: %s", clean_if_name)
                      else:
                         mac_status = ""
                         if formatted_mac:
@@ -410,27 +395,29 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
                                 if nb_int.mac_address != formatted_mac:
                                     mac_status = f"MAC: {nb_int.mac_address} -> {formatted_mac}"
                         
-                        logger.info(f"  [Dry-Run] Would Update Interface {if_name} -> {clean_if_name} (Mode={mode}, {mac_status})")
+                        logger.info("  [Dry-Run] Would Update Interface %s -> %s (Mode=%s, %s)",
+                                    if_name, clean_if_name, mode, mac_status)
 
             else:
                 try:
                     if not dry_run:
-                        logger.info(f"  [Auto-Create] 建立介面: {clean_if_name}")
+                        logger.info("  [Auto-Create] 建立介面: %s", clean_if_name)
                         new_int = nb.dcim.interfaces.create(**data)
                         port_id_map[port_id] = new_int
                     else:
-                        logger.info(f"  [Dry-Run] Would Create Interface: {clean_if_name}")
+                        logger.info("  [Dry-Run] Would Create Interface: %s", clean_if_name)
                 except Exception as e:
                     logger.warning(f"  ⚠ 建立介面失敗 {clean_if_name}: {e}")
 
     except Exception as e:
-        logger.debug(f"  ℹ 同步介面失敗 (可能無 Ports 資料): {e}")
+        logger.debug("  ℹ 同步介面失敗 (可能無 Ports 資料): %s", e)
 
     # 3. Sync Inventory
+    timer.next('inventory')
     try:
         try:
              # Use /inventory/{id}/all instead of /devices/{id}/inventory to avoid 500 errors
-            resp = request_with_retry('GET', f"{librenms_url}/inventory/{libre_dev_id}/all", headers=headers, retry_count=1, logger=logger)
+            resp = request_with_retry('GET', f"{librenms_url}/inventory/{libre_dev_id}/all", headers=headers, retry_count=1, logger=logger, http=http)
         except Exception as e:
              logger.warning(f"  ⚠ 取得 Inventory 失敗 (Device ID {libre_dev_id}): {e}")
              resp = None
@@ -459,15 +446,17 @@ def sync_detailed_data(nb, nb_device, librenms_url, librenms_token, libre_dev_id
                              serial=serial,
                              manufacturer=None # 難以對應，先留空
                          )
-                         logger.info(f"  [Inventory] 新增組件: {safe_name}")
+                         logger.info("  [Inventory] 新增組件: %s", safe_name)
                      else:
-                         logger.info(f"  [Dry-Run] Would Add Inventory: {safe_name} (S/N: {serial})")
+                         logger.info("  [Dry-Run] Would Add Inventory: %s (S/N: %s)", safe_name, serial)
                  except Exception as e:
                      pass
                      
     except Exception as e:
-        logger.debug(f"  ℹ 同步 Inventory 失敗: {e}")
+        logger.debug("  ℹ 同步 Inventory 失敗: %s", e)
+    timer.stop()
 
+@traced()
 def update_primary_ip(nb, nb_device, ip_address, dry_run=False):
     """更新設備 IP 位址 (包含建立 Interface)"""
     if not ip_address: return
@@ -524,119 +513,279 @@ def update_primary_ip(nb, nb_device, ip_address, dry_run=False):
     except Exception as e:
         logger.error(f"  ❌ 設定 IP 失敗 ({ip_address}): {e}")
 
-def main():
-    logger.info("=" * 60)
-    logger.info(">>> 開始同步 (v6.0): LibreNMS -> NetBox (Comprehensive Sync)")
-    logger.info("=" * 60)
-
-    dry_run = get_env_var('DRY_RUN', 'False').lower() == 'true'
-    auto_create = get_env_var('AUTO_CREATE_NEW', 'True').lower() == 'true'
-    
-    if dry_run: logger.warning("⚠ DRY-RUN 模式啟用")
-
-    # --- Argument Parsing ---
-    import argparse
-    parser = argparse.ArgumentParser(description='Sync LibreNMS to NetBox')
-    parser.add_argument('--device', help='Sync specific device by hostname')
-    parser.add_argument('--dry-run', action='store_true', help='Simulate changes')
-    args = parser.parse_args()
-
-    target_device = args.device
-    if args.dry_run:
-        dry_run = True
-        logger.warning("⚠ DRY-RUN 模式啟用 (via CLI)")
-
-    if target_device:
-        auto_create = True
-        logger.info(f"🎯 指定同步設備: {target_device} (強制 Auto-Create)")
 
-    stats = {'created': 0, 'updated': 0, 'decommissioned': 0, 'recovered': 0, 'skipped': 0, 'failed': 0}
+ROLE_DEFS = {
+    'printer': {'name': 'Printer', 'color': '9e9e9e'},
+    'access-point': {'name': 'Access Point', 'color': '4caf50'},
+    'firewall': {'name': 'Firewall', 'color': 'f44336'},
+    'switch': {'name': 'Switch', 'color': '00bcd4'},
+    'server': {'name': 'Server', 'color': '3f51b5'},
+    'vm-host': {'name': 'VM Host', 'color': '673ab7'},
+    'network': {'name': 'Network', 'color': '2196f3'},
+}
 
-    # --- API 本體 ---
-    try:
-        import requests as req_lib
+def get_role_slug(device):
+    os_type = (device.get('os') or '').lower()
+    hardware = (device.get('hardware') or '').lower()
+    if 'printer' in os_type or 'printer' in hardware: return 'printer'
+    if os_type in ['fortigate', 'panos', 'paloalto'] or 'fortinet' in hardware: return 'firewall'
+    if os_type == 'arubaos' or 'access point' in hardware: return 'access-point'
+    if 'vmware' in os_type or 'esxi' in hardware: return 'vm-host'
+    if os_type in ['ios', 'iosxe', 'nxos', 'junos', 'routeros', 'edgeos'] or 'switch' in hardware: return 'switch'
+    if os_type in ['linux', 'windows', 'windows', 'freebsd', 'ubuntu', 'centos', 'debian']: return 'server'
+    return 'network'
+
+def match_devices(librenms_devices, target_device):
+    """依 device_id / sysName / hostname 篩選設備 (完全相符優先於部分相符)。"""
+    target = str(target_device).lower()
+    matches = [d for d in librenms_devices if
+               target == str(d.get('device_id')) or
+               target in (d.get('sysName') or '').lower() or
+               target in (d.get('hostname') or '').lower()]
+    # If multiple matches found but one is an exact ID or Name match, prioritize it
+    exact_matches = [d for d in matches if
+                     target == str(d.get('device_id')) or
+                     target == (d.get('sysName') or '').lower() or
+                     target == (d.get('hostname') or '').lower()]
+    return exact_matches or matches
+
+class LibreNMSSyncer:
+    """可常駐重複使用的同步器。
+
+    維持 NetBox / LibreNMS 連線、參考資料 (Role / Site / Platform / Manufacturer /
+    Device Type) 快取與 LibreNMS 設備清單，供 webhook_receiver.py 於行程內
+    直接同步單一設備，不必每次啟動新的 Python 行程。
+    """
+
+    def __init__(self, nb, librenms_url, librenms_token, dry_run=False, auto_create=True,
+                 http=None, ref_ttl=None, device_ttl=None, leases=None, lease_wait=0, feed=None, source='sync_librenms',
+                 index_min_age=None):
+        self.nb = nb
+        self.librenms_url = librenms_url
+        self.librenms_token = librenms_token
+        self.dry_run = dry_run
+        self.auto_create = auto_create
+        self.http = http or requests.Session()
+        self.http.headers.update({'X-Auth-Token': librenms_token})
+        self.http.verify = False
+        self.ref_ttl = ref_ttl if ref_ttl is not None else REF_CACHE_TTL
+        self.device_ttl = device_ttl if device_ttl is not None else DEVICE_LIST_TTL
+        self.index_min_age = index_min_age if index_min_age is not None else DEVICE_INDEX_MIN_AGE
+        # 跨行程協調 (coordination.py)：同一設備同時只由一個行程同步
+        self.leases = leases
+        self.lease_wait = lease_wait
+        # 變更事件流 (change_feed.py)；run_id 標示同一批次的變更。
+        # self.run_id 供單執行緒的 CLI 執行使用；sync_hostnames 的批次 run_id 存於執行緒區域變數，
+        # Webhook 的多個 Worker 共用同一個 Syncer 時不會互相覆寫
+        self.feed = feed
+        self.source = source
+        self.run_id = new_run_id()
+        self._batch = threading.local()
+
+        # 本次建立或變更的設備 (NetBox 名稱 -> LibreNMS device_id)，供 sync_pipeline 下游階段使用
+        self.changed = {}
+        self._changed_lock = threading.Lock()
+
+        self._refs = {}                  # (kind, key) -> (時間, Record)
+        self._ref_lock = threading.RLock()
+        self._devices = None
+        self._index = {}
+        self._devices_at = 0
+        self._devices_lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, dry_run=None, auto_create=None, owner='sync_librenms', lease_wait=0):
         import urllib3
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        
+
         nb = pynetbox.api(get_env_var('NETBOX_URL', required=True), token=get_env_var('NETBOX_TOKEN', required=True))
-        nb.http_session.verify = False 
-        
-        librenms_url = get_env_var('LIBRENMS_URL', required=True)
-        librenms_token = get_env_var('LIBRENMS_TOKEN', required=True)
-    except SystemExit:
-        sys.exit(1)
-    except Exception as e:
-        logger.error(f"API 初始化失敗: {e}")
-        sys.exit(1)
+        nb.http_session.verify = False
+        if dry_run is None:
+            dry_run = get_env_var('DRY_RUN', 'False').lower() == 'true'
+        if auto_create is None:
+            auto_create = get_env_var('AUTO_CREATE_NEW', 'True').lower() == 'true'
+        leases = feed = None
+        if not dry_run:
+            try:
+                leases = DeviceLeases(owner)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"⚠ 無法開啟協調資料庫，停用設備租約: {e}")
+            try:
+                feed = ChangeFeed()
+            except OSError as e:
+                logger.warning(f"⚠ 無法開啟變更事件流，停用: {e}")
+        return cls(nb, get_env_var('LIBRENMS_URL', required=True), get_env_var('LIBRENMS_TOKEN', required=True),
+                   dry_run=dry_run, auto_create=auto_create, leases=leases, lease_wait=lease_wait,
+                   feed=feed, source=owner)
+
+    # --- 參考資料快取 ---
+    def _ref(self, kind, key, loader):
+        """TTL 快取；查無 (None) 的結果不快取，下次會重新查詢/建立。"""
+        with self._ref_lock:
+            hit = self._refs.get((kind, key))
+            if hit and time.time() - hit[0] < self.ref_ttl:
+                return hit[1]
+            value = loader()
+            if value:
+                self._refs[(kind, key)] = (time.time(), value)
+            return value
+
+    def invalidate_refs(self):
+        with self._ref_lock:
+            self._refs.clear()
+
+    def ensure_role(self, slug):
+        def load():
+            role = self.nb.dcim.device_roles.get(slug=slug)
+            if not role and not self.dry_run:
+                info = ROLE_DEFS.get(slug, ROLE_DEFS['network'])
+                role = self.nb.dcim.device_roles.create(name=info['name'], slug=slug, color=info['color'])
+                logger.info(f"  [Auto-Create] 建立新角色: {info['name']} ({slug})")
+            return role
+        return self._ref('role', slug, load)
+
+    def default_site(self):
+        def load():
+            try:
+                site = self.nb.dcim.sites.get(slug='main-site')
+                if not site and not self.dry_run:
+                    site = self.nb.dcim.sites.create(name='Main Site', slug='main-site', status='active')
+                return site
+            except Exception:
+                return None
+        return self._ref('site', 'main-site', load)
+
+    def get_site(self, location):
+        return self._ref('site', normalize_slug(location),
+                         lambda: get_or_create_site(self.nb, location, self.dry_run))
+
+    def get_platform(self, mfr_name, os_name, version):
+        return self._ref('platform', (mfr_name, os_name, version),
+                         lambda: get_or_create_platform(self.nb, mfr_name, os_name, version, self.dry_run))
+
+    def get_manufacturer(self, mfr_name):
+        mfr_slug = normalize_slug(mfr_name)
+        def load():
+            mfr = self.nb.dcim.manufacturers.get(slug=mfr_slug)
+            if not mfr and not self.dry_run:
+                mfr = self.nb.dcim.manufacturers.create(name=mfr_name, slug=mfr_slug)
+            return mfr
+        return self._ref('manufacturer', mfr_slug, load)
+
+    def get_device_type(self, hardware, mfr):
+        dt_slug = normalize_slug(hardware)
+        def load():
+            dt = self.nb.dcim.device_types.get(slug=dt_slug)
+            if not dt and not self.dry_run and mfr:
+                dt = self.nb.dcim.device_types.create(manufacturer=mfr.id, model=hardware, slug=dt_slug, u_height=1)
+            return dt
+        return self._ref('device_type', dt_slug, load)
+
+    # --- LibreNMS 設備清單 ---
+    def refresh_devices(self):
+        with phase('fetch'):
+            resp = request_with_retry('GET', f"{self.librenms_url}/devices", retry_count=RETRY_COUNT,
+                                      logger=logger, http=self.http)
+        devices = resp.json().get('devices', [])
+        index = {}
+        for d in devices:
+            for key in (d.get('device_id'), d.get('hostname'), d.get('sysName')):
+                if key is not None and key != '':
+                    index.setdefault(str(key).lower(), d.get('device_id'))
+        with self._devices_lock:
+            self._devices, self._index, self._devices_at = devices, index, time.time()
+        return devices
+
+    def devices(self, force=False):
+        """回傳快取的 LibreNMS 設備清單 (過期或強制時重新取得)。"""
+        with self._devices_lock:
+            fresh = self._devices is not None and time.time() - self._devices_at < self.device_ttl
+            if fresh and not force:
+                return self._devices
+        return self.refresh_devices()
+
+    def device_index(self, force=False):
+        """hostname / sysName / device_id (小寫) -> device_id 對照表。"""
+        self.devices(force=force)
+        with self._devices_lock:
+            return self._index
+
+    def get_device(self, key):
+        """以 /devices/{hostname 或 id} 直接取得單一設備；查無回傳 None。"""
+        try:
+            with phase('fetch'):
+                resp = request_with_retry('GET', f"{self.librenms_url}/devices/{quote(str(key), safe='')}",
+                                          retry_count=1, logger=logger, http=self.http)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code in (400, 404):
+                return None
+            raise
+        devices = resp.json().get('devices') or []
+        return devices[0] if devices else None
+
+    def fetch_device(self, target_device):
+        """直接查詢目標設備，成本與設備總數無關。
+
+        LibreNMS 的 /devices/{hostname} 只比對 hostname 欄位，以 sysName 查詢時
+        改用快取的對照表取得 device_id 後再查一次。對照表未命中時，只有在
+        已建立超過 index_min_age 秒時才重新下載，整份清單每次最多下載一次。
+        """
+        dev = self.get_device(target_device)
+        if dev:
+            return dev
+        key = str(target_device).lower()
+        device_id = self.device_index().get(key)
+        with self._devices_lock:
+            age = time.time() - self._devices_at
+        if device_id is None and age >= self.index_min_age:
+            # 快取建立後才加入 LibreNMS 的設備；對照表剛建立時不重複下載
+            device_id = self.device_index(force=True).get(key)
+        if device_id is not None and str(device_id) != key:
+            return self.get_device(device_id)
+        return None
 
-    # --- Fetch ---
-    try:
-        headers = {'X-Auth-Token': librenms_token}
-        resp = request_with_retry('GET', f"{librenms_url}/devices", headers=headers, retry_count=RETRY_COUNT, logger=logger)
-        librenms_devices = resp.json().get('devices', [])
-        
-        if target_device:
-            librenms_devices = [d for d in librenms_devices if 
-                                str(target_device) == str(d.get('device_id')) or
-                                target_device.lower() == (d.get('sysName') or '').lower() or 
-                                target_device.lower() == (d.get('hostname') or '').lower() or
-                                target_device.lower() in (d.get('sysName') or '').lower() or 
-                                target_device.lower() in (d.get('hostname') or '').lower()]
-            # If multiple matches found but one is an exact ID or Name match, prioritize it
-            exact_matches = [d for d in librenms_devices if 
-                             str(target_device) == str(d.get('device_id')) or
-                             target_device.lower() == (d.get('sysName') or '').lower() or 
-                             target_device.lower() == (d.get('hostname') or '').lower()]
-            if exact_matches:
-                librenms_devices = exact_matches
-
-        logger.info(f"從 LibreNMS 取得 {len(librenms_devices)} 台設備")
-    except Exception as e:
-        logger.error(f"取得 LibreNMS 設備列表失敗: {e}")
-        sys.exit(1)
+    def find_devices(self, target_device):
+        """查詢目標設備：先直接查詢，查無時才以快取清單做部分比對。"""
+        dev = self.fetch_device(target_device)
+        if dev:
+            return [dev]
+        return match_devices(self.devices(), target_device)
+
+    def _refresh_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh_devices()
+            except Exception as e:
+                logger.warning(f"⚠ 背景更新 LibreNMS 設備清單失敗: {e}")
+
+    def start_refresher(self, interval=None):
+        """啟動背景執行緒定期更新設備清單，讓 Webhook 查詢永遠命中快取。"""
+        interval = interval or self.device_ttl / 2
+        self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,),
+                                           name='librenms-refresher', daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._refresher:
+            self._refresher.join()
+
+    # --- 同步 ---
+    def sync_device(self, dev, stats):
+        """同步單一 LibreNMS 設備至 NetBox。"""
+        with span('sync_device', cat='device', hostname=dev.get('sysName') or dev.get('hostname'),
+                  device_id=dev.get('device_id')):
+            timer = PhaseTimer('refs')
+            try:
+                self._sync_device(dev, stats, timer)
+            finally:
+                timer.stop()
+
+    def _sync_device(self, dev, stats, timer):
+        nb, dry_run = self.nb, self.dry_run
 
-    # --- Role Helper ---
-    role_cache = {}
-    def ensure_role(slug):
-        if slug in role_cache: return role_cache[slug]
-        role_defs = {
-            'printer': {'name': 'Printer', 'color': '9e9e9e'},
-            'access-point': {'name': 'Access Point', 'color': '4caf50'},
-            'firewall': {'name': 'Firewall', 'color': 'f44336'},
-            'switch': {'name': 'Switch', 'color': '00bcd4'},
-            'server': {'name': 'Server', 'color': '3f51b5'},
-            'vm-host': {'name': 'VM Host', 'color': '673ab7'},
-            'network': {'name': 'Network', 'color': '2196f3'},
-        }
-        role = nb.dcim.device_roles.get(slug=slug)
-        if not role and not dry_run:
-            info = role_defs.get(slug, role_defs['network'])
-            role = nb.dcim.device_roles.create(name=info['name'], slug=slug, color=info['color'])
-            logger.info(f"  [Auto-Create] 建立新角色: {info['name']} ({slug})")
-        if role: role_cache[slug] = role
-        return role
-
-    def get_role_slug(device):
-        os_type = (device.get('os') or '').lower()
-        hardware = (device.get('hardware') or '').lower()
-        if 'printer' in os_type or 'printer' in hardware: return 'printer'
-        if os_type in ['fortigate', 'panos', 'paloalto'] or 'fortinet' in hardware: return 'firewall'
-        if os_type == 'arubaos' or 'access point' in hardware: return 'access-point'
-        if 'vmware' in os_type or 'esxi' in hardware: return 'vm-host'
-        if os_type in ['ios', 'iosxe', 'nxos', 'junos', 'routeros', 'edgeos'] or 'switch' in hardware: return 'switch'
-        if os_type in ['linux', 'windows', 'windows', 'freebsd', 'ubuntu', 'centos', 'debian']: return 'server'
-        return 'network'
-
-    # --- Default Site ---
-    try:
-        site_slug = 'main-site'
-        default_site = nb.dcim.sites.get(slug=site_slug)
-        if not default_site and not dry_run:
-             default_site = nb.dcim.sites.create(name='Main Site', slug=site_slug, status='active')
-    except Exception: pass
-
-    # --- Main Loop ---
-    for dev in librenms_devices:
         hostname = dev.get('sysName') or dev.get('hostname')
         if not hostname: hostname = f"Unknown-{dev.get('device_id')}"
         
@@ -648,139 +797,334 @@ def main():
         if ip_addr and ',' in ip_addr: ip_addr = ip_addr.split(',')[0] # 若有多個IP取第一個
         
         location = dev.get('location') # LibreNMS sysLocation
-        description = dev.get('sysDescr') # Full Description
         display_name = dev.get('display') # Generic display name
 
         is_down = str(dev.get('status', '')).lower() in ['0', 'down', 'false']
 
-        try:
-            # 1. 準備必要關聯資料 (Manufacturer, Type, Role, Platform)
-            mfr_name = get_manufacturer_name(dev)
-            mfr_slug = normalize_slug(mfr_name)
-            
-            # 若廠商不是 Generic 但硬體是 Generic，則將硬體名稱改為 "{廠商} Generic"
-            if mfr_name != 'Generic' and hardware == 'Generic':
-                hardware = f"{mfr_name} Generic"
-            
-            target_role = ensure_role(get_role_slug(dev))
+        # 1. 準備必要關聯資料 (Manufacturer, Type, Role, Platform)
+        mfr_name = get_manufacturer_name(dev)
+        
+        # 若廠商不是 Generic 但硬體是 Generic，則將硬體名稱改為 "{廠商} Generic"
+        if mfr_name != 'Generic' and hardware == 'Generic':
+            hardware = f"{mfr_name} Generic"
+        
+        target_role = self.ensure_role(get_role_slug(dev))
+        
+        # [v6.0] Site (Location)
+        target_site = self.default_site()
+        if location:
+            loc_site = self.get_site(location)
+            if loc_site: target_site = loc_site
+        
+        # Platform (OS)
+        target_platform = self.get_platform(mfr_name, os_name, version)
+        
+        # Manufacturer & Device Type
+        mfr = self.get_manufacturer(mfr_name)
+        dt = self.get_device_type(hardware, mfr)
+
+        # 2. 搜尋設備 (優先 Serial，次之 Name)
+        timer.next('device')
+        nb_device = None
+        if serial: nb_device = nb.dcim.devices.get(serial=serial)
+        if not nb_device: nb_device = nb.dcim.devices.get(name=hostname)
+
+        # 3. 更新或建立
+        if nb_device:
+            # === Update Logic (Full Update) ===
+            changes = []
+            events = []  # 結構化變更 (change_feed)
+            def record(field, old, new):
+                events.append(change_event(nb_device.name, field, old, new, device_id=nb_device.id))
             
-            # [v6.0] Site (Location)
-            target_site = default_site
-            if location:
-                loc_site = get_or_create_site(nb, location, dry_run)
-                if loc_site: target_site = loc_site
+            # [v6.0] Update Site
+            if target_site and nb_device.site.id != target_site.id:
+                old_site = nb_device.site.name if hasattr(nb_device.site, 'name') else str(nb_device.site)
+                if not dry_run: nb_device.site = target_site.id
+                changes.append(f"Site: {old_site}->{target_site.name}")
+                record('site', old_site, target_site.name)
+                
+            # [v6.0] Update Description/Comments
+            if display_name and nb_device.description != display_name:
+                record('description', nb_device.description, display_name)
+                if not dry_run: nb_device.description = display_name
+                changes.append("Desc Update")
             
-            # Platform (OS)
-            target_platform = get_or_create_platform(nb, mfr_name, os_name, version, dry_run)
+            # 檢查 Status
+            current_status = nb_device.status.value if nb_device.status else 'unknown'
+            target_status = 'decommissioning' if is_down else 'active'
+            if current_status != target_status:
+                if not dry_run: nb_device.status = target_status
+                changes.append(f"Status: {current_status}->{target_status}")
+                record('status', current_status, target_status)
+
+            # 檢查 Role
+            current_role_id = nb_device.role.id if nb_device.role else None
+            if target_role and current_role_id != target_role.id:
+                old_role = nb_device.role.name if hasattr(nb_device.role, 'name') else str(nb_device.role)
+                if not dry_run: nb_device.role = target_role.id
+                changes.append(f"Role: {old_role}->{target_role.name}")
+                record('role', old_role, target_role.name)
+
+            # 檢查 Device Type (Model)
+            # Pynetbox 可能回傳 id (int) 或 Record (object)
+            current_dt_id = nb_device.device_type.id if hasattr(nb_device.device_type, 'id') else nb_device.device_type
             
-            # Manufacturer & Device Type
-            mfr = nb.dcim.manufacturers.get(slug=mfr_slug)
-            if not mfr and not dry_run:
-                mfr = nb.dcim.manufacturers.create(name=mfr_name, slug=mfr_slug)
+            if dt and current_dt_id != dt.id:
+                record('device_type', getattr(nb_device.device_type, 'model', current_dt_id), dt.model)
+                if not dry_run: nb_device.device_type = dt.id
+                changes.append(f"Type: Update to {dt.model}")
+
+            # 檢查 Platform (OS)
+            current_platform_id = nb_device.platform.id if nb_device.platform else None
+            if target_platform and current_platform_id != target_platform.id:
+                 record('platform', nb_device.platform.name if nb_device.platform else None, target_platform.name)
+                 if not dry_run: nb_device.platform = target_platform.id
+                 changes.append(f"Platform: -> {target_platform.name}")
+
+            # 檢查 Serial
+            if serial and nb_device.serial != serial:
+                record('serial', nb_device.serial, serial)
+                if not dry_run: nb_device.serial = serial
+                changes.append(f"Serial: Update")
+
+            if changes:
+                if not dry_run: nb_device.save()
+                logger.info(f"  [Updated] {hostname}: {', '.join(changes)}")
+                stats['updated'] += 1
+                self._mark_changed(nb_device.name, dev)
+                if not dry_run: self._emit(events)
+
+            # 更新 IP (Independent Check)
+            timer.next('ip')
+            update_primary_ip(nb, nb_device, ip_addr, dry_run)
+            # [v6.0] Detailed Sync (各階段自行計時)
+            timer.stop()
+            sync_detailed_data(nb, nb_device, self.librenms_url, self.librenms_token, dev.get('device_id'), dry_run, http=self.http)
+
+        else:
+            # === Create Logic ===
+            if not self.auto_create:
+                logger.info(f"  [Skip New] {hostname} (Auto-Create=False)")
+                stats['skipped'] += 1
+                return
             
-            dt_slug = normalize_slug(hardware)
-            dt = nb.dcim.device_types.get(slug=dt_slug)
-            if not dt and not dry_run and mfr:
-                dt = nb.dcim.device_types.create(manufacturer=mfr.id, model=hardware, slug=dt_slug, u_height=1)
-
-            # 2. 搜尋設備 (優先 Serial，次之 Name)
-            nb_device = None
-            if serial: nb_device = nb.dcim.devices.get(serial=serial)
-            if not nb_device: nb_device = nb.dcim.devices.get(name=hostname)
-
-            # 3. 更新或建立
-            if nb_device:
-                # === Update Logic (Full Update) ===
-                changes = []
-                
-                # [v6.0] Update Site
-                if target_site and nb_device.site.id != target_site.id:
-                    old_site = nb_device.site.name if hasattr(nb_device.site, 'name') else str(nb_device.site)
-                    if not dry_run: nb_device.site = target_site.id
-                    changes.append(f"Site: {old_site}->{target_site.name}")
-                    
-                # [v6.0] Update Description/Comments
-                if display_name and nb_device.description != display_name:
-                    if not dry_run: nb_device.description = display_name
-                    changes.append("Desc Update")
-                
-                # 檢查 Status
-                current_status = nb_device.status.value if nb_device.status else 'unknown'
-                target_status = 'decommissioning' if is_down else 'active'
-                if current_status != target_status:
-                    if not dry_run: nb_device.status = target_status
-                    changes.append(f"Status: {current_status}->{target_status}")
-
-                # 檢查 Role
-                current_role_id = nb_device.role.id if nb_device.role else None
-                if target_role and current_role_id != target_role.id:
-                    old_role = nb_device.role.name if hasattr(nb_device.role, 'name') else str(nb_device.role)
-                    if not dry_run: nb_device.role = target_role.id
-                    changes.append(f"Role: {old_role}->{target_role.name}")
-
-                # 檢查 Device Type (Model)
-                # Pynetbox 可能回傳 id (int) 或 Record (object)
-                current_dt_id = nb_device.device_type.id if hasattr(nb_device.device_type, 'id') else nb_device.device_type
+            if not dry_run and dt and target_role and target_site:
+                new_status = 'decommissioning' if is_down else 'active'
+                nb_device = nb.dcim.devices.create(
+                    name=hostname,
+                    device_type=dt.id,
+                    role=target_role.id,
+                    site=target_site.id,
+                    serial=serial or '',
+                    status=new_status,
+                    platform=target_platform.id if target_platform else None,
+                    description=display_name or ''
+                )
+                logger.info(f"  ✅ [Created] {hostname} (Type={dt.model}, Platform={target_platform.name if target_platform else 'None'})")
+                stats['created'] += 1
+                self._mark_changed(hostname, dev)
+                self._emit([change_event(hostname, None, None, {
+                    'site': target_site.name, 'status': new_status, 'role': target_role.name,
+                    'device_type': dt.model, 'platform': target_platform.name if target_platform else None,
+                    'serial': serial or '',
+                }, action='create', device_id=nb_device.id)])
                 
-                if dt and current_dt_id != dt.id:
-                    if not dry_run: nb_device.device_type = dt.id
-                    changes.append(f"Type: Update to {dt.model}")
-
-                # 檢查 Platform (OS)
-                current_platform_id = nb_device.platform.id if nb_device.platform else None
-                if target_platform and current_platform_id != target_platform.id:
-                     if not dry_run: nb_device.platform = target_platform.id
-                     changes.append(f"Platform: -> {target_platform.name}")
-
-                # 檢查 Serial
-                if serial and nb_device.serial != serial:
-                    if not dry_run: nb_device.serial = serial
-                    changes.append(f"Serial: Update")
-
-                if changes:
-                    if not dry_run: nb_device.save()
-                    logger.info(f"  [Updated] {hostname}: {', '.join(changes)}")
-                    stats['updated'] += 1
-                else:
-                    # 無變更
-                    pass
+                # 建立後直接綁定 IP 與詳細資料
+                timer.next('ip')
+                update_primary_ip(nb, nb_device, ip_addr)
+                timer.stop()
+                sync_detailed_data(nb, nb_device, self.librenms_url, self.librenms_token, dev.get('device_id'), dry_run, http=self.http)
+            elif dry_run:
+                logger.info(f"  (Dry-Run) Would Create: {hostname}")
+                self._mark_changed(hostname, dev)
+
+    def _emit(self, events):
+        """寫入變更事件流；失敗只記錄警告，不影響同步。"""
+        if not self.feed or not events:
+            return
+        try:
+            self.feed.append(events, run_id=self.current_run_id(), source=self.source)
+        except Exception as e:
+            logger.warning(f"⚠ 變更事件寫入失敗: {e}")
+
+    def current_run_id(self):
+        """目前執行緒所屬批次的 run_id (無批次時為 self.run_id)。"""
+        return getattr(self._batch, 'run_id', None) or self.run_id
+
+    def _mark_changed(self, name, dev):
+        with self._changed_lock:
+            self.changed[name] = dev.get('device_id')
+
+    def pop_changed(self):
+        """取出並清空目前累積的變更設備 {NetBox 名稱: LibreNMS device_id}。"""
+        with self._changed_lock:
+            changed, self.changed = self.changed, {}
+        return changed
+
+    def _sync_leased(self, dev, stats, since=None):
+        """取得設備租約後同步；其他行程同步中，或 since 之後已同步過則略過。"""
+        if not self.leases:
+            self.sync_device(dev, stats)
+            return
+        key = dev.get('device_id')
+        hostname = dev.get('sysName') or dev.get('hostname')
+        if not self.leases.acquire(key, wait=self.lease_wait):
+            stats['skipped'] += 1
+            return
+        started_at = None
+        try:
+            done = self.leases.synced_since(key, since) if since else None
+            if done:
+                logger.info(f"  ⏭ {hostname} 已由 {done['owner']} 於告警後同步，略過")
+                stats['skipped'] += 1
+                return
+            started = time.time()
+            self.sync_device(dev, stats)
+            started_at = started
+        finally:
+            self.leases.release(key, started_at, aliases=(dev.get('hostname'), dev.get('sysName')))
+
+    def sync_all(self, librenms_devices, stats=None, since=None):
+        stats = stats if stats is not None else new_stats()
+        for dev in librenms_devices:
+            try:
+                self._sync_leased(dev, stats, since)
+            except Exception as e:
+                hostname = dev.get('sysName') or dev.get('hostname') or f"Unknown-{dev.get('device_id')}"
+                logger.error(f"  ❌ {hostname} 處理失敗: {e}")
+                stats['failed'] += 1
+                # 快取的參考資料可能已在 NetBox 被刪除，下次重新查詢
+                self.invalidate_refs()
+        return stats
+
+    def sync_hostnames(self, hostnames, since=None):
+        """批次同步多台設備 (共用連線與快取)，回傳 {hostname: (success, stats)}。
+
+        同一批次中多個 hostname 解析到同一台設備時只同步一次。
+        since 為 {hostname: 時間}：該時間之後已由其他行程完成同步的設備直接略過。
+        """
+        self._batch.run_id = new_run_id()
+        try:
+            return self._sync_hostnames(hostnames, since or {})
+        finally:
+            self._batch.run_id = None
+
+    def _sync_hostnames(self, hostnames, since):
+        results, synced = {}, set()
+        for hostname in hostnames:
+            done = self.leases.synced_since(hostname, since[hostname]) if (self.leases and since.get(hostname)) else None
+            if done:
+                logger.info(f"⏭ {hostname} 已由 {done['owner']} 於告警後同步，略過")
+                results[hostname] = (True, f"already synced by {done['owner']}")
+                continue
+            try:
+                devices = self.find_devices(hostname)
+            except Exception as e:
+                logger.error(f"❌ 查詢 LibreNMS 設備失敗 ({hostname}): {e}")
+                stats = new_stats()
+                stats['failed'] = 1
+                results[hostname] = (False, stats)
+                continue
+            if not devices:
+                logger.warning(f"⚠ LibreNMS 中找不到設備: {hostname}")
+                results[hostname] = (False, f"{hostname} not found in LibreNMS")
+                continue
+            devices = [d for d in devices if d.get('device_id') not in synced]
+            synced.update(d.get('device_id') for d in devices)
+            logger.info(f"🎯 同步設備: {hostname} ({len(devices)} 台)")
+            stats = self.sync_all(devices, since=since.get(hostname))
+            results[hostname] = (stats['failed'] == 0, stats)
+        return results
+
+    def sync_hostname(self, hostname):
+        """同步單一設備 (供 job_queue 使用)，回傳 (success, stats)。"""
+        return self.sync_hostnames([hostname])[hostname]
+
+def read_device_list(path):
+    """讀取設備清單檔 (每行一台，# 開頭為註解；'-' 表示 stdin)。"""
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
-                # 更新 IP (Independent Check)
-                update_primary_ip(nb, nb_device, ip_addr, dry_run)
-                # [v6.0] Detailed Sync
-                sync_detailed_data(nb, nb_device, librenms_url, librenms_token, dev.get('device_id'), dry_run)
+def new_stats():
+    return {'created': 0, 'updated': 0, 'decommissioned': 0, 'recovered': 0, 'skipped': 0, 'failed': 0}
 
-            else:
-                # === Create Logic ===
-                if not auto_create:
-                    logger.info(f"  [Skip New] {hostname} (Auto-Create=False)")
-                    stats['skipped'] += 1
-                    continue
-                
-                if not dry_run and dt and target_role and target_site:
-                    new_status = 'decommissioning' if is_down else 'active'
-                    nb_device = nb.dcim.devices.create(
-                        name=hostname,
-                        device_type=dt.id,
-                        role=target_role.id,
-                        site=target_site.id,
-                        serial=serial or '',
-                        status=new_status,
-                        platform=target_platform.id if target_platform else None,
-                        description=display_name or ''
-                    )
-                    logger.info(f"  ✅ [Created] {hostname} (Type={dt.model}, Platform={target_platform.name if target_platform else 'None'})")
-                    stats['created'] += 1
-                    
-                    # 建立後直接綁定 IP 與詳細資料
-                    update_primary_ip(nb, nb_device, ip_addr)
-                    sync_detailed_data(nb, nb_device, librenms_url, librenms_token, dev.get('device_id'), dry_run)
-                elif dry_run:
-                    logger.info(f"  (Dry-Run) Would Create: {hostname}")
+def main():
+    logger.info("=" * 60)
+    logger.info(">>> 開始同步 (v6.0): LibreNMS -> NetBox (Comprehensive Sync)")
+    logger.info("=" * 60)
 
-        except Exception as e:
-            logger.error(f"  ❌ {hostname} 處理失敗: {e}")
-            stats['failed'] += 1
+    dry_run = get_env_var('DRY_RUN', 'False').lower() == 'true'
+    auto_create = get_env_var('AUTO_CREATE_NEW', 'True').lower() == 'true'
+    
+    if dry_run: logger.warning("⚠ DRY-RUN 模式啟用")
+
+    # --- Argument Parsing ---
+    import argparse
+    parser = argparse.ArgumentParser(description='Sync LibreNMS to NetBox')
+    parser.add_argument('--device', action='append', default=[], help='Sync specific device by hostname (可重複指定)')
+    parser.add_argument('--devices-from', metavar='FILE', help="從檔案讀取設備清單 (每行一台，'-' 為 stdin)")
+    parser.add_argument('--dry-run', action='store_true', help='Simulate changes')
+    add_profile_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+    install_from_env(logger)
+    instrumentation.install()
+    start_profile(args.profile, 'sync_librenms', logger)
+    start_tracing(args.trace, 'sync_librenms', logger)
+
+    target_devices = list(args.device)
+    if args.devices_from:
+        target_devices += read_device_list(args.devices_from)
+    target_devices = list(dict.fromkeys(target_devices))
+    if args.dry_run:
+        dry_run = True
+        logger.warning("⚠ DRY-RUN 模式啟用 (via CLI)")
+
+    if target_devices:
+        auto_create = True
+        logger.info(f"🎯 指定同步設備: {', '.join(target_devices)} (強制 Auto-Create)")
+
+    # --- API 本體 ---
+    try:
+        syncer = LibreNMSSyncer.from_env(dry_run=dry_run, auto_create=auto_create,
+                                         lease_wait=LEASE_WAIT if target_devices else 0)
+    except SystemExit:
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"API 初始化失敗: {e}")
+        sys.exit(1)
+
+    if target_devices:
+        # --- 指定設備 (單台或批次)：直接查詢，不下載整份設備清單 ---
+        stats = new_stats()
+        for success, detail in syncer.sync_hostnames(target_devices).values():
+            if isinstance(detail, dict):
+                for k, v in detail.items():
+                    stats[k] += v
+            else:
+                stats['skipped'] += 1  # LibreNMS 查無此設備
+    else:
+        # 全量同步同時只允許一個 (含 sync_librenms_interfaces.py)
+        try:
+            with run_lock('full-sync', wait=RUN_LOCK_WAIT):
+                # --- Fetch ---
+                try:
+                    librenms_devices = syncer.devices()
+                    logger.info(f"從 LibreNMS 取得 {len(librenms_devices)} 台設備")
+                except Exception as e:
+                    logger.error(f"取得 LibreNMS 設備列表失敗: {e}")
+                    sys.exit(1)
+
+                # --- Main Loop ---
+                stats = syncer.sync_all(librenms_devices)
+        except RunLockBusy:
+            logger.warning(f"⚠ 其他全量同步執行中 (等待 {RUN_LOCK_WAIT} 秒仍未結束)，本次略過")
+            return
 
     save_metrics(METRICS_FILE, 'librenms_to_netbox', stats)
     logger.info("<<< 同步完成")
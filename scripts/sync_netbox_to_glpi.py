@@ -3,16 +3,28 @@
 # sync_netbox_to_glpi.py - IT Nexus v6.0 企業級同步腳本 (模組化版)
 # 用途：將 NetBox (Source of Truth) 中 Active 設備同步至 GLPI
 # 執行身份：netbox 系統帳號
+#
+# 用法：
+#   python3 sync_netbox_to_glpi.py             # 全部 Active 設備
+#   python3 sync_netbox_to_glpi.py --changes   # 只同步變更事件流 (change_feed) 中的新變更
 # =============================================================================
 
 import os
 import sys
+import argparse
 import pynetbox
 import requests
 from dotenv import load_dotenv
 
 # 匯入 IT Nexus 自定義工具模組
-from utils import setup_logging, save_metrics, request_with_retry, get_env_var
+from utils import setup_logging, save_metrics, request_with_retry, get_env_var, filter_devices_by_name
+from glpi_session import GlpiSessionManager, GlpiSessionError
+from change_feed import ChangeFeed
+from http_cassette import install_from_env
+import instrumentation
+from profiling import add_profile_argument, start_profile
+from tracing import add_trace_argument, start_tracing, traced
+from instrumentation import phase
 
 # --- 載入環境變數 ---
 ENV_PATH = '/opt/netbox/scripts/.env'
@@ -24,6 +36,8 @@ logger = setup_logging('/var/log/it_nexus/sync_glpi.log')
 # --- 配置 ---
 RETRY_COUNT = int(get_env_var('RETRY_COUNT', '3'))
 METRICS_FILE = get_env_var('METRICS_FILE_GLPI', '/var/log/it_nexus/metrics_glpi.json')
+FEED_CONSUMER = 'sync_glpi'
+FEED_BATCH = int(get_env_var('GLPI_FEED_BATCH', '1000'))
 
 # 資產分類對照表 (NetBox Role slug -> GLPI Endpoint)
 ROLE_TO_ENDPOINT = {
@@ -35,28 +49,38 @@ ROLE_TO_ENDPOINT = {
 }
 DEFAULT_GLPI_ENDPOINT = 'Computer'  # 未知角色的預設對應
 
-def init_glpi_session(glpi_url, app_token, user_token):
-    """初始化 GLPI API 工作階段。"""
-    # 修正：確保 URL 不會以 / 結尾，避免 // 雙斜線問題
-    glpi_url = glpi_url.rstrip('/')
-    
-    headers = {'App-Token': app_token, 'Authorization': f'user_token {user_token}'}
-    # 修正：完整路徑拼接，修正 404 錯誤
-    init_url = f'{glpi_url}/initSession'
-    
+def init_glpi_session(glpi_url, app_token, user_token, http=None):
+    """取得 GLPI Session 管理器 (優先沿用磁碟快取中仍有效的 Session)。"""
+    glpi = GlpiSessionManager(glpi_url, app_token, user_token, retry_count=RETRY_COUNT, logger=logger, http=http)
     try:
-        resp = request_with_retry('GET', init_url, headers=headers, retry_count=RETRY_COUNT, logger=logger)
-        return resp.json()['session_token']
-    except Exception as e:
-        logger.error(f"GLPI Session 初始化失敗 (URL: {init_url}): {e}")
+        glpi.get_token()
+    except GlpiSessionError as e:
+        logger.error(str(e))
         raise
+    return glpi
 
-def search_glpi(glpi_url, headers, endpoint, field, value):
-    """在 GLPI 中搜尋設備。"""
+def glpi_request(glpi, method, url, payload=None, http=None):
+    """送出 GLPI 請求：每次向 Session 管理器取得目前的 Header，
+    Session 於執行中途失效 (401) 時重建後重試一次。
+    """
+    try:
+        return request_with_retry(method, url, headers=glpi.headers(), payload=payload,
+                                  retry_count=RETRY_COUNT, logger=logger, http=http)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        logger.warning("♻ GLPI Session 已失效 (401)，重新建立後重試")
+        glpi.invalidate()
+        return request_with_retry(method, url, headers=glpi.headers(), payload=payload,
+                                  retry_count=RETRY_COUNT, logger=logger, http=http)
+
+@traced()
+def search_glpi(glpi_url, glpi, endpoint, field, value, http=None):
+    """在 GLPI 中搜尋設備 (glpi 為 GlpiSessionManager)。"""
     glpi_url = glpi_url.rstrip('/')
     try:
         search_url = f"{glpi_url}/search/{endpoint}?criteria[0][field]={field}&criteria[0][searchtype]=equals&criteria[0][value]={value}"
-        resp = request_with_retry('GET', search_url, headers=headers, retry_count=RETRY_COUNT, logger=logger)
+        resp = glpi_request(glpi, 'GET', search_url, http=http)
         result = resp.json()
         if result.get('totalcount', 0) > 0 and result.get('data'):
             # GLPI 搜尋結果可能是 list 或 dict，視版本而定
@@ -66,7 +90,88 @@ def search_glpi(glpi_url, headers, endpoint, field, value):
         logger.warning(f"GLPI 搜尋失敗 ({value}): {e}")
     return None
 
+def new_stats():
+    return {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+
+def sync_devices(devices, glpi_url, glpi, stats, dry_run=False, http=None):
+    """將 NetBox 設備逐台寫入 GLPI (依 Serial / 名稱判斷新增或更新)。
+
+    glpi 為 GlpiSessionManager：每個請求各自取得 Header，Session 過期時自動重建。
+    """
+    for dev in devices:
+        try:
+            role_obj = getattr(dev, 'role', None) or getattr(dev, 'device_role', None)
+            role_slug = role_obj.slug if role_obj else ''
+            endpoint = ROLE_TO_ENDPOINT.get(role_slug, DEFAULT_GLPI_ENDPOINT)
+
+            logger.info(f"處理: {dev.name} -> {endpoint}")
+            
+            # 建構 Payload
+            # 注意：GLPI 不同類型的必填欄位可能不同，這裡是通用欄位
+            payload = {
+                "input": {
+                    "name": dev.name,
+                    "serial": dev.serial or '',
+                    "otherserial": str(dev.id), # 用 NetBox ID 當作輔助識別
+                    "comment": f"自動同步自 NetBox. 型號: {dev.device_type.model if dev.device_type else 'N/A'}"
+                }
+            }
+
+            if dry_run: stats['created'] += 1; continue
+
+            # 搜尋策略：Serial (field 5) -> Name (field 1)
+            # 注意：如果 serial 為空，搜尋可能會不準確，建議有 serial 才搜
+            exists_id = None
+            with phase('glpi_search', device=dev.name):
+                if dev.serial:
+                    exists_id = search_glpi(glpi_url, glpi, endpoint, 5, dev.serial, http)
+
+                if not exists_id:
+                    exists_id = search_glpi(glpi_url, glpi, endpoint, 1, dev.name, http)
+
+            with phase('glpi_write', device=dev.name):
+                if exists_id:
+                    glpi_request(glpi, 'PUT', f"{glpi_url}/{endpoint}/{exists_id}", payload, http)
+                    stats['updated'] += 1
+                else:
+                    glpi_request(glpi, 'POST', f"{glpi_url}/{endpoint}", payload, http)
+                    stats['created'] += 1
+        except Exception as e:
+            logger.error(f"  ❌ {dev.name} 同步失敗: {e}")
+            stats['failed'] += 1
+    return stats
+
+def sync_changes(nb, glpi_url, glpi, stats, dry_run=False):
+    """從變更事件流接續同步並推進 Offset。
+
+    整批皆失敗 (多半是 GLPI 無法連線) 時不推進，下次重做；個別設備失敗由每日全量同步補正。
+    """
+    feed = ChangeFeed()
+    while True:
+        events = feed.consume(FEED_CONSUMER, FEED_BATCH)
+        if not events:
+            break
+        names = {ev['device'] for ev in events if ev.get('device')}
+        logger.info(f"變更事件 seq {events[0]['seq']}~{events[-1]['seq']}: {len(names)} 台設備")
+        devices = filter_devices_by_name(nb, names, status='active')
+        failed = stats['failed']
+        sync_devices(devices, glpi_url, glpi, stats, dry_run)
+        if dry_run or (devices and stats['failed'] - failed == len(devices)):
+            break
+        feed.commit(FEED_CONSUMER, events[-1]['seq'])
+    return stats
+
 def main():
+    parser = argparse.ArgumentParser(description='Sync NetBox to GLPI')
+    parser.add_argument('--changes', action='store_true', help="只同步變更事件流中尚未處理的設備")
+    add_profile_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+    install_from_env(logger)
+    instrumentation.install()
+    start_profile(args.profile, 'sync_glpi', logger)
+    start_tracing(args.trace, 'sync_glpi', logger)
+
     logger.info("=" * 60)
     logger.info(">>> 開始同步 (v6.0): NetBox -> GLPI")
     logger.info("=" * 60)
@@ -74,7 +179,7 @@ def main():
     dry_run = get_env_var('DRY_RUN', 'False').lower() == 'true'
     if dry_run: logger.warning("⚠ DRY-RUN 模式啟用")
 
-    stats = {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+    stats = new_stats()
 
     # --- API 本體 ---
     try:
@@ -87,56 +192,15 @@ def main():
         app_token = get_env_var('GLPI_APP_TOKEN', required=True)
         user_token = get_env_var('GLPI_USER_TOKEN', required=True)
         
-        session_token = init_glpi_session(glpi_url, app_token, user_token)
-        glpi_headers = {'Session-Token': session_token, 'App-Token': app_token, 'Content-Type': 'application/json'}
+        glpi = init_glpi_session(glpi_url, app_token, user_token)
     except Exception as e:
         logger.error(f"API 初始化失敗: {e}")
         sys.exit(1)
 
-    try:
-        devices = nb.dcim.devices.filter(status='active')
-        for dev in devices:
-            try:
-                role_obj = getattr(dev, 'role', None) or getattr(dev, 'device_role', None)
-                role_slug = role_obj.slug if role_obj else ''
-                endpoint = ROLE_TO_ENDPOINT.get(role_slug, DEFAULT_GLPI_ENDPOINT)
-
-                logger.info(f"處理: {dev.name} -> {endpoint}")
-                
-                # 建構 Payload
-                # 注意：GLPI 不同類型的必填欄位可能不同，這裡是通用欄位
-                payload = {
-                    "input": {
-                        "name": dev.name,
-                        "serial": dev.serial or '',
-                        "otherserial": str(dev.id), # 用 NetBox ID 當作輔助識別
-                        "comment": f"自動同步自 NetBox. 型號: {dev.device_type.model if dev.device_type else 'N/A'}"
-                    }
-                }
-
-                if dry_run: stats['created'] += 1; continue
-
-                # 搜尋策略：Serial (field 5) -> Name (field 1)
-                # 注意：如果 serial 為空，搜尋可能會不準確，建議有 serial 才搜
-                exists_id = None
-                if dev.serial:
-                    exists_id = search_glpi(glpi_url, glpi_headers, endpoint, 5, dev.serial)
-                
-                if not exists_id:
-                    exists_id = search_glpi(glpi_url, glpi_headers, endpoint, 1, dev.name)
-
-                if exists_id:
-                    request_with_retry('PUT', f"{glpi_url}/{endpoint}/{exists_id}", headers=glpi_headers, payload=payload, logger=logger)
-                    stats['updated'] += 1
-                else:
-                    request_with_retry('POST', f"{glpi_url}/{endpoint}", headers=glpi_headers, payload=payload, logger=logger)
-                    stats['created'] += 1
-            except Exception as e:
-                logger.error(f"  ❌ {dev.name} 同步失敗: {e}")
-                stats['failed'] += 1
-    finally:
-        try: requests.get(f'{glpi_url}/killSession', headers=glpi_headers, timeout=10)
-        except: pass
+    if args.changes:
+        sync_changes(nb, glpi_url, glpi, stats, dry_run)
+    else:
+        sync_devices(nb.dcim.devices.filter(status='active'), glpi_url, glpi, stats, dry_run)
 
     save_metrics(METRICS_FILE, 'netbox_to_glpi', stats)
     logger.info("<<< 同步完成")
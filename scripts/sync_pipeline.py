@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# =============================================================================
+# sync_pipeline.py - 同步管線 (LibreNMS -> NetBox -> Interfaces / GLPI)
+# =============================================================================
+# 用途：取代三個各自掃描全部設備的 Timer，在同一行程內依相依關係 (DAG) 執行：
+#
+#     librenms ──┬──> interfaces   (sync_librenms_interfaces.py)
+#                └──> glpi         (sync_netbox_to_glpi.py)
+#
+#   - 第一階段 (sync_librenms_to_netbox.py) 建立或變更的設備交給下游階段，
+#     下游只處理這些設備 (--full 時處理全部 Active 設備)。
+#   - 各階段共用同一個 NetBox API、requests.Session、LibreNMS 設備清單快取
+#     與設備租約 (coordination.py)。
+#   - 某階段失敗時，相依於它的階段略過；其餘階段照常執行。
+#   - 增量模式只看 NetBox 設備欄位變更，無法得知介面或 IP 的增減；距上次成功的
+#     全量執行超過 PIPELINE_FULL_INTERVAL 秒 (預設 86400) 時，自動以 --full 執行一次校正。
+#
+# 用法：
+#   python3 sync_pipeline.py [--dry-run] [--full] [--stages librenms,glpi]
+# =============================================================================
+
+import os
+import sys
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+from utils import setup_logging, save_metrics, get_env_var, filter_devices_by_name
+from coordination import run_lock, RunLockBusy, COORD_DIR
+from http_cassette import install_from_env
+import instrumentation
+from profiling import add_profile_argument, start_profile
+from tracing import add_trace_argument, start_tracing, span
+
+ENV_PATH = '/opt/netbox/scripts/.env'
+load_dotenv(ENV_PATH)
+
+logger = setup_logging('/var/log/it_nexus/sync_pipeline.log')
+
+METRICS_FILE = get_env_var('METRICS_FILE_PIPELINE', '/var/log/it_nexus/metrics_pipeline.json')
+RUN_LOCK_WAIT = int(get_env_var('COORD_RUN_WAIT', '600'))
+FULL_INTERVAL = int(get_env_var('PIPELINE_FULL_INTERVAL', '86400'))
+STATE_FILE = get_env_var('PIPELINE_STATE_FILE', os.path.join(COORD_DIR, 'sync_pipeline_state.json'))
+
+
+class Stage:
+    def __init__(self, name, func, requires=()):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+
+
+class PipelineContext:
+    """各階段共用的連線、快取與上游產出。"""
+
+    def __init__(self, syncer, dry_run=False, full=False):
+        self.syncer = syncer
+        self.nb = syncer.nb
+        self.http = syncer.http
+        self.leases = syncer.leases
+        self.dry_run = dry_run
+        self.full = full
+        self.changed = {}  # NetBox 名稱 -> LibreNMS device_id (librenms 階段產出)
+
+    def target_names(self):
+        """下游階段要處理的設備名稱；None 表示全部 Active 設備。"""
+        return None if self.full else set(self.changed)
+
+
+# --- 各階段 ---
+def stage_librenms(ctx):
+    import sync_librenms_to_netbox as librenms
+
+    started = time.monotonic()
+    ctx.syncer.pop_changed()
+    devices = ctx.syncer.devices()
+    logger.info(f"從 LibreNMS 取得 {len(devices)} 台設備")
+    stats = ctx.syncer.sync_all(devices)
+    ctx.changed = ctx.syncer.pop_changed()
+    logger.info(f"🔀 建立/變更 {len(ctx.changed)} 台設備")
+    save_metrics(librenms.METRICS_FILE, 'librenms_to_netbox', stats, instrumented=False,
+                 duration=time.monotonic() - started)
+    return stats
+
+
+def stage_interfaces(ctx):
+    import sync_librenms_interfaces as interfaces
+
+    names = ctx.target_names()
+    if names is not None and not names:
+        logger.info("⏭ 無變更設備，略過 Interface 同步")
+        return interfaces.new_stats()
+    librenms_map = interfaces.build_device_map(ctx.syncer.devices())
+    return interfaces.sync_all(ctx.nb, ctx.dry_run, names=names, leases=ctx.leases,
+                               librenms_map=librenms_map, http=ctx.http)
+
+
+def stage_glpi(ctx):
+    import sync_netbox_to_glpi as glpi_sync
+
+    started = time.monotonic()
+    names = ctx.target_names()
+    stats = glpi_sync.new_stats()
+    if names is not None and not names:
+        logger.info("⏭ 無變更設備，略過 GLPI 同步")
+        return stats
+    glpi_url = get_env_var('GLPI_API_URL', required=True)
+    glpi = glpi_sync.init_glpi_session(glpi_url, get_env_var('GLPI_APP_TOKEN', required=True),
+                                       get_env_var('GLPI_USER_TOKEN', required=True), http=ctx.http)
+    if names is None:
+        devices = ctx.nb.dcim.devices.filter(status='active')
+    else:
+        devices = filter_devices_by_name(ctx.nb, names, status='active')
+    glpi_sync.sync_devices(devices, glpi_url, glpi, stats, ctx.dry_run, http=ctx.http)
+    save_metrics(glpi_sync.METRICS_FILE, 'netbox_to_glpi', stats, instrumented=False,
+                 duration=time.monotonic() - started)
+    return stats
+
+
+STAGES = [
+    Stage('librenms', stage_librenms),
+    Stage('interfaces', stage_interfaces, requires=('librenms',)),
+    Stage('glpi', stage_glpi, requires=('librenms',)),
+]
+
+
+# --- 定期全量校正 ---
+def full_run_due(state_file=None, interval=None, now=None):
+    """距上次成功的全量執行已超過 interval 秒 (或從未執行) 時回傳 True；interval <= 0 停用。"""
+    interval = FULL_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return False
+    try:
+        with open(state_file or STATE_FILE, encoding='utf-8') as f:
+            last = float(json.load(f)['last_full_at'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return True
+    return (now or time.time()) - last >= interval
+
+
+def record_full_run(state_file=None, now=None):
+    """記錄一次成功的全量執行 (寫入失敗只記錄警告，下次再校正)。"""
+    path = state_file or STATE_FILE
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'last_full_at': now or time.time()}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"⚠ 無法記錄全量執行時間 ({path}): {e}")
+
+
+# --- 執行 ---
+def order_stages(stages, only=None):
+    """依 requires 排出執行順序；only 指定的階段會自動帶入其上游階段。"""
+    by_name = {s.name: s for s in stages}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name not in by_name:
+            raise ValueError(f"未知的階段: {name}")
+        if name in visiting:
+            raise ValueError(f"階段相依形成循環: {name}")
+        visiting.add(name)
+        for dep in by_name[name].requires:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        ordered.append(by_name[name])
+
+    for name in (only or [s.name for s in stages]):
+        visit(name)
+    return ordered
+
+
+def run_pipeline(ctx, stages=STAGES, only=None):
+    """依序執行各階段，回傳 {階段: {'status', 'seconds', 'stats'}}。"""
+    results = {}
+    for stage in order_stages(stages, only):
+        failed_deps = [d for d in stage.requires if results[d]['status'] != 'ok']
+        if failed_deps:
+            logger.warning(f"⏭ [{stage.name}] 上游階段 {', '.join(failed_deps)} 失敗，略過")
+            results[stage.name] = {'status': 'skipped', 'seconds': 0, 'stats': {}}
+            continue
+
+        logger.info(f"▶ [{stage.name}] 開始")
+        started = time.monotonic()
+        with span(f"stage.{stage.name}", cat='stage') as s:
+            try:
+                stats = stage.func(ctx)
+                status = 'ok'
+            except Exception as e:
+                logger.error(f"❌ [{stage.name}] 執行失敗: {e}")
+                stats, status = {}, 'failed'
+            s.set(status=status)
+        seconds = round(time.monotonic() - started, 3)
+        results[stage.name] = {'status': status, 'seconds': seconds, 'stats': stats or {}}
+        logger.info(f"■ [{stage.name}] {status} ({seconds}s)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IT Nexus Sync Pipeline')
+    parser.add_argument('--dry-run', action='store_true', help='Simulate changes')
+    parser.add_argument('--full', action='store_true', help="下游階段處理全部 Active 設備 (不限於本次變更)")
+    parser.add_argument('--stages', help=f"只執行指定階段 (逗號分隔，自動包含上游): {', '.join(s.name for s in STAGES)}")
+    add_profile_argument(parser)
+    add_trace_argument(parser)
+    args = parser.parse_args()
+    install_from_env(logger)
+    instrumentation.install()
+    start_profile(args.profile, 'sync_pipeline', logger)
+    start_tracing(args.trace, 'sync_pipeline', logger)
+
+    dry_run = args.dry_run or get_env_var('DRY_RUN', 'False').lower() == 'true'
+    only = [s.strip() for s in args.stages.split(',') if s.strip()] if args.stages else None
+    full = args.full
+    if not full and full_run_due():
+        # 增量模式看不到介面/IP 的增減，定期讓下游處理全部設備
+        logger.info(f"🔁 距上次全量校正已超過 {FULL_INTERVAL} 秒，本次以全量執行")
+        full = True
+
+    logger.info("=" * 60)
+    logger.info(f">>> 開始同步管線 ({'全量' if full else '增量'}{', DRY-RUN' if dry_run else ''})")
+    logger.info("=" * 60)
+
+    try:
+        from sync_librenms_to_netbox import LibreNMSSyncer
+        syncer = LibreNMSSyncer.from_env(dry_run=dry_run, owner='sync_pipeline')
+    except SystemExit:
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"API 初始化失敗: {e}")
+        sys.exit(1)
+
+    ctx = PipelineContext(syncer, dry_run=dry_run, full=full)
+    try:
+        with run_lock('full-sync', wait=RUN_LOCK_WAIT):
+            results = run_pipeline(ctx, only=only)
+    except RunLockBusy:
+        logger.warning(f"⚠ 其他全量同步執行中 (等待 {RUN_LOCK_WAIT} 秒仍未結束)，本次略過")
+        return
+    except ValueError as e:
+        parser.error(str(e))
+
+    save_metrics(METRICS_FILE, 'sync_pipeline', {'changed': len(ctx.changed), 'full': full, 'stages': results})
+    if full and not dry_run and all(results.get(n, {}).get('status') == 'ok' for n in ('interfaces', 'glpi')):
+        record_full_run()
+    logger.info("<<< 同步管線完成: " + ', '.join(f"{n}={r['status']}" for n, r in results.items()))
+    failed = any(r['status'] != 'ok' or r['stats'].get('failed') or r['stats'].get('errors')
+                 for r in results.values())
+    if failed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
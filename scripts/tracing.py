@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# =============================================================================
+# tracing.py - 同步流程 Span 追蹤 (Chrome Trace Event Format)
+# =============================================================================
+# 用途：找出每台設備同步中最耗時的步驟 (Platform/Site 建立、Primary IP、
+#       VLAN/Interface/Inventory 階段、各個 HTTP 呼叫)。
+#
+#   - span()/traced() 記錄巢狀步驟；instrumentation.py 的階段計時與 HTTP 呼叫
+#     自動成為子 Span (同一執行緒內依時間包含關係呈現巢狀)。
+#   - trace() 設定 trace_id (同步腳本為 Run ID，Webhook 為 Job ID)，
+#     其下所有 Span 的 args 皆帶 trace_id；Webhook 收到告警與 Worker 執行同步
+#     之間以 Flow 事件連結，可從接收一路追到 NetBox 寫入。
+#   - 事件逐筆寫入 <name>-<run_id>.trace.json (JSON Array，可於 Perfetto
+#     https://ui.perfetto.dev 或 chrome://tracing 開啟)；行程中斷時檔尾缺少 ]
+#     仍可載入。超過 IT_NEXUS_TRACE_MAX_MB 換檔，保留最近 IT_NEXUS_TRACE_KEEP 個。
+#
+# 啟用：--trace 或 IT_NEXUS_TRACE=1 (未啟用時 span() 為 No-op)
+# 輸出：IT_NEXUS_TRACE_DIR，預設 /var/log/it_nexus/traces/
+# =============================================================================
+
+import os
+import glob
+import json
+import time
+import atexit
+import functools
+import threading
+import contextvars
+
+from change_feed import new_run_id
+
+TRACE_DIR = os.getenv('IT_NEXUS_TRACE_DIR', '/var/log/it_nexus/traces')
+MAX_BYTES = int(float(os.getenv('IT_NEXUS_TRACE_MAX_MB', '100')) * 1024 * 1024)
+KEEP_FILES = int(os.getenv('IT_NEXUS_TRACE_KEEP', '20'))
+FLUSH_INTERVAL = 1.0
+
+# perf_counter -> Epoch 微秒 (不同行程的 Trace 可對齊時間軸)
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+_tracer = None
+_trace_id = contextvars.ContextVar('it_nexus_trace_id', default=None)
+
+
+def _us(perf):
+    return int((_EPOCH_OFFSET + perf) * 1_000_000)
+
+
+class Tracer:
+    """將 Trace 事件逐筆寫入檔案 (多執行緒共用)。"""
+
+    def __init__(self, name, directory=None, max_bytes=MAX_BYTES, keep=KEEP_FILES):
+        self.name = name
+        self.directory = directory or TRACE_DIR
+        self.max_bytes = max_bytes
+        self.keep = max(1, keep)
+        self.run_id = new_run_id()
+        self.pid = os.getpid()
+        self.paths = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._bytes = 0
+        self._threads = set()
+        self._flushed_at = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _open(self):
+        part = len(self.paths)
+        suffix = f".{part}" if part else ''
+        path = os.path.join(self.directory, f"{self.name}-{self.run_id}{suffix}.trace.json")
+        self._file = open(path, 'w', encoding='utf-8')
+        self._bytes = 0
+        self._threads = set()
+        self.paths.append(path)
+        self._file.write('[\n')
+        self._write({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                     'args': {'name': f"{self.name} ({self.run_id})"}})
+        self._prune()
+
+    def _prune(self):
+        files = sorted(glob.glob(os.path.join(self.directory, f"{self.name}-*.trace.json")), key=os.path.getmtime)
+        for path in files[:-self.keep]:
+            if path not in self.paths[-1:]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + ',\n'
+        self._file.write(line)
+        self._bytes += len(line)
+
+    def emit(self, event):
+        tid = threading.get_ident()
+        event['pid'] = self.pid
+        event['tid'] = tid
+        with self._lock:
+            if self._file is None or self._bytes >= self.max_bytes:
+                if self._file:
+                    self._close_file()
+                self._open()
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._write({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                             'args': {'name': threading.current_thread().name}})
+            self._write(event)
+            now = time.monotonic()
+            if now - self._flushed_at >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = now
+
+    def _close_file(self):
+        # 最後一筆事件後的逗號以結束事件收尾，再補上 ]
+        self._file.write(json.dumps({'name': 'trace_end', 'ph': 'i', 's': 'g', 'pid': self.pid, 'tid': 0,
+                                     'ts': _us(time.perf_counter())}) + '\n]\n')
+        self._file.close()
+        self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._close_file()
+
+
+# =============================================================================
+# Span
+# =============================================================================
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start', '_token', '_trace_id')
+
+    def __init__(self, name, cat, args, trace_id=None):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+        self._token = None
+        self._trace_id = trace_id
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        if self._trace_id:
+            self._token = _trace_id.set(self._trace_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type:
+            self.args['error'] = f"{exc_type.__name__}: {exc}"
+        complete(self.name, self.start, end, cat=self.cat, **self.args)
+        if self._token is not None:
+            _trace_id.reset(self._token)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, cat='sync', **args):
+    """巢狀步驟 (with span('step', device=...) as s: ...; s.set(result=...))。"""
+    if _tracer is None:
+        return _NOOP
+    return _Span(name, cat, args)
+
+
+def trace(name, trace_id, cat='sync', **args):
+    """根 Span：其下 (同一執行緒) 所有 Span 帶 trace_id。"""
+    if _tracer is None:
+        return _NOOP
+    return _Span(name, cat, args, trace_id=str(trace_id))
+
+
+def traced(name=None, cat='sync'):
+    """函式裝飾器版的 span()。"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*a, **kw):
+            if _tracer is None:
+                return func(*a, **kw)
+            with _Span(span_name, cat, {}):
+                return func(*a, **kw)
+        return wrapper
+    return decorator
+
+
+def complete(name, start, end, cat='sync', **args):
+    """以已知的起訖時間 (perf_counter) 記錄一個 Span (args 未指定 trace_id 時取目前的)。"""
+    if _tracer is None:
+        return
+    trace_id = _trace_id.get()
+    if trace_id and 'trace_id' not in args:
+        args['trace_id'] = trace_id
+    _tracer.emit({'name': name, 'cat': cat, 'ph': 'X', 'ts': _us(start),
+                  'dur': max(0, int((end - start) * 1_000_000)), 'args': args})
+
+
+def flow(flow_id, start, name='webhook_job', cat='webhook'):
+    """跨執行緒連結：start=True 於來源 Span 內呼叫，False 於目的 Span 內呼叫。"""
+    if _tracer is None:
+        return
+    event = {'name': name, 'cat': cat, 'ph': 's' if start else 'f', 'id': str(flow_id),
+             'ts': _us(time.perf_counter())}
+    if not start:
+        event['bp'] = 'e'
+    _tracer.emit(event)
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+# =============================================================================
+# 啟用
+# =============================================================================
+def start_tracing(cli_flag, name, logger=None, directory=None):
+    """依 --trace / IT_NEXUS_TRACE 啟用，設定本執行緒的 trace_id 為 Run ID；未啟用回傳 None。"""
+    global _tracer
+    flag = cli_flag or os.getenv('IT_NEXUS_TRACE', '').strip().lower() in ('1', 'true', 'on', 'yes')
+    if not flag:
+        return None
+    if _tracer is None:
+        _tracer = Tracer(name, directory)
+        _trace_id.set(_tracer.run_id)
+        atexit.register(stop_tracing)
+        if logger:
+            logger.info(f"🧵 Tracing 啟用，輸出: {os.path.join(_tracer.directory, _tracer.name)}-{_tracer.run_id}*.trace.json")
+    return _tracer
+
+
+def stop_tracing():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer:
+        tracer.close()
+    return tracer
+
+
+def add_trace_argument(parser):
+    parser.add_argument('--trace', action='store_true',
+                        help="記錄 Span Trace (Perfetto / chrome://tracing)；亦可設定 IT_NEXUS_TRACE=1")
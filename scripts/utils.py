@@ -2,61 +2,164 @@ import os
 import sys
 import json
 import time
+import queue
+import atexit
 import logging
+import logging.handlers
 import requests
 
-def setup_logging(log_file, level=logging.INFO):
-    """配置專案日誌系統。"""
-    logging.basicConfig(
-        level=level,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler(log_file),
-        ]
-    )
+# 行程啟動時間 (save_metrics 未指定 duration 時以此計算執行耗時)
+_STARTED = time.monotonic()
+
+# LogRecord 內建屬性 (JSON 格式只額外輸出 extra= 傳入的欄位)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+_log_listener = None
+_log_handler = None
+
+class JsonFormatter(logging.Formatter):
+    """單行 JSON 日誌 (LOG_FORMAT=json)，供 Loki / Elasticsearch 等直接解析。"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只在呼叫端合併 msg % args (參數可能之後被修改)，不複製 Record；
+    時間格式、Exception Traceback 與 JSON 序列化皆由背景執行緒處理。"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def setup_logging(log_file=None, level=None, stdout=True):
+    """配置專案日誌系統 (IT_NEXUS_LOG_DIR 可改寫日誌目錄，例如 Benchmark)。
+
+    記錄經 QueueHandler 放入佇列，由背景 QueueListener 寫入 stdout / 檔案，
+    呼叫端 (逐 Port 的迴圈) 不需等待 I/O；行程結束時 (atexit) 寫完佇列。
+    LOG_LEVEL 設定層級 (預設 INFO)，LOG_FORMAT=json 輸出單行 JSON。
+    同一行程內重複呼叫 (例如管線匯入各同步模組) 只以第一次的設定為準。
+    """
+    global _log_listener, _log_handler
+    if _log_listener is None:
+        handlers = []
+        if stdout:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        if log_file:
+            log_dir = os.getenv('IT_NEXUS_LOG_DIR')
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+                log_file = os.path.join(log_dir, os.path.basename(log_file))
+            handlers.append(logging.FileHandler(log_file))
+        if os.getenv('LOG_FORMAT', '').strip().lower() == 'json':
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        _log_handler = _QueueHandler(log_queue)
+        root.addHandler(_log_handler)
+        level = level or os.getenv('LOG_LEVEL', 'INFO').strip().upper()
+        root.setLevel(level if isinstance(logging.getLevelName(level), int) or isinstance(level, int) else logging.INFO)
+        _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(stop_logging)
     return logging.getLogger(__name__)
 
-def save_metrics(metrics_file, sync_source, stats):
-    """輸出標準化的 JSON Metrics。"""
+def stop_logging():
+    """停止背景寫入並寫完佇列中的記錄。"""
+    global _log_listener, _log_handler
+    listener, _log_listener = _log_listener, None
+    if listener:
+        logging.getLogger().removeHandler(_log_handler)
+        _log_handler = None
+        listener.stop()
+
+def save_metrics(metrics_file, sync_source, stats, instrumented=True, duration=None):
+    """輸出標準化的 JSON Metrics，並追加一筆執行紀錄至 metrics_history.py。
+
+    instrumented 時附上 API 呼叫與階段計時 (instrumentation.py)，
+    並在設定 METRICS_TEXTFILE_DIR 時另寫 Prometheus Textfile。
+    duration 未指定時為行程啟動至今的秒數。
+    """
+    if duration is None:
+        duration = time.monotonic() - _STARTED
+    record = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'sync_source': sync_source,
+        'duration': round(duration, 3),
+        'stats': stats,
+    }
+    timing = None
+    if instrumented:
+        import instrumentation
+        timing = instrumentation.summary()
+        if timing['api'] or timing['phases']:
+            record['instrumentation'] = timing
     try:
         os.makedirs(os.path.dirname(metrics_file), exist_ok=True)
         with open(metrics_file, 'w') as f:
-            json.dump({
-                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
-                'sync_source': sync_source,
-                'stats': stats,
-            }, f, indent=2, ensure_ascii=False)
+            json.dump(record, f, indent=2, ensure_ascii=False)
     except Exception as e:
         print(f"無法寫入 Metrics ({metrics_file}): {e}", file=sys.stderr)
 
+    textfile_dir = os.getenv('METRICS_TEXTFILE_DIR')
+    if instrumented and textfile_dir:
+        try:
+            instrumentation.write_textfile(textfile_dir, sync_source, stats)
+        except Exception as e:
+            print(f"無法寫入 Prometheus Textfile ({textfile_dir}): {e}", file=sys.stderr)
+
+    try:
+        from metrics_history import record_run
+        record_run(sync_source, stats, round(duration, 3), timing)
+    except Exception as e:
+        print(f"無法寫入 Metrics History: {e}", file=sys.stderr)
+
 def send_notification(title, message, status='info'):
-    """發送通用 Webhook 通知 (支援 Slack/Teams/Discord 格式適配)。"""
-    webhook_url = os.getenv('NOTIFICATION_URL')
-    if not webhook_url:
+    """發送通用 Webhook 通知 (經 notify_dispatcher Outbox 批次、限速派送)。
+
+    NOTIFICATION_URL 可設定多個 Webhook (逗號分隔)。
+    """
+    from notify_dispatcher import enqueue, parse_channels
+
+    channels = parse_channels(os.getenv('NOTIFICATION_URL'))
+    if not channels:
         return
 
     try:
-        # 通用 JSON Payload (可根據不同平台調整)
-        payload = {
-            'text': f"[{status.upper()}] {title}\n{message}",
-            'title': title,
-            'summary': message,
-            'themeColor': 'FF0000' if status == 'error' else '00FF00'
-        }
-        
-        requests.post(webhook_url, json=payload, timeout=5)
+        enqueue(title, message, status, channels=channels)
     except Exception as e:
         print(f"通知發送失敗: {e}", file=sys.stderr)
 
-def request_with_retry(method, url, headers=None, payload=None, retry_count=3, timeout=30, logger=None, **kwargs):
-    """執行帶有 Exponential Backoff 的 HTTP 請求。"""
+def request_with_retry(method, url, headers=None, payload=None, retry_count=3, timeout=30, logger=None, http=None, **kwargs):
+    """執行帶有 Exponential Backoff 的 HTTP 請求。
+
+    http 可傳入共用的 requests.Session 以重用連線 (Keep-Alive)。
+    """
     for attempt in range(1, retry_count + 1):
         try:
-            resp = requests.request(method, url, headers=headers, json=payload, timeout=timeout, **kwargs)
+            resp = (http or requests).request(method, url, headers=headers, json=payload, timeout=timeout, **kwargs)
             resp.raise_for_status()
             return resp
         except requests.exceptions.RequestException as e:
+            # 認證失敗 (401) 重試也不會成功，交由呼叫端重建 Session / Token
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status == 401:
+                raise
             wait = 2 ** attempt
             msg = f"API 請求失敗 ({method} {url}) [第 {attempt}/{retry_count} 次]: {e}"
             if logger:
@@ -68,6 +171,14 @@ def request_with_retry(method, url, headers=None, payload=None, retry_count=3, t
                 raise
             time.sleep(wait)
 
+def filter_devices_by_name(nb, names, chunk_size=50, **filters):
+    """依名稱批次查詢 NetBox 設備 (name=a&name=b...)，避免逐台 GET 或下載全部設備。"""
+    names = sorted(set(names))
+    devices = []
+    for i in range(0, len(names), chunk_size):
+        devices += list(nb.dcim.devices.filter(name=names[i:i + chunk_size], **filters))
+    return devices
+
 def get_env_var(var_name, default=None, required=False):
     """讀取環境變數，支援必填檢查。"""
     val = os.getenv(var_name, default)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# =============================================================================
+# webhook_asgi.py - 非同步 (ASGI) Webhook 接收端
+# =============================================================================
+# 用途：取代 Flask 開發伺服器，於單一小型 VM 吸收 LibreNMS 告警風暴。
+#   - 以 uvicorn 執行；事件驗證、持久化與排程沿用 webhook_receiver.accept_event
+#     (在 Thread Pool 中執行，不阻塞 Event Loop)。
+#   - 在途請求上限 WEBHOOK_MAX_INFLIGHT (預設 256)，超過時立即回應 503 +
+#     Retry-After，由 LibreNMS 稍後重送 (Backpressure)。
+#   - /health 與 /metrics 不經過上限與資料庫，負載下仍能立即回應。
+#
+# 用法：
+#   WEBHOOK_MODE=asgi python3 webhook_receiver.py
+#   或 python3 webhook_asgi.py [--host 0.0.0.0] [--port 5005]
+# =============================================================================
+
+import os
+import json
+import asyncio
+import argparse
+import functools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import webhook_receiver as receiver
+from metrics_registry import REGISTRY, CONTENT_TYPE
+
+MAX_INFLIGHT = int(os.getenv('WEBHOOK_MAX_INFLIGHT', '256'))
+MAX_BODY = int(os.getenv('WEBHOOK_MAX_BODY', str(1024 * 1024)))
+EXECUTOR_THREADS = int(os.getenv('WEBHOOK_EXECUTOR_THREADS', '16'))
+
+
+class WebhookApp:
+    """最小化的 ASGI App (不依賴 Web Framework)。"""
+
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_body=MAX_BODY, executor_threads=EXECUTOR_THREADS,
+                 start_background=True):
+        self.max_inflight = max_inflight
+        self.max_body = max_body
+        self.inflight = 0
+        self.rejected = 0
+        self.executor = ThreadPoolExecutor(max_workers=executor_threads, thread_name_prefix='webhook-io')
+        self.start_background = start_background
+        REGISTRY.gauge('webhook_inflight_requests', '處理中的 Webhook 請求數', func=lambda: self.inflight)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        method, path = scope['method'], scope['path']
+        if path == '/health' and method == 'GET':
+            await self._json(send, 200, self._health())
+        elif path == '/metrics' and method == 'GET':
+            await self._send(send, 200, REGISTRY.render().encode('utf-8'), CONTENT_TYPE.encode())
+        elif path == '/webhook' and method == 'POST':
+            await self._webhook(receive, send)
+        elif path.startswith('/jobs/') and method == 'GET':
+            job = receiver.jobs.get(path[len('/jobs/'):])
+            if job:
+                await self._json(send, 200, job.to_dict())
+            else:
+                await self._json(send, 404, {'status': 'error', 'message': 'Job not found'})
+        elif path == '/events/replay' and method == 'POST':
+            replayed = await self._run(receiver.replay_events)
+            await self._json(send, 200, {'status': 'ok', 'replayed': replayed})
+        else:
+            await self._json(send, 404, {'status': 'error', 'message': 'Not found'})
+
+    def _health(self):
+        return {
+            'status': 'ok',
+            'timestamp': datetime.now().isoformat(),
+            'queue_depth': receiver.jobs.depth(),
+            'inflight': self.inflight,
+            'max_inflight': self.max_inflight,
+            'rejected': self.rejected,
+        }
+
+    async def _webhook(self, receive, send):
+        # Event Loop 為單執行緒，計數不需加鎖
+        if self.inflight >= self.max_inflight:
+            self.rejected += 1
+            receiver.EVENTS_RECEIVED.inc(result='rejected')
+            await self._json(send, 503, {'status': 'busy', 'message': 'Too many in-flight requests'},
+                             headers=[(b'retry-after', b'1')])
+            return
+
+        self.inflight += 1
+        try:
+            body = await self._read_body(receive)
+            if body is None:
+                await self._json(send, 413, {'status': 'error', 'message': 'Payload too large'})
+                return
+            try:
+                data = json.loads(body) if body else None
+            except ValueError:
+                await self._json(send, 400, {'status': 'error', 'message': 'Invalid JSON payload'})
+                return
+            result, status = await self._run(receiver.accept_event, data)
+            await self._json(send, status, result)
+        finally:
+            self.inflight -= 1
+
+    async def _read_body(self, receive):
+        """讀取 Request Body；超過上限回傳 None。"""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def _json(self, send, status, data, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await self._send(send, status, body, b'application/json', headers)
+
+    async def _send(self, send, status, body, content_type, headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type),
+                        (b'content-length', str(len(body)).encode())] + list(headers),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.start_background:
+                    await self._run(receiver.start_background)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = WebhookApp()
+
+
+def serve(host=receiver.HOST, port=receiver.PORT):
+    import uvicorn
+
+    print(f"Starting ASGI Webhook Receiver on {host}:{port} "
+          f"(workers={receiver.WORKERS}, max_inflight={app.max_inflight})...")
+    # 單一行程：同步 Worker、事件佇列與快取皆在此行程內
+    uvicorn.run(app, host=host, port=port, workers=1, access_log=False,
+                log_level='warning', backlog=2048, timeout_keep_alive=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LibreNMS Webhook Receiver (ASGI)')
+    parser.add_argument('--host', default=receiver.HOST)
+    parser.add_argument('--port', type=int, default=receiver.PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
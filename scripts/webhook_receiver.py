@@ -5,42 +5,109 @@
 # 功能：
 # 1. 接收來自 LibreNMS 的 Alert Webhook (JSON Payload)
 # 2. 解析告警中的 Hostname
-# 3. 觸發 `sync_librenms_to_netbox.py --device <HOSTNAME>` 進行單機同步
+# 3. 將主機排入同步佇列 (job_queue.py) 並立即回應 202
+#    - 同一主機尚未執行的工作會合併，由 Worker Pool (上限 WEBHOOK_WORKERS) 執行
+#    - WEBHOOK_BATCH_WINDOW 秒內收到的主機合併為一個批次同步
+#    - 預設於行程內呼叫 LibreNMSSyncer (連線、參考資料與設備清單常駐快取)
+#    - WEBHOOK_SYNC_MODE=subprocess 時改為執行 `sync_librenms_to_netbox.py --device <HOSTNAME>`
+# 4. 以 GET /jobs/<id> 查詢工作結果
+# 5. 事件先寫入 event_store.py (SQLite WAL) 才回應；同步成功才標記完成，
+#    失敗重試、超過上限進入 Dead Letter，重啟時重播未完成的事件
 #
 # 部署：
 # - 放置於 NetBox Server (198.51.100.3)
 # - 建議使用 Systemd 運行 (Port 5005)
+# - 正式環境設定 WEBHOOK_MODE=asgi，改以 uvicorn 執行 webhook_asgi.py (非同步 + 在途上限)
 # =============================================================================
 
 import os
 import sys
 import json
+import time
 import subprocess
+import threading
 import logging
 from flask import Flask, request, jsonify
 from datetime import datetime
 
+from job_queue import CoalescingJobQueue
+from event_store import EventStore
+from metrics_registry import REGISTRY, CONTENT_TYPE
+from utils import setup_logging
+import tracing
+
 # --- Configuration ---
 LOG_FILE = '/var/log/it_nexus/webhook_receiver.log'
 SYNC_SCRIPT = '/opt/netbox/scripts/sync_librenms_to_netbox.py'
 PYTHON_EXEC = '/opt/netbox/scripts/venv/bin/python3'
 HOST = '0.0.0.0'
 PORT = 5005
+WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+RETRY_DELAY = int(os.getenv('WEBHOOK_RETRY_DELAY', '30'))
+SYNC_MODE = os.getenv('WEBHOOK_SYNC_MODE', 'inprocess')
+SERVER_MODE = os.getenv('WEBHOOK_MODE', 'flask')  # flask (開發) / asgi (uvicorn)
+BATCH_WINDOW = float(os.getenv('WEBHOOK_BATCH_WINDOW', '1'))  # 0 = 逐台同步
+BATCH_MAX = int(os.getenv('WEBHOOK_BATCH_MAX', '50'))
 
-# --- Logging Setup ---
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# --- Logging Setup (背景寫入，Request Thread 不等待檔案 I/O) ---
+setup_logging(LOG_FILE, stdout=False)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+_syncer = None
+_syncer_lock = threading.Lock()
+
+def get_syncer():
+    """取得常駐的 LibreNMSSyncer (首次呼叫時建立並啟動背景設備清單更新)"""
+    global _syncer
+    with _syncer_lock:
+        if _syncer is None:
+            from sync_librenms_to_netbox import LibreNMSSyncer, LEASE_WAIT
+            import instrumentation
+            instrumentation.install()  # API 與同步階段計時併入 /metrics
+            syncer = LibreNMSSyncer.from_env(auto_create=True, owner='webhook_receiver', lease_wait=LEASE_WAIT)
+            syncer.devices()
+            syncer.start_refresher()
+            _syncer = syncer
+        return _syncer
+
 def trigger_sync(hostname):
-    """執行同步腳本 (異步或同步執行視需求而定，這裡採同步等待以便回傳結果)"""
-    cmd = [PYTHON_EXEC, SYNC_SCRIPT, '--device', hostname]
-    logger.info(f"🚀 Triggering sync for {hostname}...")
+    """同步單一主機 (於 Worker Thread 中執行，回傳 (success, detail))"""
+    return trigger_sync_batch([hostname])[hostname]
+
+def trigger_sync_batch(hostnames, since=None):
+    """批次同步多台主機，回傳 {hostname: (success, detail)}
+
+    since: {hostname: 告警時間}；告警之後已由其他同步 (例如全量同步) 完成的主機直接略過
+    """
+    if SYNC_MODE == 'subprocess':
+        success, detail = trigger_sync_subprocess(hostnames)
+        return {h: (success, detail) for h in hostnames}
+
+    logger.info(f"🚀 Syncing {', '.join(hostnames)} (in-process)...")
+    try:
+        results = get_syncer().sync_hostnames(hostnames, since)
+    except SystemExit:
+        return {h: (False, 'missing NetBox/LibreNMS settings') for h in hostnames}
+    except Exception as e:
+        logger.error(f"❌ Execution error: {e}")
+        return {h: (False, str(e)) for h in hostnames}
+
+    for hostname, (success, detail) in results.items():
+        if success:
+            logger.info(f"✅ Sync successful for {hostname}")
+        else:
+            logger.error(f"❌ Sync failed for {hostname}: {detail}")
+    return results
+
+def trigger_sync_subprocess(hostnames):
+    """以獨立行程執行同步腳本 (WEBHOOK_SYNC_MODE=subprocess)"""
+    cmd = [PYTHON_EXEC, SYNC_SCRIPT]
+    for hostname in hostnames:
+        cmd += ['--device', hostname]
+    targets = ', '.join(hostnames)
+    logger.info(f"🚀 Triggering sync for {targets}...")
     
     try:
         # 使用 subprocess.run 執行同步
@@ -52,11 +119,11 @@ def trigger_sync(hostname):
         )
         
         if result.returncode == 0:
-            logger.info(f"✅ Sync successful for {hostname}")
+            logger.info(f"✅ Sync successful for {targets}")
             logger.debug(f"Output: {result.stdout}")
             return True, result.stdout
         else:
-            logger.error(f"❌ Sync failed for {hostname} (Exit Code: {result.returncode})")
+            logger.error(f"❌ Sync failed for {targets} (Exit Code: {result.returncode})")
             logger.error(f"Error: {result.stderr}")
             return False, result.stderr
             
@@ -64,57 +131,194 @@ def trigger_sync(hostname):
         logger.error(f"❌ Execution error: {e}")
         return False, str(e)
 
-@app.route('/webhook', methods=['POST'])
-def handle_webhook():
-    """接收 LibreNMS Webhook"""
+store = EventStore()
+
+# --- Metrics (/metrics) ---
+EVENTS_RECEIVED = REGISTRY.counter('webhook_events_received_total', 'Webhook 事件數 (依處理結果)', ['result'])
+EVENTS_COALESCED = REGISTRY.counter('webhook_events_coalesced_total', '合併進既有工作的事件數')
+EVENTS_RETRIED = REGISTRY.counter('webhook_events_retried_total', '同步失敗後重新排入的事件數')
+EVENTS_DEAD = REGISTRY.counter('webhook_events_dead_total', '超過重試上限移入 Dead Letter 的事件數')
+JOBS_FINISHED = REGISTRY.counter('webhook_sync_jobs_total', '完成的同步工作數', ['result'])
+JOB_WAIT = REGISTRY.histogram('webhook_sync_job_wait_seconds', '同步工作排隊時間 (排入至開始)')
+JOB_DURATION = REGISTRY.histogram('webhook_sync_job_duration_seconds', '同步工作執行時間', ['result'])
+ALERT_TO_SYNC = REGISTRY.histogram('webhook_alert_to_sync_seconds', '告警發生至 NetBox 同步完成的端對端延遲', ['result'])
+REGISTRY.gauge('webhook_queue_depth', '尚未開始的同步工作數', func=lambda: jobs.depth())
+
+def alert_timestamp(alert, default):
+    """解析 LibreNMS 告警的 timestamp (本機時間)；無法解析或時間不合理時回傳 default"""
     try:
-        data = request.json
+        ts = time.mktime(time.strptime(str(alert.get('timestamp')), '%Y-%m-%d %H:%M:%S'))
+    except (ValueError, OverflowError):
+        return default
+    return ts if 0 <= default - ts < 86400 else default
+
+def record_job_metrics(job):
+    result = job.state
+    JOBS_FINISHED.inc(result=result)
+    if job.started_at:
+        JOB_WAIT.observe(job.started_at - job.submitted_at)
+        JOB_DURATION.observe(job.finished_at - job.started_at, result=result)
+    if job.alert_at:
+        ALERT_TO_SYNC.observe(job.finished_at - job.alert_at, result=result)
+
+def finish_events(job):
+    """同步結束後更新事件狀態；失敗者延後重新排入佇列"""
+    record_job_metrics(job)
+    if job.state == 'succeeded':
+        store.mark_done(job.events)
+        return
+    retry = store.mark_failed(job.events, job.detail)
+    dead = len(job.events) - len(retry)
+    if dead:
+        EVENTS_DEAD.inc(dead)
+        logger.error(f"💀 {job.hostname}: {dead} 筆事件超過重試上限，移入 Dead Letter")
+    if retry:
+        EVENTS_RETRIED.inc(len(retry))
+        timer = threading.Timer(RETRY_DELAY, jobs.submit, args=(job.hostname, retry, job.alert_at))
+        timer.daemon = True
+        timer.start()
+
+jobs = CoalescingJobQueue(trigger_sync, workers=WORKERS, on_finish=finish_events,
+                          batch_runner=trigger_sync_batch, batch_window=BATCH_WINDOW, batch_max=BATCH_MAX)
+
+def replay_events():
+    """將未完成的事件重新排入同步佇列，回傳事件數"""
+    events = store.unfinished()
+    by_host = {}
+    for ev in events:
+        by_host.setdefault(ev['hostname'], []).append(ev)
+    for hostname, evs in by_host.items():
+        jobs.submit(hostname, [ev['id'] for ev in evs], min(ev['received_at'] for ev in evs))
+    return len(events)
+
+def extract_hostname(data):
+    """從 LibreNMS Alert Payload 解析 Hostname；無法解析回傳 None。"""
+    # 處理 List 類型的 Payload (例如 LibreNMS Test Transport 或 API 輸出)
+    if isinstance(data, list):
         if not data:
-            return jsonify({'status': 'error', 'message': 'No JSON payload'}), 400
-        # 處理 List 類型的 Payload (例如 LibreNMS Test Transport 或 API 輸出)
-        if isinstance(data, list):
-            if len(data) > 0:
-                data = data[0] # 取第一筆資料
-            else:
-                return jsonify({'status': 'error', 'message': 'Empty JSON list'}), 400
-
-        # LibreNMS Alert Payload 格式通常包含 'hostname' 或 'sysName'
-        # 根據實際 LibreNMS Template 調整
-        hostname = data.get('hostname') or data.get('sysName')
+            return None
+        data = data[0] # 取第一筆資料
+
+    # LibreNMS Alert Payload 格式通常包含 'hostname' 或 'sysName'
+    # 根據實際 LibreNMS Template 調整
+    hostname = data.get('hostname') or data.get('sysName')
+    
+    # 嘗試從 rule 陣列中提取 (LibreNMS Default Structure)
+    if not hostname and 'rule' in data and isinstance(data['rule'], list) and len(data['rule']) > 0:
+        hostname = data['rule'][0].get('hostname') or data['rule'][0].get('sysName')
+
+    # 嘗試從 faults 陣列中提取
+    if not hostname and 'faults' in data and isinstance(data['faults'], list) and len(data['faults']) > 0:
+        hostname = data['faults'][0].get('hostname') or data['faults'][0].get('sysName')
         
-        # 嘗試從 rule 陣列中提取 (LibreNMS Default Structure)
-        if not hostname and 'rule' in data and isinstance(data['rule'], list) and len(data['rule']) > 0:
-            hostname = data['rule'][0].get('hostname') or data['rule'][0].get('sysName')
+    # 最後嘗試 title
+    if not hostname:
+         hostname = data.get('title', '').split(' ')[0]
 
-        # 嘗試從 faults 陣列中提取
-        if not hostname and 'faults' in data and isinstance(data['faults'], list) and len(data['faults']) > 0:
-            hostname = data['faults'][0].get('hostname') or data['faults'][0].get('sysName')
-            
-        # 最後嘗試 title
-        if not hostname:
-             hostname = data.get('title', '').split(' ')[0]
+    if not hostname or hostname == "NetBox": # 避免誤觸 NetBox 自身的 Rule
+        return None
+    return hostname
 
-        if not hostname or hostname == "NetBox": # 避免誤觸 NetBox 自身的 Rule
+def accept_event(data):
+    """驗證 Payload、持久化事件並排入同步佇列，回傳 (body, status_code)。
+
+    Flask 與 ASGI (webhook_asgi.py) 兩種模式共用。
+    """
+    try:
+        received_at = time.time()
+        started = time.perf_counter()
+        if not data:
+            EVENTS_RECEIVED.inc(result='invalid')
+            return {'status': 'error', 'message': 'No JSON payload'}, 400
+        if isinstance(data, list) and not data:
+            EVENTS_RECEIVED.inc(result='invalid')
+            return {'status': 'error', 'message': 'Empty JSON list'}, 400
+
+        hostname = extract_hostname(data)
+        if not hostname:
+            EVENTS_RECEIVED.inc(result='ignored')
             logger.warning(f"⚠ Received webhook but could not extract hostname. Payload: {json.dumps(data)}")
-            return jsonify({'status': 'ignored', 'message': 'Hostname not found'}), 200
+            return {'status': 'ignored', 'message': 'Hostname not found'}, 200
 
-        logger.info(f"📩 Received Alert for: {hostname} (State: {data.get('state')}, Alert: {data.get('name')})")
+        alert = data[0] if isinstance(data, list) else data
+        logger.info(f"📩 Received Alert for: {hostname} (State: {alert.get('state')}, Alert: {alert.get('name')})")
 
-        # 觸發同步
-        success, output = trigger_sync(hostname)
+        # 先持久化事件再回應，重啟時可重播
+        event_id = store.append(hostname, data)
 
-        if success:
-            return jsonify({'status': 'success', 'message': f'Sync triggered for {hostname}'}), 200
+        # 排入同步佇列 (同主機尚未執行的工作會合併)
+        job, coalesced = jobs.submit(hostname, [event_id], alert_timestamp(alert, received_at))
+        EVENTS_RECEIVED.inc(result='accepted')
+        if coalesced:
+            EVENTS_COALESCED.inc()
+            logger.info(f"🔁 Coalesced into pending job {job.id} for {hostname}")
         else:
-            return jsonify({'status': 'error', 'message': 'Sync script failed', 'details': output}), 500
+            tracing.flow(job.id, True)
+        tracing.complete('webhook_receive', started, time.perf_counter(), cat='webhook', trace_id=job.id,
+                         hostname=hostname, event_id=event_id, coalesced=coalesced)
+
+        return {
+            'status': 'accepted',
+            'message': f'Sync queued for {hostname}',
+            'job_id': job.id,
+            'event_id': event_id,
+            'coalesced': coalesced,
+            'status_url': f'/jobs/{job.id}',
+        }, 202
 
     except Exception as e:
+        EVENTS_RECEIVED.inc(result='error')
         logger.error(f"🔥 Webhook processing error: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return {'status': 'error', 'message': str(e)}, 500
+
+@app.route('/webhook', methods=['POST'])
+def handle_webhook():
+    """接收 LibreNMS Webhook，排入同步佇列後立即回應 202"""
+    body, status = accept_event(request.get_json(silent=True))
+    return jsonify(body), status
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """查詢同步工作狀態"""
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/events/replay', methods=['POST'])
+def events_replay():
+    """重新排入所有未完成的事件 (例如 event_store.py requeue 之後)"""
+    return jsonify({'status': 'ok', 'replayed': replay_events()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus Metrics"""
+    return REGISTRY.render(), 200, {'Content-Type': CONTENT_TYPE}
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()}), 200
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'queue_depth': jobs.depth(),
+        'events': store.counts(),
+    }), 200
+
+def start_background():
+    """啟動同步 Worker 並重播未完成的事件 (Flask 與 ASGI 模式共用)"""
+    if SYNC_MODE != 'subprocess':
+        # 預先建立連線並載入設備清單，第一個 Webhook 不必等待冷啟動
+        try:
+            get_syncer()
+        except (Exception, SystemExit) as e:
+            logger.warning(f"⚠ Syncer 預熱失敗，將於第一個 Webhook 時重試: {e}")
+
+    tracing.start_tracing(None, 'webhook_receiver', logger)
+    jobs.start()
+    store.purge()
+    replayed = replay_events()
+    if replayed:
+        logger.info(f"🔁 Replayed {replayed} unfinished events")
 
 if __name__ == '__main__':
     # 確保 Log 目錄存在
@@ -127,5 +331,13 @@ if __name__ == '__main__':
         except:
             pass
 
-    print(f"Starting Webhook Receiver on {HOST}:{PORT}...")
-    app.run(host=HOST, port=PORT)
+    if SERVER_MODE == 'asgi':
+        # 正式環境建議：非同步接收 + 在途請求上限 (webhook_asgi.py)
+        # webhook_asgi 以 import 取用本模組；避免 __main__ 被重複載入 (重複的佇列與 Metrics)
+        sys.modules.setdefault('webhook_receiver', sys.modules[__name__])
+        from webhook_asgi import serve
+        serve(HOST, PORT)
+    else:
+        start_background()
+        print(f"Starting Webhook Receiver on {HOST}:{PORT} (workers={WORKERS}, mode={SYNC_MODE})...")
+        app.run(host=HOST, port=PORT)
@@ -0,0 +1,132 @@
+"""轉換函式的合成語料 (固定 Seed，可重現)。
+
+以設備群規模產生 LibreNMS 會回傳的各種值，供 transform_bench.py 量測吞吐量，
+以及 tests/test_transforms.py 在同一份語料上驗證正確性：
+  ports     ifName / ifAlias / ifDescr / ifPhysAddress / ifSpeed (Cisco、Juniper、Linux、
+            Fortinet、Windows/Hyper-V 含亂碼與控制字元、中文描述)
+  devices   os / hardware / sysName 組合 (含未知 OS 與空值)
+  macs      各種 MAC 格式 (冒號、破折號、Cisco 點分、無分隔、全 0、長度錯誤)
+"""
+
+import random
+
+SEED = 20240611
+
+# Hyper-V / Windows 在 SNMP 以錯誤編碼回傳的介面名稱 (實際觀察到的亂碼型態)
+MOJIBAKE = [
+    'Hyper-V ?????A?Ӻ????????d #{n}',
+    'Hyper-V ????洳????? #{n}-WFP Native MAC Layer LightWeight Filter-0000',
+    'Hyper-V Virtual Ethernet Adapter ?�� #{n}',
+    'Hyper-V vSwitch ?活??? #{n}-Microsoft NDIS Capture-0000',
+    'Hyper-V ?????? #{n}',
+    'Microsoft Hyper-V Network Adapter #{n}',
+    'Intel(R) Ethernet Connection I219-LM\x00\x07',
+    'Realtek PCIe GbE Family Controller é¦–å±¤',
+    'WAN Miniport (IP)',
+    'Microsoft Kernel Debug Network Adapter',
+    'Teredo Tunneling Pseudo-Interface',
+    'isatap.{{{n:08X}-1111-2222-3333-444455556666}}',
+]
+
+DESCRIPTIONS = [
+    '', 'Uplink to core', 'To {peer} Gi1/0/{n}', '機房 A 機櫃 {n} 伺服器',
+    'AP-{n:03d} 3F 會議室', 'Printer HP M{n}', 'VPN tunnel → DC2',
+    'unused', 'trunk;vlan 10,20,30', 'CAM-{n:04d}\t(PoE)',
+]
+
+SPEEDS = [0, 10_000_000, 100_000_000, 1_000_000_000, 10_000_000_000,
+          25_000_000_000, 40_000_000_000, 100_000_000_000]
+
+DEVICE_PROFILES = [
+    ('ios', 'WS-C2960X-48FPD-L', 'cisco'), ('iosxe', 'C9300-48P', 'cisco'), ('nxos', 'N9K-C93180YC-EX', 'cisco'),
+    ('junos', 'EX4300-48T', 'juniper'), ('fortigate', 'FortiGate-100F', 'fortinet'),
+    ('arubaos', 'Aruba AP-515', 'aruba'), ('routeros', 'CCR2004-16G-2S+', 'mikrotik'),
+    ('linux', 'Dell PowerEdge R740', 'linux'), ('windows', 'HP ProLiant DL380 Gen10', 'windows'),
+    ('vmware', 'VMware ESXi 7.0.3', 'linux'), ('printer', 'HP LaserJet M507', 'printer'),
+    ('synology', 'DS920+', 'linux'), ('unknown', 'Supermicro X11', 'linux'), ('', '', 'linux'),
+    (None, None, 'linux'), ('qemu', 'QEMU Standard PC', 'linux'), ('panos', 'PA-3220', 'fortinet'),
+]
+
+
+def _port_names(kind, rng, count):
+    if kind == 'cisco':
+        names = [f"GigabitEthernet1/0/{i}" for i in range(1, count + 1)]
+        names += ['Vlan1', 'Vlan10', 'Null0', 'Port-channel1', 'TenGigabitEthernet1/1/1', 'mgmt0', 'Loopback0']
+    elif kind == 'juniper':
+        names = [f"ge-0/0/{i}" for i in range(count)] + ['xe-0/1/0', 'ae0', 'irb', 'lo0', 'me0', 'vme']
+    elif kind == 'fortinet':
+        names = [f"port{i}" for i in range(1, count + 1)] + ['wan1', 'wan2', 'dmz', 'internal', 'ssl.root', 'fortilink']
+    elif kind == 'aruba':
+        names = ['eth0', 'eth1', 'wlan0', 'wlan1', 'bond0', 'br0']
+    elif kind == 'mikrotik':
+        names = [f"ether{i}" for i in range(1, count + 1)] + ['sfp-sfpplus1', 'bridge', 'wlan1']
+    elif kind == 'windows':
+        names = [t.format(n=rng.randint(1, 40)) for t in MOJIBAKE]
+        names += ['Ethernet0', 'Ethernet1', 'Loopback Pseudo-Interface 1', 'Bluetooth Device (PAN)']
+    elif kind == 'printer':
+        names = ['eth0', 'lo']
+    else:
+        names = ['lo', 'eth0', 'ens160', 'enp3s0f0', 'eno1', 'em1', 'docker0', f"veth{rng.randrange(16**6):06x}",
+                 'virbr0', 'bond0', 'tun0', 'wlp2s0']
+    return names
+
+
+def _mac(rng, style):
+    raw = ''.join(rng.choice('0123456789abcdef') for _ in range(12))
+    if style == 0:
+        return raw
+    if style == 1:
+        return ':'.join(raw[i:i + 2] for i in range(0, 12, 2))
+    if style == 2:
+        return '-'.join(raw[i:i + 2] for i in range(0, 12, 2)).upper()
+    if style == 3:
+        return '.'.join(raw[i:i + 4] for i in range(0, 12, 4))
+    if style == 4:
+        return ' ' + raw.upper() + ' '
+    return rng.choice(['', None, '000000000000', '00:00:00:00:00:00', 'N/A', raw[:10], raw + 'ff', 'zz' + raw[2:]])
+
+
+def ports(devices=500, ports_per_device=48, seed=SEED):
+    """設備群的 Port 清單 (LibreNMS /devices/:id/ports 的欄位)。"""
+    rng = random.Random(seed)
+    result = []
+    for d in range(devices):
+        _, _, kind = DEVICE_PROFILES[d % len(DEVICE_PROFILES)]
+        for name in _port_names(kind, rng, ports_per_device):
+            alias = rng.choice(DESCRIPTIONS).format(n=rng.randint(1, 999), peer=f"sw-{rng.randint(1, 99):02d}")
+            result.append({
+                'ifName': name if rng.random() > 0.01 else f"  {name} ",
+                'ifAlias': alias,
+                'ifDescr': name,
+                'ifPhysAddress': _mac(rng, rng.randrange(7)),
+                'ifSpeed': rng.choice(SPEEDS),
+            })
+    return result
+
+
+def devices(count=2000, seed=SEED):
+    """LibreNMS 設備 (os / hardware / sysName)。"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        os_name, hardware, _ = DEVICE_PROFILES[i % len(DEVICE_PROFILES)]
+        result.append({'os': os_name, 'hardware': hardware, 'sysName': f"dev-{i:05d}.example.net"})
+    rng.shuffle(result)
+    return result
+
+
+def text_values(port_list):
+    """sanitize_string 的輸入：介面名稱與描述 (去重前的原始順序)。"""
+    values = []
+    for p in port_list:
+        values.append(p['ifName'])
+        values.append(p['ifAlias'])
+    return values
+
+
+def slug_values(device_list, port_list):
+    """normalize_slug 的輸入：Site / Platform / 型號名稱等。"""
+    values = [d['hardware'] or 'Unknown' for d in device_list]
+    values += [f"{d['os'] or 'generic'} {i % 7}.{i % 3}" for i, d in enumerate(device_list)]
+    values += [p['ifAlias'] for p in port_list[:2000] if p['ifAlias']]
+    return values
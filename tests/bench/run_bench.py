@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""同步腳本離線 Benchmark (不連線正式環境)。
+
+啟動本機 LibreNMS / NetBox / GLPI 替身 (standins.py)，以合成設備群依序執行：
+  librenms-cold   sync_librenms_to_netbox.py (NetBox 為空，全部新建)
+  librenms-warm   sync_librenms_to_netbox.py (無變更，穩態)
+  interfaces      sync_librenms_interfaces.py (Clean Sync)
+  glpi-cold       sync_netbox_to_glpi.py (GLPI 為空)
+  glpi-warm       sync_netbox_to_glpi.py (全部更新)
+每個情境以子行程執行，回報 Wall Time、Peak RSS 與各替身的請求數 (每台設備)。
+
+用法：
+  python3 tests/bench/run_bench.py [--devices 50] [--ports 48] [--vlans 20]
+      [--latency-ms 0] [--error-rate 0] [--scenarios librenms-cold,interfaces] [--json out.json] [-v]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from standins import Fleet, LibreNMSStandIn, NetBoxStandIn, GlpiStandIn
+
+SCRIPTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
+
+SCENARIOS = [
+    ('librenms-cold', 'sync_librenms_to_netbox.py'),
+    ('librenms-warm', 'sync_librenms_to_netbox.py'),
+    ('interfaces', 'sync_librenms_interfaces.py'),
+    ('glpi-cold', 'sync_netbox_to_glpi.py'),
+    ('glpi-warm', 'sync_netbox_to_glpi.py'),
+]
+
+
+def bench_env(workdir, librenms, netbox, glpi):
+    """子行程環境：指向替身，日誌/Metrics/狀態檔寫入暫存目錄。"""
+    env = dict(os.environ)
+    env.update({
+        'LIBRENMS_URL': librenms.api_url, 'LIBRENMS_TOKEN': 'bench',
+        'NETBOX_URL': netbox.url, 'NETBOX_TOKEN': 'bench',
+        'GLPI_API_URL': glpi.api_url, 'GLPI_APP_TOKEN': 'bench', 'GLPI_USER_TOKEN': 'bench',
+        'DRY_RUN': 'False', 'AUTO_CREATE_NEW': 'True', 'NOTIFICATION_URL': '',
+        'IT_NEXUS_LOG_DIR': os.path.join(workdir, 'logs'),
+        'METRICS_FILE_LIBRENMS': os.path.join(workdir, 'metrics_librenms.json'),
+        'METRICS_FILE_GLPI': os.path.join(workdir, 'metrics_glpi.json'),
+        'COORD_DIR': workdir, 'COORD_DB': os.path.join(workdir, 'coordination.db'),
+        'CHANGE_FEED_DIR': os.path.join(workdir, 'change_feed'),
+        'METRICS_HISTORY_DB': os.path.join(workdir, 'metrics_history.db'),
+        'GLPI_SESSION_CACHE': os.path.join(workdir, 'glpi_session.json'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+
+def run_script(script, env, log_path):
+    """執行腳本並以 wait4 取得該子行程的資源用量。"""
+    with open(log_path, 'ab') as log:
+        started = time.monotonic()
+        proc = subprocess.Popen([sys.executable, os.path.join(SCRIPTS_DIR, script)],
+                                cwd=SCRIPTS_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.monotonic() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, wall, usage.ru_maxrss / 1024.0  # Linux: KiB -> MiB
+
+
+def run(args):
+    fleet = Fleet(args.devices, args.ports, args.vlans)
+    opts = {'latency': args.latency_ms / 1000.0, 'error_rate': args.error_rate}
+    standins = [LibreNMSStandIn(fleet, **opts), NetBoxStandIn(**opts), GlpiStandIn(**opts)]
+    for s in standins:
+        s.start()
+    selected = set(args.scenarios.split(',')) if args.scenarios else None
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='it_nexus_bench_') as workdir:
+        env = bench_env(workdir, *standins)
+        log_path = os.path.join(workdir, 'bench.log')
+        try:
+            for name, script in SCENARIOS:
+                if selected and name not in selected:
+                    continue
+                before = [s.snapshot() for s in standins]
+                errors_before = sum(s.errors for s in standins)
+                code, wall, rss = run_script(script, env, log_path)
+                requests = {}
+                for s, b in zip(standins, before):
+                    delta = s.snapshot()
+                    delta.subtract(b)
+                    requests[s.name] = {k: v for k, v in delta.most_common() if v}
+                total = sum(sum(r.values()) for r in requests.values())
+                results.append({
+                    'scenario': name, 'script': script, 'exit_code': code,
+                    'wall_seconds': round(wall, 3), 'peak_rss_mib': round(rss, 1),
+                    'requests': {k: sum(v.values()) for k, v in requests.items()},
+                    'requests_per_device': round(total / max(1, args.devices), 1),
+                    'injected_errors': sum(s.errors for s in standins) - errors_before,
+                    'routes': requests,
+                })
+        finally:
+            for s in standins:
+                s.stop()
+            if args.keep_log:
+                with open(log_path, 'rb') as src, open(args.keep_log, 'wb') as dst:
+                    dst.write(src.read())
+    return {
+        'fleet': {'devices': args.devices, 'ports': args.ports, 'vlans': args.vlans},
+        'latency_ms': args.latency_ms, 'error_rate': args.error_rate,
+        'results': results,
+    }
+
+
+def print_report(report, verbose=False):
+    f = report['fleet']
+    print(f"Fleet: {f['devices']} devices × {f['ports']} ports × {f['vlans']} VLANs, "
+          f"latency={report['latency_ms']}ms, error_rate={report['error_rate']}")
+    print(f"{'scenario':15s} {'exit':>4s} {'wall(s)':>9s} {'rss(MiB)':>9s} "
+          f"{'librenms':>9s} {'netbox':>9s} {'glpi':>7s} {'req/dev':>8s} {'500s':>5s}")
+    for r in report['results']:
+        req = r['requests']
+        print(f"{r['scenario']:15s} {r['exit_code']:>4d} {r['wall_seconds']:>9.2f} {r['peak_rss_mib']:>9.1f} "
+              f"{req.get('librenms', 0):>9d} {req.get('netbox', 0):>9d} {req.get('glpi', 0):>7d} "
+              f"{r['requests_per_device']:>8.1f} {r['injected_errors']:>5d}")
+        if verbose:
+            for standin, routes in r['routes'].items():
+                for route, n in list(routes.items())[:8]:
+                    print(f"    {standin:9s} {n:>7d}  {route}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IT Nexus 同步腳本離線 Benchmark')
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--ports', type=int, default=48)
+    parser.add_argument('--vlans', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0, help="每個請求的模擬延遲")
+    parser.add_argument('--error-rate', type=float, default=0, help="回應 500 的機率 (0~1)")
+    parser.add_argument('--scenarios', help=f"逗號分隔: {', '.join(n for n, _ in SCENARIOS)}")
+    parser.add_argument('--json', help="輸出完整結果 (含各路由請求數) 至檔案")
+    parser.add_argument('--keep-log', help="保留腳本輸出至檔案")
+    parser.add_argument('-v', '--verbose', action='store_true', help="列出各路由請求數")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report, args.verbose)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if any(r['exit_code'] for r in report['results']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,443 @@
+"""本機 LibreNMS / NetBox / GLPI 替身 (Benchmark 用)。
+
+以 ThreadingHTTPServer 模擬同步腳本實際呼叫的 API：
+  LibreNMS  /api/v0/devices, /devices/{id|hostname}, /devices/{id}/ports,
+            /devices/{id}/vlans, /inventory/{id}/all
+  NetBox    /api/ 與 /api/{app}/{model}/[{id}/] (GET 篩選 + 分頁、POST、PATCH/PUT、DELETE)
+  GLPI      /apirest.php/initSession, getActiveProfile, search/{itemtype}, POST/PUT {itemtype}
+
+每個替身可設定延遲 (latency) 與錯誤率 (error_rate，回應 500)，並依路由統計請求數。
+"""
+
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+# =============================================================================
+# 合成設備群
+# =============================================================================
+OS_PROFILES = [
+    # (os, hardware, 介面名稱格式)
+    ('ios', 'Catalyst 9300-48P', 'GigabitEthernet1/0/{n}'),
+    ('linux', 'PowerEdge R650', 'eth{i}'),
+    ('junos', 'EX4300-48T', 'ge-0/0/{i}'),
+    ('fortigate', 'FortiGate 100F', 'port{n}'),
+]
+
+
+class Fleet:
+    """依 devices × ports × vlans 產生固定 (可重現) 的 LibreNMS 資料。"""
+
+    def __init__(self, devices=50, ports=48, vlans=20, sites=5, inventory=2):
+        self.devices = []
+        self.ports = {}
+        self.vlans = {}
+        self.inventory = {}
+        port_id = 0
+        for i in range(1, devices + 1):
+            os_name, hardware, if_format = OS_PROFILES[i % len(OS_PROFILES)]
+            self.devices.append({
+                'device_id': i,
+                'hostname': f"bench-dev{i:05d}.example.net",
+                'sysName': f"bench-dev{i:05d}",
+                'ip': f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+                'os': os_name,
+                'hardware': hardware,
+                'version': '17.9.4',
+                'serial': f"SN{i:08d}",
+                'location': f"Bench Site {i % sites}",
+                'display': f"Bench device {i}",
+                'status': 1,
+            })
+            vids = [10 + v for v in range(vlans)]
+            self.vlans[i] = [{'vlan_vlan': vid, 'vlan_name': f"VLAN{vid:04d}", 'vlan_type': 'ethernet'} for vid in vids]
+            dev_ports = []
+            for p in range(ports):
+                port_id += 1
+                trunk = p == ports - 1 and vids
+                dev_ports.append({
+                    'port_id': port_id,
+                    'ifName': if_format.format(i=p, n=p + 1),
+                    'ifDescr': if_format.format(i=p, n=p + 1),
+                    'ifAlias': f"uplink-{p}" if trunk else f"user-{i}-{p}",
+                    'ifPhysAddress': f"02{i:05x}{p:05x}",
+                    'ifType': 'ethernetCsmacd',
+                    'ifSpeed': 10000000000 if trunk else 1000000000,
+                    'ifMtu': 1500,
+                    'ifAdminStatus': 'up',
+                    'ifOperStatus': 'up' if p % 3 else 'down',
+                    'ifVlan': '' if trunk else (vids[p % len(vids)] if vids else ''),
+                    'ifTrunk': ','.join(str(v) for v in vids[:10]) if trunk else '',
+                })
+            self.ports[i] = dev_ports
+            self.inventory[i] = [
+                {'entPhysicalName': f"Chassis {i}", 'entPhysicalModelName': hardware, 'entPhysicalSerialNum': f"SN{i:08d}"},
+                {'entPhysicalName': 'PSU 1', 'entPhysicalModelName': 'PWR-C1-715WAC', 'entPhysicalSerialNum': f"PS{i:08d}"},
+            ][:inventory]
+        self._index = {}
+        for d in self.devices:
+            for key in (d['device_id'], d['hostname'], d['sysName']):
+                self._index[str(key).lower()] = d
+
+    def find(self, key):
+        return self._index.get(str(key).lower())
+
+
+# =============================================================================
+# 共用 HTTP 替身
+# =============================================================================
+class StandIn:
+    """背景執行的 HTTP 替身；子類別實作 handle(method, path, query, body)。"""
+
+    name = 'standin'
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.counts = Counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            wbufsize = 64 * 1024  # Header 與 Body 一次送出，避免 Nagle + Delayed ACK 的 40ms 延遲
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                body = json.loads(raw) if raw else None
+                status, payload, headers = standin.dispatch(self.command, parts.path,
+                                                            parse_qs(parts.query, keep_blank_values=True), body)
+                data = b'' if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{self.name}-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def dispatch(self, method, path, query, body):
+        with self._lock:
+            self.counts[f"{method} {ID_SEGMENT.sub('/{id}', path)}"] += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 500, {'error': 'injected failure'}, None
+        try:
+            return self.handle(method, path, query, body)
+        except Exception as e:  # 替身本身的錯誤以 500 回報，方便除錯
+            return 500, {'error': f"standin: {e!r}"}, None
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.counts)
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+
+# =============================================================================
+# LibreNMS
+# =============================================================================
+class LibreNMSStandIn(StandIn):
+    name = 'librenms'
+
+    def __init__(self, fleet, **kwargs):
+        super().__init__(**kwargs)
+        self.fleet = fleet
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api/v0"
+
+    def handle(self, method, path, query, body):
+        parts = path.strip('/').split('/')[2:]  # 去掉 api/v0
+        if method != 'GET' or not parts:
+            return 404, {'status': 'error'}, None
+        if parts == ['devices']:
+            return 200, {'status': 'ok', 'devices': self.fleet.devices}, None
+        if parts[0] == 'inventory' and len(parts) == 3:
+            return 200, {'status': 'ok', 'inventory': self.fleet.inventory.get(int(parts[1]), [])}, None
+        if parts[0] == 'devices':
+            dev = self.fleet.find(parts[1])
+            if not dev:
+                return 404, {'status': 'error', 'message': 'Device does not exist'}, None
+            if len(parts) == 2:
+                return 200, {'status': 'ok', 'devices': [dev]}, None
+            if parts[2] == 'ports':
+                ports = self.fleet.ports.get(dev['device_id'], [])
+                columns = query.get('columns', [''])[0]
+                if columns:
+                    keep = columns.split(',')
+                    ports = [{k: p.get(k) for k in keep} for p in ports]
+                return 200, {'status': 'ok', 'ports': ports}, None
+            if parts[2] == 'vlans':
+                return 200, {'status': 'ok', 'vlans': self.fleet.vlans.get(dev['device_id'], [])}, None
+        return 404, {'status': 'error'}, None
+
+
+# =============================================================================
+# NetBox
+# =============================================================================
+# 各 Model 的關聯欄位 (寫入為 ID，讀取展開為 Nested Object) 與選項欄位
+NETBOX_MODELS = {
+    'dcim/sites': {'choices': ('status',)},
+    'dcim/device-roles': {},
+    'dcim/manufacturers': {},
+    'dcim/platforms': {'fk': {'manufacturer': 'dcim/manufacturers'}},
+    'dcim/device-types': {'fk': {'manufacturer': 'dcim/manufacturers'}},
+    'dcim/devices': {
+        'fk': {'site': 'dcim/sites', 'role': 'dcim/device-roles', 'device_type': 'dcim/device-types',
+               'platform': 'dcim/platforms', 'primary_ip4': 'ipam/ip-addresses'},
+        'choices': ('status',),
+        'defaults': {'serial': '', 'description': '', 'platform': None, 'primary_ip4': None},
+    },
+    'dcim/interfaces': {
+        'fk': {'device': 'dcim/devices', 'untagged_vlan': 'ipam/vlans', 'primary_mac_address': 'dcim/mac-addresses'},
+        'fk_list': {'tagged_vlans': 'ipam/vlans'},
+        'choices': ('type', 'mode'),
+        'defaults': {'description': '', 'enabled': True, 'mode': None, 'untagged_vlan': None,
+                     'tagged_vlans': [], 'mac_address': None, 'mtu': None, 'primary_mac_address': None},
+    },
+    'dcim/mac-addresses': {'defaults': {'assigned_object_type': None, 'assigned_object_id': None}},
+    'dcim/inventory-items': {'fk': {'device': 'dcim/devices', 'manufacturer': 'dcim/manufacturers'}},
+    'ipam/vlans': {'fk': {'site': 'dcim/sites'}, 'choices': ('status',)},
+    'ipam/ip-addresses': {'choices': ('status',),
+                          'defaults': {'assigned_object_type': None, 'assigned_object_id': None, 'description': ''}},
+}
+IGNORED_PARAMS = {'limit', 'offset', 'brief', 'ordering', 'exclude'}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+class NetBoxStandIn(StandIn):
+    name = 'netbox'
+
+    def __init__(self, version='4.2', **kwargs):
+        super().__init__(**kwargs)
+        self.version = version
+        self.data = {model: {} for model in NETBOX_MODELS}
+        self._next_id = Counter()
+        self._macs_by_iface = {}
+        self._data_lock = threading.RLock()
+
+    # --- 序列化 ---
+    def _nested(self, model, obj_id):
+        obj = self.data[model].get(obj_id)
+        if obj is None:
+            return None
+        nested = {'id': obj_id, 'url': f"{self.url}/api/{model}/{obj_id}/"}
+        for key in ('name', 'slug', 'model', 'address', 'vid', 'mac_address'):
+            if key in obj:
+                nested[key] = obj[key]
+        nested['display'] = self._display(obj)
+        return nested
+
+    @staticmethod
+    def _display(obj):
+        return str(obj.get('name') or obj.get('model') or obj.get('address') or obj.get('mac_address') or obj['id'])
+
+    def _serialize(self, model, obj):
+        spec = NETBOX_MODELS[model]
+        out = dict(obj)
+        out['url'] = f"{self.url}/api/{model}/{obj['id']}/"
+        for field, ref in spec.get('fk', {}).items():
+            out[field] = self._nested(ref, obj.get(field)) if obj.get(field) else None
+        for field, ref in spec.get('fk_list', {}).items():
+            out[field] = [self._nested(ref, i) for i in obj.get(field) or []]
+        for field in spec.get('choices', ()):
+            value = obj.get(field)
+            out[field] = {'value': value, 'label': str(value).title()} if value is not None else None
+        if model == 'dcim/devices':
+            out['primary_ip'] = out['primary_ip4']
+        if model == 'dcim/interfaces':
+            out['mac_addresses'] = [self._nested('dcim/mac-addresses', m)
+                                    for m in sorted(self._macs_by_iface.get(obj['id'], ()))]
+        out['display'] = self._display(obj)
+        return out
+
+    # --- 寫入 ---
+    @staticmethod
+    def _raw(value):
+        if isinstance(value, dict):
+            return value.get('id', value.get('value'))
+        if isinstance(value, list):
+            return [NetBoxStandIn._raw(v) for v in value]
+        return value
+
+    def _index_mac(self, obj, remove=False):
+        if obj.get('assigned_object_type') != 'dcim.interface' or not obj.get('assigned_object_id'):
+            return
+        macs = self._macs_by_iface.setdefault(obj['assigned_object_id'], set())
+        (macs.discard if remove else macs.add)(obj['id'])
+
+    def _create(self, model, fields):
+        self._next_id[model] += 1
+        obj = dict(NETBOX_MODELS[model].get('defaults', {}))
+        obj.update({k: self._raw(v) for k, v in fields.items()})
+        obj['id'] = self._next_id[model]
+        self.data[model][obj['id']] = obj
+        if model == 'dcim/mac-addresses':
+            self._index_mac(obj)
+        return obj
+
+    def _update(self, model, obj, fields):
+        if model == 'dcim/mac-addresses':
+            self._index_mac(obj, remove=True)
+        obj.update({k: self._raw(v) for k, v in fields.items() if k != 'id'})
+        if model == 'dcim/mac-addresses':
+            self._index_mac(obj)
+        return obj
+
+    def _delete(self, model, obj_id):
+        obj = self.data[model].pop(obj_id)
+        if model == 'dcim/mac-addresses':
+            self._index_mac(obj, remove=True)
+        if model == 'dcim/interfaces':
+            for mac_id in self._macs_by_iface.pop(obj_id, ()):
+                self.data['dcim/mac-addresses'].pop(mac_id, None)
+
+    # --- 查詢 ---
+    def _matches(self, model, obj, query):
+        spec = NETBOX_MODELS[model]
+        for key, wanted in query.items():
+            if key in IGNORED_PARAMS:
+                continue
+            field = key[:-3] if key.endswith('_id') and key[:-3] in spec.get('fk', {}) else key
+            value = obj.get(field)
+            if field == 'address':
+                wanted = {w.split('/')[0] for w in wanted}
+                value = str(value or '').split('/')[0]
+            if str(value) not in set(wanted) and not (value is None and 'null' in wanted):
+                return False
+        return True
+
+    def _list(self, model, query):
+        results = [o for o in self.data[model].values() if self._matches(model, o, query)]
+        limit = int(query.get('limit', [DEFAULT_PAGE_SIZE])[0] or MAX_PAGE_SIZE)
+        limit = min(limit, MAX_PAGE_SIZE)
+        offset = int(query.get('offset', [0])[0])
+        page = results[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(results):
+            params = '&'.join(f"{k}={v}" for k, vs in query.items() if k not in ('limit', 'offset') for v in vs)
+            next_url = f"{self.url}/api/{model}/?{params}&limit={limit}&offset={offset + limit}"
+        return {'count': len(results), 'next': next_url, 'previous': None,
+                'results': [self._serialize(model, o) for o in page]}
+
+    def handle(self, method, path, query, body):
+        if path.rstrip('/') in ('/api', ''):
+            return 200, {}, {'API-Version': self.version}
+        if path.rstrip('/') == '/api/status':
+            return 200, {'netbox-version': f"{self.version}.0"}, {'API-Version': self.version}
+        parts = path.strip('/').split('/')[1:]
+        model = '/'.join(parts[:2])
+        if model not in NETBOX_MODELS:
+            return 404, {'detail': 'Not found.'}, None
+        obj_id = int(parts[2]) if len(parts) > 2 else None
+
+        with self._data_lock:
+            if obj_id is None:
+                if method == 'GET':
+                    return 200, self._list(model, query), None
+                if method == 'POST':
+                    if isinstance(body, list):
+                        return 201, [self._serialize(model, self._create(model, b)) for b in body], None
+                    return 201, self._serialize(model, self._create(model, body or {})), None
+                return 405, {'detail': 'Method not allowed.'}, None
+
+            obj = self.data[model].get(obj_id)
+            if obj is None:
+                return 404, {'detail': 'Not found.'}, None
+            if method == 'GET':
+                return 200, self._serialize(model, obj), None
+            if method in ('PATCH', 'PUT'):
+                return 200, self._serialize(model, self._update(model, obj, body or {})), None
+            if method == 'DELETE':
+                self._delete(model, obj_id)
+                return 204, None, None
+        return 405, {'detail': 'Method not allowed.'}, None
+
+
+# =============================================================================
+# GLPI
+# =============================================================================
+class GlpiStandIn(StandIn):
+    name = 'glpi'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.items = {}  # itemtype -> {id: input}
+        self._next_id = 0
+        self._data_lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        return f"{self.url}/apirest.php"
+
+    def handle(self, method, path, query, body):
+        parts = path.strip('/').split('/')[1:]  # 去掉 apirest.php
+        if parts == ['initSession']:
+            return 200, {'session_token': 'bench-session'}, None
+        if parts == ['getActiveProfile']:
+            return 200, {'active_profile': {'id': 4, 'name': 'Super-Admin'}}, None
+        with self._data_lock:
+            if parts[0] == 'search' and method == 'GET':
+                items = self.items.get(parts[1], {})
+                field = query.get('criteria[0][field]', [''])[0]
+                value = query.get('criteria[0][value]', [''])[0]
+                key = {'1': 'name', '5': 'serial'}.get(field)
+                found = [i for i, item in items.items() if key and str(item.get(key)) == value]
+                return 200, {'totalcount': len(found), 'data': [{'2': i, '1': items[i]['name']} for i in found]}, None
+            itemtype = parts[0]
+            if method == 'POST' and len(parts) == 1:
+                self._next_id += 1
+                self.items.setdefault(itemtype, {})[self._next_id] = dict((body or {}).get('input', {}))
+                return 201, {'id': self._next_id, 'message': ''}, None
+            if method == 'PUT' and len(parts) == 2:
+                item = self.items.get(itemtype, {}).get(int(parts[1]))
+                if item is None:
+                    return 404, ['ERROR_ITEM_NOT_FOUND', ''], None
+                item.update((body or {}).get('input', {}))
+                return 200, [{parts[1]: True, 'message': ''}], None
+        return 400, ['ERROR_BAD_REQUEST', ''], None
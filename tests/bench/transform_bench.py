@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""同步轉換函式 Microbenchmark (吞吐量回歸檢查)。
+
+每台設備 / 每個 Port 都會執行的純函式 (sanitize_string、兩份 format_mac、normalize_slug、
+get_manufacturer_name、get_role_slug、is_physical_interface、map_interface_type)
+以 corpus.py 的設備群語料量測每筆耗時，與 transform_baselines.json 比較。
+
+不同機器速度不同，基準值以「每筆耗時 / 校正迴圈耗時」的相對值保存，
+同一份基準可在開發機與 CI 上共用；相對值超過基準 (1 + threshold) 倍視為退化。
+基準檔另存各函式在語料上的輸出摘要 (digest)，tests/test_transforms.py 以此確認
+改寫後的輸出與改寫前完全一致。
+
+用法：
+  python3 tests/bench/transform_bench.py                   # 量測並比較 (退化時 Exit Code 1)
+  python3 tests/bench/transform_bench.py --update-baselines # 確認變更合理後更新基準
+  python3 tests/bench/transform_bench.py --threshold 0.5 --json out.json
+單元測試：IT_NEXUS_BENCH=1 python -m pytest tests/test_transforms.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from unittest.mock import patch, MagicMock
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', '..', 'scripts'))
+BASELINE_FILE = os.path.join(BENCH_DIR, 'transform_baselines.json')
+DEFAULT_THRESHOLD = 0.5
+
+# 吞吐量量測的語料規模 (設備數 × 每台 Port 數)；digest 使用較小的固定規模
+BENCH_SCALE = (500, 48)
+DIGEST_SCALE = (60, 24)
+
+for path in (SCRIPTS_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import corpus  # noqa: E402
+
+_UNKNOWN_SLUG = re.compile(r'^unknown-\d+$')
+
+
+def load_functions():
+    """匯入同步模組 (略過模組層級的 setup_logging)，回傳 {名稱: 函式}。"""
+    with patch('utils.setup_logging', return_value=MagicMock()):
+        import sync_librenms_to_netbox as librenms
+        import sync_librenms_interfaces as interfaces
+    return {
+        'sanitize_string': librenms.sanitize_string,
+        'format_mac.netbox': librenms.format_mac,
+        'format_mac.interfaces': interfaces.format_mac,
+        'normalize_slug': librenms.normalize_slug,
+        'get_manufacturer_name': librenms.get_manufacturer_name,
+        'get_role_slug': librenms.get_role_slug,
+        'is_physical_interface': interfaces.is_physical_interface,
+        'map_interface_type': interfaces.map_interface_type,
+    }
+
+
+def build_inputs(devices, ports_per_device):
+    """{案例名稱: [引數 tuple, ...]}，各函式以實際呼叫時的引數形式餵入。"""
+    port_list = corpus.ports(devices, ports_per_device)
+    device_list = corpus.devices(devices * 4)
+    names = [(p['ifName'],) for p in port_list]
+    macs = [(p['ifPhysAddress'],) for p in port_list]
+    return {
+        'sanitize_string': [(t,) for t in corpus.text_values(port_list)],
+        'format_mac.netbox': macs,
+        'format_mac.interfaces': macs,
+        'normalize_slug': [(t,) for t in corpus.slug_values(device_list, port_list)],
+        'get_manufacturer_name': [(d,) for d in device_list],
+        'get_role_slug': [(d,) for d in device_list],
+        'is_physical_interface': names,
+        'map_interface_type': [(p['ifName'], p['ifSpeed']) for p in port_list],
+    }
+
+
+def calibrate(rounds=5):
+    """固定的純 Python 工作量 (字串/字典操作)，回傳最佳秒數作為機器速度的基準。"""
+    words = [f"GigabitEthernet1/0/{i}" for i in range(20000)]
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        table = {}
+        for w in words:
+            key = w.lower().replace('/', '-')
+            table[key] = table.get(key, 0) + len(w.split('/'))
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(func, inputs, repeat=5):
+    """最佳一輪的每筆耗時 (ns)；有 LRU Cache 的函式每輪先清空 (只計同一輪語料內的重複命中)。"""
+    best = float('inf')
+    clear = getattr(func, 'cache_clear', None)
+    for _ in range(repeat):
+        if clear:
+            clear()
+        started = time.perf_counter()
+        for args in inputs:
+            func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best / len(inputs) * 1e9
+
+
+def _normalize(name, value):
+    # normalize_slug 的 Fallback 以 hash() 產生，每個行程不同
+    if name == 'normalize_slug' and isinstance(value, str) and _UNKNOWN_SLUG.match(value):
+        return 'unknown-*'
+    return value
+
+
+def digests(functions=None, scale=DIGEST_SCALE):
+    """各函式在固定語料上的輸出摘要 (SHA-256)。"""
+    functions = functions or load_functions()
+    result = {}
+    for name, inputs in build_inputs(*scale).items():
+        h = hashlib.sha256()
+        for args in inputs:
+            out = _normalize(name, functions[name](*args))
+            h.update(json.dumps(out, ensure_ascii=False).encode('utf-8'))
+            h.update(b'\n')
+        result[name] = h.hexdigest()
+    return result
+
+
+def run(scale=BENCH_SCALE, repeat=5, only=None):
+    functions = load_functions()
+    inputs = build_inputs(*scale)
+    results, calibrations = {}, []
+    for name, func in functions.items():
+        if only and name not in only:
+            continue
+        # 每個案例前後各校正一次，抵銷 CPU 頻率與其他負載的變動
+        before = calibrate()
+        ns = measure(func, inputs[name], repeat)
+        calib_ns = min(before, calibrate()) * 1e9
+        calibrations.append(calib_ns)
+        results[name] = {'items': len(inputs[name]), 'ns_per_item': round(ns, 1),
+                         'per_sec': int(1e9 / ns) if ns else 0, 'relative': round(ns / calib_ns * 1e4, 3)}
+    return {'calibration_ns': round(min(calibrations or [0])), 'scale': list(scale), 'cases': results}
+
+
+def load_baselines(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(report, baselines, threshold=DEFAULT_THRESHOLD):
+    """相對耗時超過基準 (1 + threshold) 倍的案例 [(名稱, 基準, 目前, 倍數)]。"""
+    regressions = []
+    for name, cur in report['cases'].items():
+        base = baselines.get('cases', {}).get(name)
+        if not base:
+            continue
+        ratio = cur['relative'] / base['relative']
+        if ratio > 1 + threshold:
+            regressions.append((name, base['relative'], cur['relative'], round(ratio, 2)))
+    return regressions
+
+
+def check(baselines, threshold=DEFAULT_THRESHOLD, retries=2, **kwargs):
+    """量測並比較；超過門檻的案例重新量測 (取最佳值) 以排除偶發干擾，回傳 (report, regressions)。"""
+    report = run(**kwargs)
+    regressions = compare(report, baselines, threshold)
+    for _ in range(retries):
+        if not regressions:
+            break
+        rerun = run(**dict(kwargs, only={r[0] for r in regressions}))
+        for name, r in rerun['cases'].items():
+            if r['relative'] < report['cases'][name]['relative']:
+                report['cases'][name] = r
+        regressions = compare(report, baselines, threshold)
+    return report, regressions
+
+
+def median_report(rounds=3, **kwargs):
+    """多次量測取各案例 relative 的中位數 (更新基準用)。"""
+    reports = [run(**kwargs) for _ in range(rounds)]
+    merged = reports[0]
+    for name in merged['cases']:
+        ordered = sorted((r['cases'][name] for r in reports), key=lambda c: c['relative'])
+        merged['cases'][name] = ordered[len(ordered) // 2]
+    return merged
+
+
+def save_baselines(report, path=BASELINE_FILE):
+    data = {
+        'note': "relative = 每筆耗時 / 校正迴圈耗時 × 10^4；由 transform_bench.py --update-baselines 產生",
+        'threshold': DEFAULT_THRESHOLD,
+        'scale': report['scale'],
+        'digest_scale': list(DIGEST_SCALE),
+        'cases': {name: {'relative': r['relative'], 'ns_per_item': r['ns_per_item']}
+                  for name, r in report['cases'].items()},
+        'digests': digests(),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IT Nexus 轉換函式 Microbenchmark')
+    parser.add_argument('--threshold', type=float, help=f"允許的相對退化比例 (預設取基準檔，或 {DEFAULT_THRESHOLD})")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help="逗號分隔的案例名稱")
+    parser.add_argument('--update-baselines', action='store_true', help="以本次結果覆寫基準檔")
+    parser.add_argument('--json', help="輸出結果至檔案")
+    args = parser.parse_args()
+    if args.update_baselines and args.only:
+        parser.error("--update-baselines 需量測全部案例，不可與 --only 併用")
+
+    baselines = load_baselines()
+    threshold = args.threshold if args.threshold is not None else baselines.get('threshold', DEFAULT_THRESHOLD)
+    if args.update_baselines:
+        report, regressions = median_report(repeat=args.repeat), []
+    else:
+        report, regressions = check(baselines, threshold, repeat=args.repeat,
+                                    only=set(args.only.split(',')) if args.only else None)
+    print(f"Corpus: {report['scale'][0]} devices × {report['scale'][1]} ports, calibration={report['calibration_ns'] / 1e6:.2f}ms")
+    print(f"{'case':24s} {'items':>7s} {'ns/item':>9s} {'items/s':>11s} {'relative':>9s} {'baseline':>9s}")
+    for name, r in report['cases'].items():
+        base = baselines.get('cases', {}).get(name, {}).get('relative')
+        print(f"{name:24s} {r['items']:>7d} {r['ns_per_item']:>9.1f} {r['per_sec']:>11,d} {r['relative']:>9.3f} "
+              f"{base if base is not None else '-':>9}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baselines:
+        save_baselines(report)
+        print(f"已更新基準: {BASELINE_FILE}")
+        return 0
+
+    for name, base, cur, ratio in regressions:
+        print(f"❌ {name}: relative {base} -> {cur} (x{ratio}，門檻 x{1 + threshold:.2f})")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
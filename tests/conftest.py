@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 測試以 `from scripts.X import ...` 匯入，而 scripts/ 內的模組彼此以 `import utils`、
+# `import tracing` 等平面方式匯入；兩者都加入 sys.path，直接執行 `pytest` 即可。
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
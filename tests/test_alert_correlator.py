@@ -0,0 +1,83 @@
+import time
+import threading
+import unittest
+
+from scripts.alert_correlator import StormCorrelator, group_alerts
+
+
+class FakeTopology:
+    """dist-sw1 下掛 access-1..3；core 無告警。"""
+
+    LINKS = {
+        'access-1': ('hq', {'dist-sw1'}),
+        'access-2': ('hq', {'dist-sw1'}),
+        'access-3': ('hq', {'dist-sw1'}),
+        'dist-sw1': ('hq', {'core', 'access-1', 'access-2', 'access-3'}),
+        'printer-9': ('branch', set()),
+    }
+
+    def lookup(self, device):
+        return self.LINKS.get(device, (None, set()))
+
+
+class TestStormGrouping(unittest.TestCase):
+
+    def test_group_by_upstream_then_site(self):
+        """共同上游設備的告警聚合為一組，其餘依 Site 分組。"""
+        alerts = [{'title': f'Device Down {d}', 'rule': 'Device Down', 'device': d}
+                  for d in ('access-1', 'access-2', 'access-3', 'dist-sw1', 'printer-9')]
+        groups = group_alerts(alerts, FakeTopology())
+
+        upstream = groups[('upstream', 'dist-sw1')]
+        self.assertEqual(sorted(a['device'] for a in upstream),
+                         ['access-1', 'access-2', 'access-3', 'dist-sw1'])
+        self.assertEqual([a['device'] for a in groups[('site', 'branch')]], ['printer-9'])
+
+    def test_without_topology_groups_rule_within_location(self):
+        """無 NetBox 資料時僅在同一 Location 內依規則分組；無法判斷位置者各自成組。"""
+        alerts = [{'title': 'Device Down a', 'rule': 'Device Down', 'device': 'a', 'site': 'HQ'},
+                  {'title': 'Device Down b', 'rule': 'Device Down', 'device': 'b', 'site': 'HQ'},
+                  {'title': 'Device Down c', 'rule': 'Device Down', 'device': 'c', 'site': 'Branch'},
+                  {'title': 'Device Down d', 'rule': 'Device Down', 'device': 'd'},
+                  {'title': 'Something'}]
+        groups = group_alerts(alerts)
+        self.assertEqual(len(groups[('rule', 'device down @ hq')]), 2)
+        self.assertEqual(len(groups[('rule', 'device down @ branch')]), 1)
+        self.assertIn(('single', 3), groups)
+        self.assertIn(('single', 4), groups)
+
+
+class TestStormCorrelator(unittest.TestCase):
+
+    def make(self, window=5, quiet=0.1):
+        self.flushed = []
+        self.done = threading.Event()
+
+        def single(alert):
+            self.flushed.append(alert)
+            self.done.set()
+
+        correlator = StormCorrelator(lambda key, alerts: None, single, window=window, quiet=quiet)
+        correlator.start()
+        self.addCleanup(correlator.stop)
+        return correlator
+
+    def test_lone_alert_flushes_after_quiet_period(self):
+        correlator = self.make(window=5, quiet=0.1)
+        start = time.monotonic()
+        correlator.add({'title': 'Device Down a', 'device': 'a', '_fingerprint': 'fp-a'})
+        self.assertTrue(self.done.wait(2))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_cancel_matches_fingerprint_only(self):
+        """恢復只抵銷同一 Fingerprint；同規則同設備的其他故障仍保留。"""
+        correlator = self.make(window=5, quiet=0.3)
+        correlator.add({'title': 'Port Down sw1', 'device': 'sw1', '_fingerprint': 'gi0/1'})
+        correlator.add({'title': 'Port Down sw1', 'device': 'sw1', '_fingerprint': 'gi0/2'})
+        self.assertTrue(correlator.cancel('gi0/1'))
+        self.assertFalse(correlator.cancel('gi0/3'))
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual([a['_fingerprint'] for a in self.flushed], ['gi0/2'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import time
+import socket
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+with patch('utils.setup_logging', return_value=MagicMock()):
+    from scripts import alert_glpi_daemon as daemon_mod
+
+transport = daemon_mod.transport
+
+
+def make_daemon(workers=2, queue_size=100):
+    with patch.object(transport, 'init_session', return_value=MagicMock()), \
+            patch.object(transport, 'open_index', return_value=None), \
+            patch.object(daemon_mod.NetBoxTopology, 'from_env', return_value=None):
+        return daemon_mod.AlertDaemon(workers=workers, queue_size=queue_size)
+
+
+class ConcurrencyProbe:
+    """記錄 process_alert 的最大併發數 (全體與同一 alert_key)。"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active, self.per_key = 0, {}
+        self.max_active, self.max_per_key = 0, 0
+        self.processed = []
+
+    def __call__(self, alert, glpi, index=None):
+        key = transport.alert_key(alert['title'])
+        with self.lock:
+            self.active += 1
+            self.per_key[key] = self.per_key.get(key, 0) + 1
+            self.max_active = max(self.max_active, self.active)
+            self.max_per_key = max(self.max_per_key, self.per_key[key])
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            self.per_key[key] -= 1
+            self.processed.append(alert['title'])
+
+
+class TestAlertDaemon(unittest.TestCase):
+
+    def test_bounded_concurrency_and_per_key_ordering(self):
+        daemon = make_daemon(workers=3)
+        probe = ConcurrencyProbe()
+        alerts = [{'title': f'Device Down sw{i}'} for i in range(6)]
+        # 同一告警的開單與恢復不可同時處理
+        alerts += [{'title': 'Device Down sw0'}, {'title': 'Recovery: Device Down sw0'}]
+        with patch.object(transport, 'process_alert', probe):
+            daemon.start()
+            for alert in alerts:
+                self.assertTrue(daemon.submit(alert))
+            daemon.stop()
+        self.assertEqual(len(probe.processed), len(alerts))
+        self.assertLessEqual(probe.max_active, 3)
+        self.assertGreater(probe.max_active, 1)
+        self.assertEqual(probe.max_per_key, 1)
+
+    def test_full_queue_rejects(self):
+        daemon = make_daemon(workers=1, queue_size=2)
+        self.assertTrue(daemon.submit({'title': 'a'}))
+        self.assertTrue(daemon.submit({'title': 'b'}))
+        self.assertFalse(daemon.submit({'title': 'c'}))
+
+
+class TestSocketHandoff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'alert.sock')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _serve(self, accept):
+        stub = MagicMock()
+        stub.submit.side_effect = accept
+        stub.queue.qsize.return_value = 0
+        server = daemon_mod.AlertServer(self.path, stub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return stub
+
+    def test_client_hands_off_to_daemon(self):
+        stub = self._serve(lambda alert: True)
+        alert = {'title': 'Device Down sw1', 'message': '中斷', 'device': 'sw1'}
+        with patch.object(transport, 'ALERT_DAEMON_SOCKET', self.path):
+            self.assertTrue(transport.send_to_daemon(alert))
+        stub.submit.assert_called_once_with(alert)
+
+    def test_client_falls_back_when_daemon_busy_or_down(self):
+        self._serve(lambda alert: False)
+        with patch.object(transport, 'ALERT_DAEMON_SOCKET', self.path):
+            self.assertFalse(transport.send_to_daemon({'title': 'x'}))
+
+        # Socket 不存在、或殘留的 Socket 檔案無人監聽
+        missing = os.path.join(self.tmp.name, 'missing.sock')
+        with patch.object(transport, 'ALERT_DAEMON_SOCKET', missing):
+            self.assertFalse(transport.send_to_daemon({'title': 'x'}))
+        stale = os.path.join(self.tmp.name, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        with patch.object(transport, 'ALERT_DAEMON_SOCKET', stale):
+            self.assertFalse(transport.send_to_daemon({'title': 'x'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from scripts import librenms_alert_glpi as transport
+from scripts.alert_index import AlertIndex, alert_base, alert_fingerprint
+
+
+def glpi_stub(status):
+    """GLPI Session 管理器替身：GET Ticket/{id} 回傳指定 status，POST Ticket 開出 #99。"""
+    glpi = MagicMock()
+
+    def request(method, path, **kw):
+        resp = MagicMock(status_code=200)
+        if method == 'GET' and path.startswith('Ticket/'):
+            resp.json.return_value = {'id': int(path.split('/')[1]), 'status': status}
+        elif method == 'GET':
+            resp.json.return_value = []                 # 標題搜尋無結果
+        else:
+            resp.json.return_value = {'id': 99}
+        return resp
+
+    glpi.request.side_effect = request
+    return glpi
+
+
+class TestAlertIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = AlertIndex(os.path.join(self.tmp.name, 'alert_index.db'))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_fingerprint_is_order_and_format_independent(self):
+        """faults 的順序與格式 (JSON / 逗號分隔) 不影響 Fingerprint。"""
+        a = alert_fingerprint('Device Down', 'SW1', '["Gi0/1", "Gi0/2"]')
+        b = alert_fingerprint('device down', 'sw1', 'Gi0/2,Gi0/1')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, alert_fingerprint('Device Down', 'sw1'))
+
+    def test_record_lookup_and_clear(self):
+        """開單寫入、依 base 查詢、結案清除。"""
+        fp = alert_fingerprint('Port Down', 'sw1', ['Gi0/1'])
+        base = alert_base('Port Down', 'sw1')
+        self.index.record(fp, base, 42, 'Port Down sw1')
+
+        self.assertEqual(self.index.lookup(fp)['ticket_id'], 42)
+        self.assertEqual([e['ticket_id'] for e in self.index.lookup_base(base)], [42])
+
+        self.index.clear(fp)
+        self.assertIsNone(self.index.lookup(fp))
+        self.assertEqual(self.index.lookup_base(base), [])
+
+    def test_expired_rows_are_ignored_and_pruned(self):
+        fp, base = alert_fingerprint('Port Down', 'sw1'), alert_base('Port Down', 'sw1')
+        self.index.record(fp, base, 42)
+        self.index.ttl = 60
+        self.index._conn.execute("UPDATE alert_tickets SET updated_at = ?", (time.time() - 120,))
+        self.assertIsNone(self.index.lookup(fp))
+        self.assertEqual(self.index.open_count(42), 0)
+        self.assertEqual(self.index.prune(), 1)
+
+
+class TestProcessAlertWithIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = AlertIndex(os.path.join(self.tmp.name, 'alert_index.db'))
+        self.alert = {'title': 'Device Down sw1', 'message': 'down', 'rule': 'Device Down', 'device': 'sw1'}
+        fp, base = transport.alert_identity(self.alert)
+        self.index.record(fp, base, 42, self.alert['title'])
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def posts(self, glpi):
+        return [c.args[1] for c in glpi.request.call_args_list if c.args[0] == 'POST']
+
+    def test_open_ticket_in_glpi_skips_creation(self):
+        glpi = glpi_stub(status=2)
+        transport.process_alert(self.alert, glpi, self.index)
+        self.assertEqual(self.posts(glpi), [])
+        self.assertEqual(self.index.open_count(42), 1)
+
+    def test_ticket_closed_by_hand_clears_row_and_reopens(self):
+        """工單已在 GLPI 人工結案：清除索引紀錄，重新開單並記錄新 Ticket ID。"""
+        glpi = glpi_stub(status=6)
+        transport.process_alert(self.alert, glpi, self.index)
+        self.assertEqual(self.posts(glpi), ['Ticket'])
+        self.assertEqual(self.index.open_count(42), 0)
+        self.assertEqual(self.index.lookup(transport.alert_identity(self.alert)[0])['ticket_id'], 99)
+
+    def test_missing_alert_index_module_falls_back(self):
+        import builtins
+        real_import = builtins.__import__
+
+        def no_alert_index(name, *args, **kw):
+            if name == 'alert_index':
+                raise ImportError(name)
+            return real_import(name, *args, **kw)
+
+        with patch('builtins.__import__', no_alert_index):
+            self.assertIsNone(transport.open_index())
+
+
+if __name__ == '__main__':
+    unittest.main()
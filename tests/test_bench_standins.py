@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+import pynetbox
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'bench'))
+from standins import Fleet, LibreNMSStandIn, NetBoxStandIn  # noqa: E402
+
+
+class TestBenchStandIns(unittest.TestCase):
+    """確認替身與 pynetbox / requests 的實際用法相容 (Benchmark 數字才有意義)。"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.netbox = NetBoxStandIn()
+        cls.librenms = LibreNMSStandIn(Fleet(devices=3, ports=4, vlans=2))
+        cls.netbox.start()
+        cls.librenms.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.netbox.stop()
+        cls.librenms.stop()
+
+    def test_pynetbox_crud_and_filter(self):
+        nb = pynetbox.api(self.netbox.url, token='bench')
+        site = nb.dcim.sites.create(name='HQ', slug='hq')
+        dev = nb.dcim.devices.create(name='sw-core-01', site=site.id, status='active')
+        nb.dcim.devices.create(name='srv-web-01', site=site.id, status='offline')
+
+        found = nb.dcim.devices.get(name='sw-core-01')
+        self.assertEqual(found.site.name, 'HQ')
+        self.assertEqual(found.status.value, 'active')
+        self.assertEqual([d.name for d in nb.dcim.devices.filter(status='offline')], ['srv-web-01'])
+
+        found.serial = 'SN001'
+        self.assertTrue(found.save())
+        self.assertEqual(nb.dcim.devices.get(dev.id).serial, 'SN001')
+
+        iface = nb.dcim.interfaces.create(device=dev.id, name='Gi1/0/1', type='1000base-t')
+        nb.dcim.mac_addresses.create(mac_address='00:11:22:33:44:55',
+                                     assigned_object_type='dcim.interface', assigned_object_id=iface.id)
+        self.assertEqual(nb.dcim.interfaces.get(iface.id).mac_addresses[0].mac_address, '00:11:22:33:44:55')
+        iface.delete()
+        self.assertEqual(len(nb.dcim.mac_addresses.filter(assigned_object_id=iface.id)), 0)
+        self.assertEqual(self.netbox.snapshot()['GET /api/dcim/devices/{id}/'], 1)
+
+    def test_librenms_fleet(self):
+        resp = requests.get(f"{self.librenms.api_url}/devices", timeout=5).json()
+        self.assertEqual(len(resp['devices']), 3)
+        dev_id = resp['devices'][0]['device_id']
+        ports = requests.get(f"{self.librenms.api_url}/devices/{dev_id}/ports", timeout=5).json()
+        self.assertEqual(len(ports['ports']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
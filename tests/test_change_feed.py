@@ -0,0 +1,61 @@
+import tempfile
+import threading
+import unittest
+
+from scripts.change_feed import ChangeFeed, change_event
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.feed = ChangeFeed(self.tmp.name, segment_bytes=2048, keep_segments=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_consumer_resumes_from_committed_offset(self):
+        self.feed.append([change_event('sw1', 'status', 'active', 'decommissioning', device_id=1)], run_id='r1')
+        self.feed.append([change_event('sw2', 'site', 'HQ', 'DC1', device_id=2)], run_id='r2')
+
+        events = self.feed.consume('glpi')
+        self.assertEqual([(e['seq'], e['device'], e['run_id']) for e in events], [(1, 'sw1', 'r1'), (2, 'sw2', 'r2')])
+        self.feed.commit('glpi', events[0]['seq'])
+        self.assertEqual([e['device'] for e in self.feed.consume('glpi')], ['sw2'])
+        # 其他 Consumer 的 Offset 各自獨立
+        self.assertEqual(len(self.feed.consume('notify')), 2)
+
+    def test_rotation_keeps_seq_and_prunes_old_segments(self):
+        for i in range(100):
+            self.feed.append([change_event(f"sw{i}", 'serial', None, f"SN{i:04d}")])
+        segments = self.feed.segments()
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(self.feed.head(), 100)
+        events = self.feed.read(after=0, limit=1000)
+        self.assertEqual(events[0]['seq'], segments[0][0])
+        self.assertEqual([e['seq'] for e in events], list(range(segments[0][0], 101)))
+
+    def test_concurrent_writers_get_unique_seq(self):
+        def writer(n):
+            feed = ChangeFeed(self.tmp.name, segment_bytes=1 << 20)
+            for i in range(25):
+                feed.append([change_event(f"w{n}", 'status', i, i + 1)])
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([e['seq'] for e in self.feed.read(limit=1000)], list(range(1, 101)))
+
+    def test_torn_write_is_skipped(self):
+        self.feed.append([change_event('sw1', 'role', 'server', 'switch')])
+        with open(self.feed.segments()[-1][1], 'a') as f:
+            f.write('{"seq": 2, "dev')  # 寫入中斷
+        self.feed.append([change_event('sw2', 'role', 'server', 'switch')])
+        self.assertEqual([e['device'] for e in self.feed.read()], ['sw1', 'sw2'])
+        self.assertEqual(self.feed.head(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import socket
+import tempfile
+import subprocess
+import threading
+import time
+import unittest
+
+from scripts.coordination import DeviceLeases, run_lock, RunLockBusy
+
+
+class TestDeviceLeases(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'coordination.db')
+        self.cron = DeviceLeases('sync_librenms', self.path)
+        self.webhook = DeviceLeases('webhook_receiver', self.path)
+
+    def tearDown(self):
+        self.cron.close()
+        self.webhook.close()
+        self.tmp.cleanup()
+
+    def test_lease_is_exclusive_between_owners(self):
+        self.assertTrue(self.cron.acquire(42))
+        self.assertFalse(self.webhook.acquire(42))
+        self.assertTrue(self.webhook.acquire(43))
+        self.cron.release(42)
+        self.assertTrue(self.webhook.acquire(42))
+
+    def test_lease_of_dead_process_is_taken_over(self):
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        now = time.time()
+        self.cron._conn.execute(
+            "INSERT INTO leases (device, owner, host, pid, acquired_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ('42', 'sync_interfaces', socket.gethostname(), proc.pid, now, now + 900),
+        )
+        self.assertTrue(self.webhook.acquire(42))
+
+    def test_lease_is_exclusive_between_threads(self):
+        """同一行程 (Receiver) 的兩個 Worker 不可同時持有同一設備。"""
+        results = {}
+
+        def worker(name, hold):
+            results[name] = self.webhook.acquire(42)
+            if results[name]:
+                hold.wait(5)
+                self.webhook.release(42)
+
+        hold = threading.Event()
+        first = threading.Thread(target=worker, args=('first', hold))
+        first.start()
+        while not self.webhook._held:
+            time.sleep(0.01)
+        second = threading.Thread(target=worker, args=('second', threading.Event()))
+        second.start()
+        second.join()
+        self.assertEqual(results, {'first': True, 'second': False})
+
+        # 第二個 Worker 的 release 不會釋放第一個 Worker 的租約
+        self.webhook.release(42)
+        self.assertFalse(self.cron.acquire(42))
+        hold.set()
+        first.join()
+        self.assertTrue(self.cron.acquire(42))
+
+    def test_long_sync_renews_lease(self):
+        leases = DeviceLeases('sync_interfaces', self.path, ttl=0.6)
+        self.addCleanup(leases.close)
+        self.assertTrue(leases.acquire(42))
+        time.sleep(1.2)                                 # 超過 TTL，背景續約
+        self.assertFalse(self.webhook.acquire(42))
+        leases.release(42)
+        self.assertEqual(leases.renew(), 0)
+        self.assertTrue(self.webhook.acquire(42))
+
+    def test_synced_since_matches_aliases(self):
+        alert_at = time.time()
+        self.assertTrue(self.cron.acquire(42))
+        self.cron.release(42, started_at=alert_at + 1, aliases=('SW-Core-01', 'sw-core-01.example.com'))
+        done = self.webhook.synced_since('sw-core-01', alert_at)
+        self.assertEqual(done['owner'], 'sync_librenms')
+        self.assertIsNotNone(self.webhook.synced_since(42, alert_at))
+        # 同步在告警之前開始：不算數
+        self.assertIsNone(self.webhook.synced_since('sw-core-01', alert_at + 5))
+
+
+class TestRunLock(unittest.TestCase):
+
+    def test_second_holder_is_busy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with run_lock('full-sync', directory=tmp):
+                with self.assertRaises(RunLockBusy):
+                    with run_lock('full-sync', wait=0, directory=tmp):
+                        pass
+            with run_lock('full-sync', directory=tmp):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from scripts.event_store import EventStore
+
+
+class TestEventStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'events.db')
+        self.store = EventStore(self.path, max_attempts=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_concurrent_appends_are_all_committed(self):
+        """多執行緒同時寫入 (Group Commit) 每筆都取得唯一 ID。"""
+        ids = []
+        lock = threading.Lock()
+
+        def writer(n):
+            for i in range(50):
+                event_id = self.store.append(f"host{n}", {'seq': i})
+                with lock:
+                    ids.append(event_id)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(set(ids)), 400)
+        self.assertEqual(self.store.counts()['pending'], 400)
+
+    def test_unfinished_events_replayed_after_restart(self):
+        done = self.store.append('sw1', {'hostname': 'sw1'})
+        pending = self.store.append('sw2', {'hostname': 'sw2'})
+        self.store.mark_done([done])
+        self.store.close()
+
+        self.store = EventStore(self.path)
+        self.assertEqual([e['id'] for e in self.store.unfinished()], [pending])
+
+    def test_dead_letter_and_requeue(self):
+        event_id = self.store.append('sw1', {'hostname': 'sw1'})
+        self.assertEqual(self.store.mark_failed([event_id], 'timeout'), [event_id])
+        self.assertEqual(self.store.mark_failed([event_id], 'timeout'), [])
+        self.assertEqual(self.store.unfinished(), [])
+        self.assertEqual(self.store.dead()[0]['last_error'], 'timeout')
+
+        self.assertEqual(self.store.requeue(), 1)
+        self.assertEqual([e['hostname'] for e in self.store.unfinished()], ['sw1'])
+        self.assertEqual(self.store.counts()['dead'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from scripts.glpi_session import GlpiSessionManager
+
+with patch('utils.setup_logging', return_value=MagicMock()):
+    from scripts.sync_netbox_to_glpi import glpi_request
+
+
+def _resp(status=200, body=None):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.json.return_value = body or {}
+    if status >= 400:
+        resp.raise_for_status.side_effect = requests.exceptions.HTTPError(response=resp)
+    return resp
+
+
+class TestGlpiSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.tmp.name, 'glpi_session.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _manager(self, http, validate_interval=300):
+        return GlpiSessionManager('http://glpi/apirest.php', 'app', 'user', cache_file=self.cache,
+                                  validate_interval=validate_interval, http=http)
+
+    def test_token_reused_across_instances(self):
+        """第二個實例應直接沿用磁碟快取，不再呼叫 initSession。"""
+        http = MagicMock()
+        http.get.return_value = _resp(body={'session_token': 'tok-1'})
+        self.assertEqual(self._manager(http).get_token(), 'tok-1')
+        self.assertEqual(self._manager(http).get_token(), 'tok-1')
+        self.assertEqual(http.get.call_count, 1)
+
+    def test_expired_token_is_renewed(self):
+        """超過驗證間隔且 getActiveProfile 回傳 401 時，重新建立 Session。"""
+        http = MagicMock()
+        http.get.return_value = _resp(body={'session_token': 'tok-1'})
+        self._manager(http).get_token()
+
+        http.get.side_effect = [_resp(status=401), _resp(body={'session_token': 'tok-2'})]
+        self.assertEqual(self._manager(http, validate_interval=-1).get_token(), 'tok-2')
+        self.assertTrue(http.get.call_args_list[-2][0][0].endswith('/getActiveProfile'))
+
+    def test_unwritable_cache_falls_back_to_uncached_session(self):
+        """快取目錄無法建立時不拋出 OSError，改為本行程內的 Session。"""
+        blocker = os.path.join(self.tmp.name, 'not-a-dir')
+        open(blocker, 'w').close()
+        http = MagicMock()
+        http.get.return_value = _resp(body={'session_token': 'tok-1'})
+        glpi = GlpiSessionManager('http://glpi/apirest.php', 'app', 'user',
+                                  cache_file=os.path.join(blocker, 'glpi_session.json'), http=http)
+        self.assertEqual(glpi.get_token(), 'tok-1')
+        self.assertEqual(glpi.headers()['Session-Token'], 'tok-1')
+        glpi.invalidate()
+        http.get.return_value = _resp(body={'session_token': 'tok-2'})
+        self.assertEqual(glpi.get_token(), 'tok-2')
+
+    def test_request_renews_session_expired_mid_run(self):
+        """同步途中 Session 失效 (401)：重建 Session 後以新 Token 重試一次。"""
+        http = MagicMock()
+        http.get.side_effect = [_resp(body={'session_token': 'tok-1'}), _resp(body={'session_token': 'tok-2'})]
+        http.request.side_effect = [_resp(status=401), _resp(body={'id': 1})]
+        glpi = self._manager(http)
+        glpi.get_token()
+
+        resp = glpi_request(glpi, 'POST', 'http://glpi/apirest.php/Computer', {'input': {}}, http=http)
+        self.assertEqual(resp.json(), {'id': 1})
+        tokens = [c.kwargs['headers']['Session-Token'] for c in http.request.call_args_list]
+        self.assertEqual(tokens, ['tok-1', 'tok-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
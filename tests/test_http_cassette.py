@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import requests
+
+from scripts import http_cassette
+from scripts.http_cassette import Cassette, CassetteMiss
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        _Handler.hits += 1
+        if self.path.startswith('/raw'):
+            body = 'Hyper-V 虛擬網路'.encode('big5')  # 非 UTF-8 位元組
+        else:
+            body = json.dumps({'count': _Handler.hits, 'session_token': 'live-session-abc'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestHttpCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'run.jsonl.gz')
+
+    def tearDown(self):
+        http_cassette.uninstall()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_record_scrubs_and_replay_serves_in_order(self):
+        with patch.dict(os.environ, {'LIBRENMS_TOKEN': 'secret-librenms-token'}):
+            http_cassette.install(Cassette(self.path, 'record'))
+            http = requests.Session()
+            first = http.get(f"{self.base}/api/v0/devices?token=secret-librenms-token&b=2&a=1",
+                             headers={'X-Auth-Token': 'secret-librenms-token'}).json()
+            second = requests.get(f"{self.base}/api/v0/devices?a=1&b=2&token=x").json()
+            raw = requests.get(f"{self.base}/raw").content
+            http_cassette.uninstall()
+
+        with gzip.open(self.path, 'rt') as f:
+            recorded = f.read()
+        self.assertNotIn('secret-librenms-token', recorded)
+        self.assertNotIn('live-session-abc', recorded)
+
+        http_cassette.install(Cassette(self.path, 'replay', speed=0))
+        self.server.shutdown()  # 重播不連線
+        other_host = 'http://netbox.invalid'
+        self.assertEqual(requests.get(f"{other_host}/api/v0/devices?a=1&b=2&token=y").json()['count'], first['count'])
+        self.assertEqual(requests.get(f"{other_host}/api/v0/devices?b=2&a=1&token=z").json()['count'], second['count'])
+        # 用完後重複最後一筆
+        self.assertEqual(requests.get(f"{other_host}/api/v0/devices?a=1&b=2&token=q").json()['count'], second['count'])
+        self.assertEqual(requests.get(f"{other_host}/raw").content, raw)
+        with self.assertRaises(CassetteMiss):
+            requests.get(f"{other_host}/api/v0/ports")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import requests
+from requests.adapters import BaseAdapter
+
+from scripts import instrumentation
+from scripts.instrumentation import endpoint_template, PhaseTimer, API_SECONDS, API_ERRORS, PHASE_SECONDS
+
+
+class _StaticAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 404 if request.url.endswith('/missing') else 200
+        resp._content = b'{}'
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def tearDown(self):
+        instrumentation.uninstall()
+
+    def test_endpoint_template(self):
+        self.assertEqual(endpoint_template('https://nb.local/api/dcim/devices/42/?limit=50'),
+                         ('nb.local', '/api/dcim/devices/{id}/'))
+        self.assertEqual(endpoint_template('https://nms/api/v0/devices/sw-core-01.example.net/ports'),
+                         ('nms', '/api/v0/devices/{id}/ports'))
+        self.assertEqual(endpoint_template('https://glpi/apirest.php/search/Computer?criteria[0][field]=5'),
+                         ('glpi', '/apirest.php/search/Computer'))
+
+    def test_session_calls_and_phases_are_recorded(self):
+        instrumentation.install()
+        http = requests.Session()
+        http.mount('http://', _StaticAdapter())
+        before = API_SECONDS.snapshot().get(('unit.test', '/api/dcim/sites/{id}/', 'GET'), ([], 0))[0]
+        http.get('http://unit.test/api/dcim/sites/1/')
+        http.get('http://unit.test/api/dcim/sites/2/')
+        http.get('http://unit.test/api/missing')
+
+        counts, _ = API_SECONDS.snapshot()[('unit.test', '/api/dcim/sites/{id}/', 'GET')]
+        self.assertEqual(sum(counts) - sum(before), 2)
+        self.assertGreaterEqual(API_ERRORS.value(host='unit.test', endpoint='/api/missing', method='GET', status=404), 1)
+
+        timer = PhaseTimer('unit_a')
+        timer.next('unit_b')
+        timer.stop()
+        timer.stop()
+        phases = PHASE_SECONDS.snapshot()
+        self.assertEqual(sum(phases[('unit_a',)][0]), 1)
+        self.assertEqual(sum(phases[('unit_b',)][0]), 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = instrumentation.write_textfile(tmp, 'unit_sync', {'created': 3, 'dry_run': False})
+            with open(path) as f:
+                text = f.read()
+        self.assertIn('it_nexus_api_request_seconds_count{host="unit.test",endpoint="/api/dcim/sites/{id}/",'
+                      'method="GET",sync_source="unit_sync"}', text)
+        self.assertIn('it_nexus_sync_stat{stat="created",sync_source="unit_sync"} 3', text)
+        self.assertNotIn('dry_run', text)
+        self.assertEqual(os.path.basename(path), 'unit_sync.prom')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from scripts.interface_rules import classify, is_physical_interface, sanitize_string
+
+
+class TestInterfaceRules(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(classify('Port-channel1', 20_000_000_000), ('Port-channel1', True, 'lag'))
+        self.assertEqual(classify('Vlan10', 0), ('Vlan10', False, 'virtual'))
+        self.assertEqual(classify(' GigabitEthernet1/0/1 ', 1_000_000_000).type, '1000base-t')
+        self.assertEqual(classify('xe-0/1/0', 40_000_000_000).type, '40gbase-x-qsfpp')
+        self.assertEqual(classify('Loopback0', None), ('Loopback0', False, 'other'))
+
+    def test_skip_patterns_and_mojibake(self):
+        self.assertFalse(is_physical_interface('Null0'))
+        self.assertFalse(is_physical_interface('Ethernet0-WFP Native MAC Layer LightWeight Filter-0000'))
+        self.assertTrue(is_physical_interface('Ethernet0'))
+        self.assertEqual(sanitize_string('Hyper-V ?????A?Ӻ????????d #2'), 'Hyper-V Virtual Ethernet Adapter #2')
+        self.assertEqual(sanitize_string('Hyper-V vSwitch ?活??? #3-Microsoft NDIS Capture-0000'),
+                         'Hyper-V Virtual Switch #3-Microsoft NDIS Capture-0000')
+
+
+if __name__ == '__main__':
+    unittest.main()
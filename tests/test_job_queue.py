@@ -0,0 +1,59 @@
+import threading
+import time
+import unittest
+
+from scripts.job_queue import CoalescingJobQueue, SUCCEEDED, FAILED
+
+
+class TestCoalescingJobQueue(unittest.TestCase):
+
+    def test_pending_jobs_for_same_host_are_coalesced(self):
+        """同主機尚未開始的工作合併；執行中的主機不會被並行同步。"""
+        release = threading.Event()
+        runs = []
+
+        def runner(hostname):
+            runs.append(hostname)
+            release.wait(2)
+            return True, 'ok'
+
+        jobs = CoalescingJobQueue(runner, workers=2)
+        jobs.start()
+        first, _ = jobs.submit('sw1')
+        time.sleep(0.1)  # 等待第一個工作開始執行
+        second, coalesced_2 = jobs.submit('sw1')
+        third, coalesced_3 = jobs.submit('SW1')
+        time.sleep(0.1)
+
+        self.assertFalse(coalesced_2)
+        self.assertTrue(coalesced_3)
+        self.assertEqual(second.id, third.id)
+        self.assertEqual(runs, ['sw1'])  # 第二個工作等待第一個完成
+
+        release.set()
+        jobs.stop()
+        self.assertEqual(runs, ['sw1', 'sw1'])
+        self.assertEqual(jobs.get(second.id).state, SUCCEEDED)
+        self.assertEqual(jobs.get(second.id).coalesced, 1)
+
+    def test_debounce_window_flushes_one_batch(self):
+        """視窗內的多台主機合併為一個批次；重複主機只同步一次。"""
+        batches = []
+
+        def batch_runner(hostnames, since):
+            batches.append(list(hostnames))
+            self.assertEqual(set(since), set(hostnames))
+            return {h: (h != 'sw3', 'ok') for h in hostnames}
+
+        jobs = CoalescingJobQueue(None, workers=2, batch_runner=batch_runner, batch_window=0.2)
+        jobs.start()
+        submitted = [jobs.submit(h)[0] for h in ('sw1', 'sw2', 'SW1', 'sw3')]
+        jobs.stop()
+
+        self.assertEqual(batches, [['sw1', 'sw2', 'sw3']])
+        self.assertIs(submitted[0], submitted[2])
+        self.assertEqual([j.state for j in submitted], [SUCCEEDED, SUCCEEDED, SUCCEEDED, FAILED])
+
+
+if __name__ == '__main__':
+    unittest.main()
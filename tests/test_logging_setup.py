@@ -0,0 +1,51 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from scripts import utils
+
+
+class TestQueuedLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        utils.stop_logging()
+        logging.getLogger().setLevel(self.root_level)
+        self.tmp.cleanup()
+
+    def _setup(self, **env):
+        with patch.dict(os.environ, dict(env, IT_NEXUS_LOG_DIR=self.tmp.name)):
+            utils.setup_logging('/var/log/it_nexus/unit.log', stdout=False)
+        return os.path.join(self.tmp.name, 'unit.log')
+
+    def test_records_are_written_by_background_listener(self):
+        path = self._setup(LOG_LEVEL='INFO')
+        log = logging.getLogger('unit.plain')
+        log.debug("port %s", 'Gi0/1')
+        log.info("port %s updated", 'Gi0/2')
+        # 第二次呼叫 (例如管線匯入其他同步模組) 不會重複加入 Handler
+        utils.setup_logging('/var/log/it_nexus/other.log')
+        utils.stop_logging()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith(' - INFO - port Gi0/2 updated'))
+
+    def test_json_format_includes_extra_fields(self):
+        path = self._setup(LOG_FORMAT='json', LOG_LEVEL='DEBUG')
+        logging.getLogger('unit.json').debug("同步 %s", 'sw-01', extra={'device': 'sw-01'})
+        utils.stop_logging()
+        with open(path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual((entry['level'], entry['logger'], entry['message'], entry['device']),
+                         ('DEBUG', 'unit.json', '同步 sw-01', 'sw-01'))
+
+
+if __name__ == '__main__':
+    unittest.main()
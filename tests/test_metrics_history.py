@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from scripts.metrics_history import MetricsHistory, percentile, run_failed
+
+HOUR = 3600
+NOW = 1_790_000_000.0
+
+
+class TestMetricsHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = MetricsHistory(os.path.join(self.tmp.name, 'history.db'))
+
+    def tearDown(self):
+        self.history.close()
+        self.tmp.cleanup()
+
+    def test_percentile_and_failure(self):
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertIsNone(percentile([], 95))
+        self.assertTrue(run_failed({'created': 1, 'failed': 2}))
+        self.assertFalse(run_failed({'errors': 0}))
+        self.assertTrue(run_failed({'stages': {'librenms': {'status': 'ok', 'stats': {}},
+                                               'glpi': {'status': 'ok', 'stats': {'failed': 1}}}}))
+
+    def test_rollups_accumulate_per_hour_and_day(self):
+        for i, duration in enumerate((10.0, 20.0, 30.0)):
+            self.history.record('librenms_to_netbox', {'failed': int(i == 2)}, duration,
+                                requests=100, api_errors=i, ts=NOW + i * 60)
+        self.history.record('netbox_to_glpi', {'failed': 0}, 5.0, ts=NOW)
+
+        hourly = [r for r in self.history.rollups('hour') if r['source'] == 'librenms_to_netbox']
+        daily = [r for r in self.history.rollups('day') if r['source'] == 'librenms_to_netbox']
+        self.assertEqual(sum(r['runs'] for r in hourly), 3)
+        self.assertEqual(len(daily), 1)
+        self.assertEqual((daily[0]['runs'], daily[0]['failed_runs'], daily[0]['duration_sum']), (3, 1, 60.0))
+        self.assertEqual((daily[0]['duration_min'], daily[0]['duration_max']), (10.0, 30.0))
+        self.assertEqual((daily[0]['requests'], daily[0]['api_errors']), (300, 3))
+
+        summary = self.history.summary()
+        self.assertEqual(summary['librenms_to_netbox']['p50'], 20.0)
+        self.assertEqual(summary['netbox_to_glpi']['runs'], 1)
+
+    def test_regressions_compare_recent_with_baseline(self):
+        for i in range(20):
+            ts = NOW - 3 * 86400 + i * HOUR
+            self.history.record('librenms_to_netbox', {}, 60.0 + i % 3, requests=500, ts=ts)
+            self.history.record('netbox_to_glpi', {}, 20.0, requests=50, ts=ts)
+        for i in range(4):
+            ts = NOW - 4 * HOUR + i * HOUR
+            self.history.record('librenms_to_netbox', {}, 150.0, requests=510, ts=ts)
+            self.history.record('netbox_to_glpi', {}, 21.0, requests=50, ts=ts)
+
+        found = self.history.regressions(hours=24, baseline_days=7, threshold=1.5, now=NOW)
+        self.assertEqual({(f['source'], f['metric']) for f in found},
+                         {('librenms_to_netbox', 'p50'), ('librenms_to_netbox', 'p95')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from scripts.metrics_registry import Registry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_render_prometheus_text(self):
+        registry = Registry()
+        jobs = registry.counter('sync_jobs_total', 'Jobs', ['result'])
+        latency = registry.histogram('sync_latency_seconds', 'Latency', buckets=(1, 5))
+        registry.gauge('queue_depth', 'Depth', func=lambda: 3)
+
+        jobs.inc(result='succeeded')
+        jobs.inc(2, result='failed')
+        for value in (0.5, 2, 10):
+            latency.observe(value)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE sync_jobs_total counter', lines)
+        self.assertIn('sync_jobs_total{result="failed"} 2', lines)
+        self.assertIn('sync_latency_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('sync_latency_seconds_bucket{le="5"} 2', lines)
+        self.assertIn('sync_latency_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('sync_latency_seconds_sum 12.5', lines)
+        self.assertIn('sync_latency_seconds_count 3', lines)
+        self.assertIn('queue_depth 3', lines)
+
+    def test_labels_must_match(self):
+        counter = Registry().counter('events_total', 'Events', ['result'])
+        with self.assertRaises(ValueError):
+            counter.inc(state='x')
+
+
+if __name__ == '__main__':
+    unittest.main()
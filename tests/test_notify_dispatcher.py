@@ -0,0 +1,142 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from scripts import notify_dispatcher as nd
+
+CHANNEL = 'https://hooks.example.test/it-nexus'
+
+
+class SendRecorder:
+    """send() 替身：記錄每則送出的訊息，可指定前幾次失敗。"""
+
+    def __init__(self, failures=0):
+        self.calls, self.failures = [], failures
+
+    def __call__(self, http, channel, title, message, status, timeout=nd.SEND_TIMEOUT):
+        if self.failures:
+            self.failures -= 1
+            raise requests.exceptions.ConnectionError('boom')
+        self.calls.append((time.time(), channel, title, message, status))
+
+
+class TestNotifyDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'outbox.db')
+        self.outbox = nd.Outbox(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def pending(self, outbox=None):
+        return (outbox or self.outbox)._run("SELECT * FROM outbox WHERE state = 'pending'")
+
+    def test_due_rows_are_batched_into_one_digest(self):
+        for i, title in enumerate(('Device Down sw1', 'Device Down sw2', 'Recovery: Device Down sw1')):
+            self.outbox.add([CHANNEL], title, f'msg {i}', nd.classify(title))
+        recorder = SendRecorder()
+        with patch.object(nd, 'send', recorder):
+            self.assertEqual(nd.drain(self.outbox), 3)
+        self.assertEqual(len(recorder.calls), 1)
+        _, _, title, message, status = recorder.calls[0]
+        self.assertIn('3 則通知', title)
+        self.assertEqual(status, 'error')
+        self.assertEqual(message.count('\n'), 2)
+        self.assertEqual(self.pending(), [])
+
+    def test_rate_limit_defers_second_send(self):
+        self.assertEqual(self.outbox.reserve_send(CHANNEL, 60), 0)
+        self.outbox.add([CHANNEL], 'Device Down sw1', '', 'error')
+        sent, wait = nd.dispatch_due(self.outbox, CHANNEL, None, 60)
+        self.assertEqual(sent, 0)
+        self.assertGreater(wait, 55)
+        self.assertEqual(len(self.pending()), 1)
+
+    def test_enqueue_without_dispatcher_waits_for_rate_limited_rows(self):
+        """無常駐派送時，限速中的最後一則 (恢復通知) 仍由呼叫端等待送出，不滯留 Outbox。"""
+        recorder = SendRecorder()
+        with patch.object(nd, 'send', recorder), patch.object(nd, 'RATE_PER_MIN', 600), \
+                patch.object(nd, 'DRAIN_TIMEOUT', 5):
+            nd.enqueue('Device Down sw1', 'down', channels=[CHANNEL], outbox=self.outbox)
+            nd.enqueue('Recovery: Device Down sw1', 'up', channels=[CHANNEL], outbox=self.outbox)
+        self.assertEqual([c[2] for c in recorder.calls], ['Device Down sw1', 'Recovery: Device Down sw1'])
+        self.assertGreaterEqual(recorder.calls[1][0] - recorder.calls[0][0], 0.09)
+        self.assertEqual(self.pending(), [])
+
+    def test_failed_send_backs_off_then_dies(self):
+        self.outbox.add([CHANNEL], 'Device Down sw1', '', 'error')
+        with patch.object(nd, 'send', SendRecorder(failures=1)):
+            self.assertEqual(nd.dispatch_due(self.outbox, CHANNEL, None, 0), (0, 0))
+        row = self.pending()[0]
+        self.assertEqual(row['attempts'], 1)
+        self.assertGreater(row['next_attempt_at'], time.time())
+        self.assertIn('boom', row['last_error'])
+
+        # Backoff 到期後重試成功
+        self.outbox._run("UPDATE outbox SET next_attempt_at = 0")
+        recorder = SendRecorder()
+        with patch.object(nd, 'send', recorder):
+            self.assertEqual(nd.dispatch_due(self.outbox, CHANNEL, None, 0), (1, 0))
+        self.assertEqual(len(recorder.calls), 1)
+
+        # 超過上限標記為 dead，不再派送
+        self.outbox.add([CHANNEL], 'Device Down sw2', '', 'error')
+        self.outbox._run("UPDATE outbox SET attempts = ?", (nd.MAX_ATTEMPTS - 1,))
+        with patch.object(nd, 'send', SendRecorder(failures=1)):
+            nd.dispatch_due(self.outbox, CHANNEL, None, 0)
+        self.assertEqual(self.pending(), [])
+        self.assertIsNone(self.outbox.next_attempt(CHANNEL))
+
+    def test_im_outage_does_not_block_caller(self):
+        """IM 故障時不等待重試 Backoff：呼叫端只花一次發送的時間，通知留在 Outbox 待重試。"""
+        started = time.monotonic()
+        with patch.object(nd, 'send', SendRecorder(failures=1)), patch.object(nd, 'DRAIN_TIMEOUT', 60):
+            self.assertEqual(nd.enqueue('Device Down sw1', 'down', channels=[CHANNEL], outbox=self.outbox), 0)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(self.pending()[0]['attempts'], 1)
+
+    def test_unusable_outbox_falls_back_to_direct_send(self):
+        """Outbox 目錄無法建立 (或無寫入權限)：記錄警告並逐一直接發送，不遺失通知。"""
+        blocker = os.path.join(self.tmp.name, 'not-a-dir')
+        open(blocker, 'w').close()
+        recorder = SendRecorder()
+        other = 'https://hooks.example.test/other'
+        with patch.dict(os.environ, {'NOTIFY_OUTBOX_DB': os.path.join(blocker, 'outbox.db')}), \
+                patch.object(nd, 'send', recorder), self.assertLogs(nd.logger, 'WARNING'):
+            self.assertEqual(nd.enqueue('Device Down sw1', 'down', channels=[CHANNEL, other]), 2)
+        self.assertEqual([c[1] for c in recorder.calls], [CHANNEL, other])
+
+        with patch.dict(os.environ, {'NOTIFY_OUTBOX_DB': os.path.join(blocker, 'outbox.db')}), \
+                patch.object(nd, 'send', SendRecorder(failures=1)), self.assertLogs(nd.logger, 'WARNING'), \
+                self.assertRaises(requests.exceptions.ConnectionError):
+            nd.enqueue('Device Down sw1', 'down', channels=[CHANNEL])
+
+    def test_alert_transport_caps_drain_wait(self):
+        from scripts import librenms_alert_notify as transport
+        with patch.object(transport, 'IM_WEBHOOK_URL', CHANNEL), \
+                patch.object(transport, 'DRAIN_TIMEOUT', 60), patch.object(transport, 'enqueue', return_value=1) as enqueue:
+            transport.send_notification('Device Down sw1', 'down')
+        self.assertEqual(enqueue.call_args.kwargs['timeout'], nd.SEND_TIMEOUT)
+
+    def test_outbox_survives_restart(self):
+        """寫入 Outbox 後行程結束 (未派送)，重新開啟仍可送出。"""
+        with patch.object(nd.Outbox, 'dispatcher_alive', return_value=True):
+            nd.enqueue('Device Down sw1', 'down', channels=[CHANNEL], outbox=self.outbox)
+        del self.outbox
+
+        reopened = nd.Outbox(self.path)
+        self.assertEqual(reopened.channels(), [CHANNEL])
+        recorder = SendRecorder()
+        with patch.object(nd, 'send', recorder):
+            self.assertEqual(nd.drain(reopened), 1)
+        self.assertEqual(recorder.calls[0][2], 'Device Down sw1')
+
+
+if __name__ == '__main__':
+    unittest.main()
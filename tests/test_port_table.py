@@ -0,0 +1,94 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'bench'))
+import corpus  # noqa: E402
+
+from scripts.interface_rules import map_interface_type, is_physical_interface  # noqa: E402
+from scripts.port_table import HAVE_NUMPY, PortTable, diff, normalize_mac  # noqa: E402
+
+
+def fleet(devices=40, ports_per_device=12):
+    """corpus 語料加上 device_id；NetBox 端由 LibreNMS 表變造 (改欄位、缺介面、多介面)。"""
+    ports = corpus.ports(devices, ports_per_device)
+    per_device = len(ports) // devices
+    for i, p in enumerate(ports):
+        p['device_id'] = 1000 + i // per_device
+        p['ifAdminStatus'] = 'up' if i % 3 else 'down'
+        p['ifMtu'] = 1500 if i % 4 else None
+    device_ids = {1000 + d: d + 1 for d in range(devices - 1)}    # 最後一台不在 NetBox
+
+    rows = PortTable.from_librenms(ports, device_ids, vectorized=False)
+    interfaces = []
+    for i, row in enumerate(rows.rows(range(len(rows)))):
+        if i % 11 == 0:
+            continue                                    # -> create
+        iface = {'id': 5000 + i, 'device': {'id': row['device']}, 'name': row['name'],
+                 'type': {'value': row['type']}, 'enabled': row['enabled'], 'mtu': row['mtu'],
+                 'description': row['description'],
+                 'primary_mac_address': {'mac_address': row['mac']} if row['mac'] else None}
+        if i % 7 == 0:
+            iface['mtu'] = 9000                         # -> update
+        if i % 13 == 0:
+            iface['primary_mac_address'] = None
+        interfaces.append(iface)
+    interfaces.append({'id': 1, 'device': {'id': 1}, 'name': 'Management', 'type': {'value': 'virtual'},
+                       'enabled': True, 'mtu': None, 'description': ''})      # -> delete
+    interfaces.append({'id': 2, 'device': {'id': 999}, 'name': 'eth0', 'type': {'value': 'other'},
+                       'enabled': True, 'mtu': None, 'description': ''})      # 不在範圍：保留
+    return ports, device_ids, interfaces
+
+
+class TestPortTable(unittest.TestCase):
+
+    def test_librenms_columns_follow_interface_rules(self):
+        ports, device_ids, _ = fleet()
+        table = PortTable.from_librenms(ports, device_ids, vectorized=False)
+        expected = [p for p in ports if p['device_id'] in device_ids and is_physical_interface(p['ifName'])]
+        self.assertEqual(len(table), len(expected))
+        for i, p in enumerate(expected):
+            self.assertEqual(table['name'][i], p['ifName'].strip()[:64])
+            self.assertEqual(table['type'][i], map_interface_type(p['ifName'].strip(), p['ifSpeed']))
+        self.assertEqual(normalize_mac('001e.f609.b601'), '00:1E:F6:09:B6:01')
+        self.assertIsNone(normalize_mac('zz1ef609b601'))
+
+    def test_diff_change_set(self):
+        ports = [
+            {'device_id': 7, 'ifName': 'Gi1/0/1', 'ifSpeed': 1000000000, 'ifAdminStatus': 'up',
+             'ifMtu': 1500, 'ifAlias': 'AP-01', 'ifPhysAddress': '001ef609b601'},
+            {'device_id': 7, 'ifName': 'Gi1/0/2', 'ifSpeed': 1000000000, 'ifAdminStatus': 'down'},
+            {'device_id': 7, 'ifName': 'Gi1/0/2 ', 'ifSpeed': 10000000},      # 重複名稱：取第一筆
+            {'device_id': 7, 'ifName': 'Vlan10'},                             # 非實體介面
+            {'device_id': 8, 'ifName': 'eth0'},                               # 不在 NetBox
+        ]
+        interfaces = [
+            {'id': 1, 'device': {'id': 70}, 'name': 'Gi1/0/1', 'type': {'value': '1000base-t'},
+             'enabled': True, 'mtu': 1500, 'description': 'old', 'mac_address': '00:1e:f6:09:b6:01'},
+            {'id': 2, 'device': {'id': 70}, 'name': 'Vlan10', 'type': {'value': 'virtual'},
+             'enabled': True, 'mtu': None, 'description': ''},
+        ]
+        for vectorized in (False, True) if HAVE_NUMPY else (False,):
+            changes = diff(PortTable.from_librenms(ports, {7: 70}, vectorized),
+                           PortTable.from_netbox(interfaces, vectorized))
+            self.assertEqual(changes['update'], [{'id': 1, 'device': 70, 'name': 'Gi1/0/1',
+                                                  'changes': {'description': ['old', 'AP-01']}}])
+            self.assertEqual(changes['create'], [{'device': 70, 'name': 'Gi1/0/2', 'type': '1000base-t',
+                                                  'enabled': False, 'mtu': None, 'description': '', 'mac': None}])
+            self.assertEqual(changes['delete'], [{'id': 2, 'device': 70, 'name': 'Vlan10'}])
+            self.assertEqual(changes['stats']['unchanged'], 0)
+
+    @unittest.skipUnless(HAVE_NUMPY or os.getenv('IT_NEXUS_REQUIRE_NUMPY'), "未安裝 NumPy")
+    def test_numpy_matches_python(self):
+        # CI (requirements-dev.txt) 設定 IT_NEXUS_REQUIRE_NUMPY=1：NumPy 路徑不可被略過
+        self.assertTrue(HAVE_NUMPY, "IT_NEXUS_REQUIRE_NUMPY=1 但未安裝 NumPy")
+        ports, device_ids, interfaces = fleet()
+        expected = diff(PortTable.from_librenms(ports, device_ids, False), PortTable.from_netbox(interfaces, False))
+        actual = diff(PortTable.from_librenms(ports, device_ids, True), PortTable.from_netbox(interfaces, True))
+        self.assertEqual(actual, expected)
+        self.assertTrue(all(expected['stats'][k] for k in ('create', 'update', 'delete', 'unchanged')))
+        self.assertNotIn(2, [d['id'] for d in expected['delete']])
+
+
+if __name__ == '__main__':
+    unittest.main()
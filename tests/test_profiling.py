@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from scripts import profiling
+from scripts.profiling import Profiler, resolve_mode
+
+
+def busy_sanitize(n):
+    deadline = time.monotonic() + n
+    text = ''
+    while time.monotonic() < deadline:
+        text = ''.join(reversed('Hyper-V Network Adapter' * 20))
+    return text
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_resolve_mode(self):
+        with patch.dict(os.environ, {'IT_NEXUS_PROFILE': 'true'}):
+            self.assertEqual(resolve_mode(), 'cpu')
+            self.assertEqual(resolve_mode('sample'), 'sample')
+        with patch.dict(os.environ, {'IT_NEXUS_PROFILE': ''}):
+            self.assertIsNone(resolve_mode())
+        with patch.dict(os.environ, {'IT_NEXUS_PROFILE': 'perf'}):
+            with self.assertRaises(ValueError):
+                resolve_mode()
+
+    def test_artifacts_and_summary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode, artifact in (('cpu', '.prof'), ('sample', '.folded')):
+                profiler = Profiler('unit', mode, directory=tmp).start()
+                busy_sanitize(0.2)
+                summary = profiler.stop()
+                self.assertIsNone(profiler.stop())  # atexit 重複呼叫
+                with open(summary) as f:
+                    text = f.read()
+                self.assertIn('busy_sanitize', text)
+                self.assertIn('記憶體配置', text)
+                self.assertTrue(os.path.exists(profiler.prefix + artifact))
+                self.assertTrue(os.path.exists(profiler.prefix + '.tracemalloc'))
+            with open(profiler.prefix + '.folded') as f:
+                self.assertTrue(any('busy_sanitize' in line for line in f))
+
+    def test_disabled_without_flag(self):
+        with patch.dict(os.environ, {'IT_NEXUS_PROFILE': ''}):
+            self.assertIsNone(profiling.start_profile(None, 'unit'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+with patch('utils.setup_logging', return_value=MagicMock()):
+    from scripts.sync_pipeline import (Stage, PipelineContext, order_stages, run_pipeline,
+                                       full_run_due, record_full_run)
+
+
+class TestSyncPipeline(unittest.TestCase):
+
+    def make_ctx(self, full=False):
+        return PipelineContext(MagicMock(leases=None), full=full)
+
+    def test_changed_devices_flow_downstream(self):
+        seen = {}
+
+        def upstream(ctx):
+            ctx.changed = {'sw-core-01': 1, 'srv-web-01': 7}
+            return {'failed': 0}
+
+        def downstream(ctx):
+            seen['names'] = ctx.target_names()
+            return {}
+
+        stages = [Stage('glpi', downstream, requires=('librenms',)), Stage('librenms', upstream)]
+        results = run_pipeline(self.make_ctx(), stages)
+        self.assertEqual(list(results), ['librenms', 'glpi'])
+        self.assertEqual(seen['names'], {'sw-core-01', 'srv-web-01'})
+
+        run_pipeline(self.make_ctx(full=True), stages)
+        self.assertIsNone(seen['names'])
+
+    def test_failed_stage_skips_dependents_only(self):
+        def boom(ctx):
+            raise RuntimeError('LibreNMS down')
+
+        ran = []
+        stages = [
+            Stage('librenms', boom),
+            Stage('interfaces', lambda ctx: ran.append('interfaces'), requires=('librenms',)),
+            Stage('report', lambda ctx: ran.append('report')),
+        ]
+        results = run_pipeline(self.make_ctx(), stages)
+        self.assertEqual(results['librenms']['status'], 'failed')
+        self.assertEqual(results['interfaces']['status'], 'skipped')
+        self.assertEqual(ran, ['report'])
+
+    def test_selected_stage_pulls_in_upstream(self):
+        stages = [Stage('a', None), Stage('b', None, requires=('a',)), Stage('c', None, requires=('a',))]
+        self.assertEqual([s.name for s in order_stages(stages, only=['c'])], ['a', 'c'])
+        with self.assertRaises(ValueError):
+            order_stages([Stage('x', None, requires=('y',)), Stage('y', None, requires=('x',))])
+
+
+    def test_periodic_full_run(self):
+        """從未全量執行或超過間隔時需全量校正；記錄後於間隔內維持增量。"""
+        with tempfile.TemporaryDirectory() as tmp:
+            state = os.path.join(tmp, 'state.json')
+            self.assertTrue(full_run_due(state, interval=3600, now=1000))
+            record_full_run(state, now=1000)
+            self.assertFalse(full_run_due(state, interval=3600, now=4000))
+            self.assertTrue(full_run_due(state, interval=3600, now=4600))
+            self.assertFalse(full_run_due(state, interval=0, now=10 ** 9))
+            # 目錄不可寫入：只記錄警告
+            record_full_run(os.path.join(tmp, 'missing', 'state.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
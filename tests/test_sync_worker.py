@@ -0,0 +1,136 @@
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+with patch('utils.setup_logging', return_value=MagicMock()):
+    from scripts.sync_librenms_to_netbox import LibreNMSSyncer, match_devices
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(response=self)
+
+    def json(self):
+        return self._data
+
+
+class FakeLibreNMS:
+    """記錄呼叫路徑的假 LibreNMS API (/devices 與 /devices/{hostname|id})。"""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.headers = {}
+        self.paths = []
+
+    def request(self, method, url, **kwargs):
+        path = url.split('/api/v0', 1)[1]
+        self.paths.append(path)
+        if path == '/devices':
+            return FakeResponse({'devices': list(self.devices)})
+        key = path.rsplit('/', 1)[1]
+        for d in self.devices:
+            if key in (str(d['device_id']), d['hostname']):
+                return FakeResponse({'devices': [d]})
+        return FakeResponse({'status': 'error'}, status_code=404)
+
+
+DEVICES = [
+    {'device_id': 1, 'hostname': 'core-sw1.example.com', 'sysName': 'core-sw1'},
+    {'device_id': 2, 'hostname': 'core-sw10.example.com', 'sysName': 'core-sw10'},
+]
+
+
+class TestSyncWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.http = FakeLibreNMS(DEVICES)
+        self.syncer = LibreNMSSyncer(MagicMock(), 'http://librenms/api/v0', 'token', http=self.http)
+
+    def test_match_devices_prefers_exact(self):
+        self.assertEqual([d['device_id'] for d in match_devices(DEVICES, 'core-sw1')], [1])
+        self.assertEqual([d['device_id'] for d in match_devices(DEVICES, '2')], [2])
+        self.assertEqual(len(match_devices(DEVICES, 'core-sw')), 2)
+
+    def test_direct_fetch_skips_device_list(self):
+        """以 hostname / id 指定時直接查詢單一設備，不下載整份清單。"""
+        self.assertEqual(self.syncer.find_devices('core-sw1.example.com')[0]['device_id'], 1)
+        self.assertEqual(self.syncer.find_devices('2')[0]['device_id'], 2)
+        self.assertNotIn('/devices', self.http.paths)
+
+    def test_sysname_resolved_via_cached_index(self):
+        self.assertEqual(self.syncer.find_devices('core-sw10')[0]['device_id'], 2)
+        self.assertEqual(self.syncer.find_devices('core-sw1')[0]['device_id'], 1)
+        self.assertEqual(self.http.paths.count('/devices'), 1)
+        self.assertEqual(self.http.paths[-1], '/devices/1')
+
+    def test_index_refreshed_for_new_device(self):
+        self.syncer.devices()
+        self.syncer._devices_at -= self.syncer.index_min_age    # 對照表已建立一段時間
+        self.http.devices.append({'device_id': 3, 'hostname': '192.0.2.30', 'sysName': 'new-ap1'})
+        self.assertEqual(self.syncer.find_devices('new-ap1')[0]['device_id'], 3)
+        self.assertEqual(self.http.paths.count('/devices'), 2)
+
+    def test_unknown_host_downloads_device_list_once(self):
+        """冷啟動查詢未知主機 (打錯字) 只下載一次清單，剛建立的對照表不重建。"""
+        self.assertIsNone(self.syncer.fetch_device('core-sw1.exmaple.com'))
+        self.assertIsNone(self.syncer.fetch_device('core-sw1.exmaple.com'))
+        self.assertEqual(self.http.paths.count('/devices'), 1)
+
+    def test_partial_match_fallback(self):
+        self.assertEqual(len(self.syncer.find_devices('core-sw')), 2)
+
+    def test_batch_sync_shares_lookups(self):
+        """批次中解析到同一台設備的 hostname 只同步一次。"""
+        synced = []
+        self.syncer.sync_device = lambda dev, stats: synced.append(dev['device_id'])
+        results = self.syncer.sync_hostnames(['core-sw1', 'core-sw1.example.com', 'missing'])
+        self.assertEqual(synced, [1])
+        self.assertTrue(results['core-sw1'][0])
+        self.assertFalse(results['missing'][0])
+
+    def test_concurrent_batches_keep_their_run_id(self):
+        """Webhook 的兩個 Worker 共用 Syncer：重疊的批次各自以自己的 run_id 寫入事件流。"""
+        appended = []
+        self.syncer.feed = MagicMock()
+        self.syncer.feed.append.side_effect = lambda events, run_id, source: appended.append(
+            (events[0]['device'], run_id))
+        overlap = threading.Barrier(2, timeout=5)
+
+        def sync_device(dev, stats):
+            overlap.wait()                              # 兩個批次都已開始
+            self.syncer._emit([{'device': dev['hostname']}])
+
+        self.syncer.sync_device = sync_device
+        threads = [threading.Thread(target=self.syncer.sync_hostnames, args=([host],))
+                   for host in ('core-sw1.example.com', 'core-sw10.example.com')]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        run_ids = dict(appended)
+        self.assertEqual(len(run_ids), 2)
+        self.assertNotEqual(run_ids['core-sw1.example.com'], run_ids['core-sw10.example.com'])
+        self.assertNotIn(self.syncer.run_id, run_ids.values())
+        self.assertEqual(self.syncer.current_run_id(), self.syncer.run_id)
+
+    def test_reference_cache(self):
+        nb = self.syncer.nb
+        nb.dcim.device_roles.get.return_value = MagicMock(id=7)
+        self.syncer.ensure_role('switch')
+        self.syncer.ensure_role('switch')
+        self.assertEqual(nb.dcim.device_roles.get.call_count, 1)
+
+        self.syncer.invalidate_refs()
+        self.syncer.ensure_role('switch')
+        self.assertEqual(nb.dcim.device_roles.get.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
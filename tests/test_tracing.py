@@ -0,0 +1,85 @@
+import glob
+import json
+import tempfile
+import unittest
+
+from scripts import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.stop_tracing()
+
+    def test_disabled_is_noop(self):
+        tracing.stop_tracing()
+        self.assertIs(tracing.span('x'), tracing._NOOP)
+        with tracing.span('x') as s:
+            s.set(result='ok')
+        tracing.complete('x', 0.0, 1.0)
+        tracing.flow('job', True)
+
+    def test_nested_spans_and_flow(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tracer = tracing.start_tracing(True, 'unit', directory=tmp)
+
+            @tracing.traced()
+            def get_or_create_site():
+                with tracing.span('inner', device='sw-01'):
+                    pass
+
+            with tracing.trace('sync_job', 'job42', cat='webhook', hostname='sw-01'):
+                tracing.flow('job42', False)
+                get_or_create_site()
+            with self.assertRaises(RuntimeError):
+                with tracing.span('boom'):
+                    raise RuntimeError('fail')
+
+            tracing.stop_tracing()
+            with open(tracer.paths[0]) as f:
+                events = json.load(f)
+
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        self.assertEqual(spans['inner']['args'], {'device': 'sw-01', 'trace_id': 'job42'})
+        self.assertEqual(spans['get_or_create_site']['args']['trace_id'], 'job42')
+        self.assertEqual(spans['sync_job']['args']['hostname'], 'sw-01')
+        # trace() 結束後回到 Run ID
+        self.assertEqual(spans['boom']['args']['trace_id'], tracer.run_id)
+        self.assertIn('RuntimeError', spans['boom']['args']['error'])
+
+        outer, inner = spans['sync_job'], spans['inner']
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertTrue(any(e['ph'] == 'f' and e['id'] == 'job42' for e in events))
+        self.assertTrue(any(e['ph'] == 'M' and e['name'] == 'thread_name' for e in events))
+
+    def test_truncated_file_is_recoverable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tracer = tracing.start_tracing(True, 'unit', directory=tmp)
+            with tracing.span('step'):
+                pass
+            tracer._file.flush()
+            with open(tracer.paths[0]) as f:
+                text = f.read()
+            tracing.stop_tracing()
+        # 行程中斷：檔尾為 ",\n" 且缺少 ]
+        self.assertTrue(text.endswith(',\n'))
+        events = json.loads(text.rstrip().rstrip(',') + ']')
+        self.assertIn('step', [e['name'] for e in events])
+
+    def test_rotation_keeps_recent_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tracer = tracing.Tracer('unit', tmp, max_bytes=200, keep=2)
+            for i in range(20):
+                tracer.emit({'name': f'e{i}', 'ph': 'i', 'ts': i})
+            tracer.close()
+            self.assertGreater(len(tracer.paths), 2)
+            remaining = glob.glob(f"{tmp}/unit-*.trace.json")
+            self.assertLessEqual(len(remaining), 2)
+            for path in remaining:
+                with open(path) as f:
+                    json.load(f)
+
+
+if __name__ == '__main__':
+    unittest.main()
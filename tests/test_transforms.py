@@ -0,0 +1,67 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'bench'))
+import transform_bench  # noqa: E402
+
+MAC = re.compile(r'^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$')
+INTERFACE_TYPES = {'lag', '100gbase-x-qsfp28', '40gbase-x-qsfpp', '25gbase-x-sfp28',
+                   '10gbase-t', '1000base-t', '100base-tx', 'other'}
+
+
+class TestTransformsOnCorpus(unittest.TestCase):
+    """在 Benchmark 同一份語料上驗證轉換函式的輸出 (改寫效能時不得改變結果)。"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.funcs = transform_bench.load_functions()
+        cls.inputs = transform_bench.build_inputs(*transform_bench.DIGEST_SCALE)
+        cls.baselines = transform_bench.load_baselines()
+
+    def test_outputs_match_recorded_digests(self):
+        self.assertEqual(transform_bench.digests(self.funcs), self.baselines['digests'])
+
+    def test_invariants(self):
+        f = self.funcs
+        for (text,) in self.inputs['sanitize_string']:
+            out = f['sanitize_string'](text)
+            if out:
+                self.assertTrue(out.isprintable(), repr(out))
+                self.assertFalse('Hyper-V' in out and out.count('?') > 2, out)
+
+        for (raw,) in self.inputs['format_mac.netbox']:
+            nb, ifs = f['format_mac.netbox'](raw), f['format_mac.interfaces'](raw)
+            if ifs is not None:
+                self.assertRegex(ifs, MAC)
+            # 兩份實作對合法 MAC 的結果一致 (interfaces 版不轉大寫)
+            if ifs and nb and MAC.match(nb):
+                self.assertEqual(nb, ifs.upper())
+
+        for (name, speed) in self.inputs['map_interface_type']:
+            self.assertIn(f['map_interface_type'](name, speed), INTERFACE_TYPES)
+            if f['is_physical_interface'](name):
+                self.assertNotIn('Hyper-V', name)
+
+        for (dev,) in self.inputs['get_role_slug']:
+            self.assertIn(f['get_role_slug'](dev), sys.modules['sync_librenms_to_netbox'].ROLE_DEFS)
+            self.assertTrue(f['get_manufacturer_name'](dev))
+
+        for (text,) in self.inputs['normalize_slug']:
+            self.assertRegex(f['normalize_slug'](text), r'^[a-z0-9-]+$')
+
+    def test_compare_flags_relative_regressions(self):
+        baselines = {'cases': {'a': {'relative': 1.0}, 'b': {'relative': 1.0}}}
+        report = {'cases': {'a': {'relative': 1.4}, 'b': {'relative': 2.0}, 'c': {'relative': 9.0}}}
+        self.assertEqual(transform_bench.compare(report, baselines, threshold=0.5), [('b', 1.0, 2.0, 2.0)])
+
+    @unittest.skipUnless(os.getenv('IT_NEXUS_BENCH') == '1', "吞吐量量測需設定 IT_NEXUS_BENCH=1")
+    def test_throughput_within_baseline(self):
+        threshold = self.baselines.get('threshold', transform_bench.DEFAULT_THRESHOLD)
+        _, regressions = transform_bench.check(self.baselines, threshold)
+        self.assertEqual(regressions, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
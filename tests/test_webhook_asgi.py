@@ -0,0 +1,87 @@
+import os
+import json
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+_TMP = tempfile.TemporaryDirectory()
+os.environ.setdefault('EVENT_STORE_DB', os.path.join(_TMP.name, 'events.db'))
+
+with patch('utils.setup_logging', return_value=MagicMock()):
+    from scripts.webhook_asgi import WebhookApp, receiver
+
+
+async def call(app, method, path, body=b''):
+    """以 ASGI 介面送出一個請求，回傳 (status, headers, json)。"""
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'method': method, 'path': path}, receive, send)
+    start, data = sent[0], sent[1]
+    return start['status'], dict(start['headers']), json.loads(data['body'])
+
+
+class TestWebhookAsgi(unittest.TestCase):
+
+    def setUp(self):
+        self.app = WebhookApp(max_inflight=1, executor_threads=2, start_background=False)
+        self.release = threading.Event()
+
+        def slow_accept(data):
+            self.release.wait(5)
+            return {'status': 'accepted'}, 202
+
+        self.patcher = patch.object(receiver, 'accept_event', slow_accept)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.release.set()
+        self.patcher.stop()
+        self.app.executor.shutdown(wait=True)
+
+    def test_inflight_limit_rejects_and_health_still_answers(self):
+        async def scenario():
+            payload = json.dumps({'hostname': 'sw1'}).encode()
+            first = asyncio.ensure_future(call(self.app, 'POST', '/webhook', payload))
+            while self.app.inflight < 1:
+                await asyncio.sleep(0.01)
+
+            status, headers, body = await call(self.app, 'POST', '/webhook', payload)
+            self.assertEqual(status, 503)
+            self.assertEqual(headers[b'retry-after'], b'1')
+            self.assertEqual(body['status'], 'busy')
+
+            # 飽和時 /health 仍立即回應 (不經過上限與 Thread Pool)
+            status, _, health = await asyncio.wait_for(call(self.app, 'GET', '/health'), 1)
+            self.assertEqual(status, 200)
+            self.assertEqual((health['inflight'], health['rejected']), (1, 1))
+
+            self.release.set()
+            status, _, _ = await first
+            self.assertEqual(status, 202)
+            self.assertEqual(self.app.inflight, 0)
+
+        asyncio.run(scenario())
+
+    def test_oversized_and_invalid_payloads(self):
+        self.release.set()
+        self.app.max_body = 10
+
+        async def scenario():
+            self.assertEqual((await call(self.app, 'POST', '/webhook', b'x' * 11))[0], 413)
+            self.assertEqual((await call(self.app, 'POST', '/webhook', b'{bad'))[0], 400)
+            self.assertEqual(self.app.inflight, 0)
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()